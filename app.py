@@ -13,12 +13,31 @@ Requirement as above
 """
 
 # Import the json module to read and write JSON files
+import csv
 import json
-import pandas as pd
-from io import BytesIO
-from flask import Flask, request, jsonify, render_template, make_response
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from io import StringIO
+from flask import Flask, Response, g, request, jsonify, render_template
 from flask_cors import CORS
-from database import Database
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+from cache import ResponseCache
+from compression import negotiate
+from database import REPLICA_REFRESH_INTERVAL, ReadReplica
+from events import RESYNC, EventBroker, change_event
+from executor import DatabaseExecutor
+from importer import ARCHIVE_EXTENSIONS, EXCEL_EXTENSIONS, ImportStats, import_excel, import_files
+from jobs import ImportJobManager
+from logs import configure_logging, get_logger
+from metrics import HTTP_REQUEST_DURATION, REGISTRY, StatementTimer, observe_database_call
+from profiler import PROFILE_INTERVAL, folded, sample_stacks
+from serialization import (CONTACT_LAYOUTS, change_json, contact_json, duplicate_group_json, duplicate_match_json,
+                           encode_contacts, facets_json)
+from storage import open_storage
 from werkzeug.utils import secure_filename
 
 
@@ -26,10 +45,76 @@ from werkzeug.utils import secure_filename
 app = Flask(__name__)
 CORS(app)
 
+# Log through a background thread; CONTACTS_LOG_LEVEL=OFF silences the app
+configure_logging()
+logger = get_logger('app')
+
+# SQLite database file, relative to the working directory unless absolute
+DB_FILE = os.environ.get('CONTACTS_DB', 'contacts.db')
+
+# Storage backend: sqlite, or memory to keep contacts in memory only,
+# starting from a copy of DB_FILE
+STORAGE = os.environ.get('CONTACTS_STORAGE', 'sqlite')
+
+# Read replica of the sqlite backend: off, file (read-only mmap connections to DB_FILE) or memory
+# (an in-memory snapshot); a background thread checks for new commits every CONTACTS_REPLICA_REFRESH seconds
+REPLICA_MODE = os.environ.get('CONTACTS_REPLICA', 'off')
+REPLICA_REFRESH = float(os.environ.get('CONTACTS_REPLICA_REFRESH', REPLICA_REFRESH_INTERVAL))
+
+# Opt-in diagnostics: per-statement SQL timing in /metrics, and the sampling
+# profiler at /debug/profile
+SQL_TRACE = os.environ.get('CONTACTS_SQL_TRACE') == '1'
+PROFILING = os.environ.get('CONTACTS_PROFILING') == '1'
+PROFILE_MAX_SECONDS = 60
+
+# Default and maximum number of results returned by /contacts/search
+SEARCH_LIMIT = 100
+SEARCH_LIMIT_MAX = 1000
+
+# Maximum number of operations accepted by /contacts/batch
+BATCH_MAX_OPERATIONS = 50000
+
+# Query parameters that switch GET /contacts to paginated mode,
+# and the default and maximum page size
+PAGE_ARGS = ('limit', 'cursor', 'sort', 'order', 'category')
+PAGE_LIMIT = 50
+PAGE_LIMIT_MAX = 500
+
+# Default and maximum number of entries returned by /contacts/changes
+CHANGES_LIMIT = 500
+CHANGES_LIMIT_MAX = 5000
+
+# Default and maximum number of groups returned by /contacts/duplicates,
+# and the number of matches returned when checking a single contact
+DUPLICATES_LIMIT = 100
+DUPLICATES_LIMIT_MAX = 1000
+MATCHES_LIMIT = 10
+
+# Changes pushed to event stream clients one by one; larger bursts such as
+# imports are announced with a single resync event instead
+EVENT_PUBLISH_LIMIT = 500
+
+# Export columns with their Excel widths, rows read per database batch,
+# and the size of the chunks sent to the client
+EXPORT_COLUMNS = [
+    ('Starred', 10),
+    ('First Name', 15),
+    ('Last Name', 15),
+    ('Category', 15),
+    ('Institution', 30),
+    ('Phone Number', 20),
+    ('Email', 30),
+    ('Address', 40),
+]
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+
 
 # Define a class Contacts to store contacts information,
 # with name, phone number, email, address, institution and is_starred
 class Contacts:
+    __slots__ = ('first_name', 'last_name', 'category', 'phone_number', 'email', 'address', 'institution', 'is_starred')
+
     def __init__(self, first_name, last_name, category="", phone_number="", email="", address="", institution="", is_starred=False):
         self.first_name = first_name
         self.last_name = last_name
@@ -63,21 +148,60 @@ class Contacts:
 class AddressBook:
     # Initialize the AddressBook with database connection
     def __init__(self):
-        self.db = Database()
+        # Database calls run on one writer thread and a bounded pool of readers
+        storage = open_storage(STORAGE, DB_FILE, statement_timer=StatementTimer() if SQL_TRACE else None)
+        self.db = DatabaseExecutor(storage, observer=observe_database_call)
+        # Reads go to the replica if one is configured, writes always to self.db
+        self.reads = self.db
+        if STORAGE == 'sqlite' and REPLICA_MODE in ('file', 'memory'):
+            replica = ReadReplica(DB_FILE, statement_timer=StatementTimer() if SQL_TRACE else None,
+                                  in_memory=REPLICA_MODE == 'memory', refresh_interval=REPLICA_REFRESH)
+            self.reads = DatabaseExecutor(replica, readers=replica.pool_size, observer=observe_database_call)
+            logger.info("Reads are served from a %s replica of %s.", REPLICA_MODE, DB_FILE)
+        self.events = EventBroker()
+        self._published_seq = self.db.get_change_seq()
+        self._publish_lock = threading.Lock()
+        self.import_jobs = ImportJobManager(self.db, on_finished=lambda job: self.publish_changes())
+
+    # Version of the data reads see. A replica picks up commits in the
+    # background, so the writes of this process are counted as well and
+    # cached responses never outlive them
+    @property
+    def generation(self):
+        if self.reads is self.db:
+            return self.db.generation
+        return self.db.generation, self.reads.generation
 
-    # Add contact to the AddressBook
+    # Push the changes committed since the last broadcast to event stream clients
+    def publish_changes(self):
+        with self._publish_lock:
+            latest = self.db.get_change_seq()
+            if not self.events.has_subscribers or latest - self._published_seq > EVENT_PUBLISH_LIMIT:
+                if self.events.has_subscribers:
+                    self.events.publish(RESYNC)
+                self._published_seq = latest
+                return
+
+            changes, last_seq, has_more = self.db.get_changes(self._published_seq, EVENT_PUBLISH_LIMIT)
+            for change in changes:
+                self.events.publish(change_event(change))
+            self._published_seq = last_seq
+
+    # Add contact to the AddressBook, returning its id
     def add_contact(self, contact: Contacts):
-        if self.db.add_contact(contact.to_dict()):
-            print(f"Contact {contact.first_name} {contact.last_name} is added successfully.")
-            return True
+        contact_id = self.db.add_contact(contact.to_dict())
+        if contact_id:
+            logger.info("Contact %s %s is added successfully.", contact.first_name, contact.last_name)
+            self.publish_changes()
+            return contact_id
         else:
-            print(f"Error: Contact with name '{contact.first_name} {contact.last_name}' already exists.")
+            logger.warning("Contact with name '%s %s' already exists.", contact.first_name, contact.last_name)
             return False
 
     # find contact in the AddressBook by name
     def find_contact_in_list(self, contacts, first_name: str, last_name: str):
         for i, contact in enumerate(contacts):
-            if Acontact['first_name'] == first_name and contact['last_name'] == last_name:
+            if contact.first_name == first_name and contact.last_name == last_name:
                 return i
         return -1
 
@@ -85,63 +209,315 @@ class AddressBook:
     def modify_contact(self, old_first_name: str, old_last_name: str, contact: Contacts):
         if self.db.update_contact(old_first_name, old_last_name, contact.to_dict()):
             if contact.first_name != old_first_name or contact.last_name != old_last_name:
-                print(f"Contact '{old_first_name} {old_last_name}' has been renamed to '{contact.first_name} {contact.last_name}' successfully.")
+                logger.info("Contact '%s %s' has been renamed to '%s %s' successfully.",
+                            old_first_name, old_last_name, contact.first_name, contact.last_name)
             else:
-                print(f"Contact '{old_first_name} {old_last_name}' is modified successfully.")
+                logger.info("Contact '%s %s' is modified successfully.", old_first_name, old_last_name)
+            self.publish_changes()
+            return True
+        else:
+            logger.info("Contact %s %s is not found.", old_first_name, old_last_name)
+            return False
+
+    # Modify contact in the AddressBook by id
+    def modify_contact_by_id(self, contact_id: int, contact: Contacts):
+        if self.db.update_contact_by_id(contact_id, contact.to_dict()):
+            logger.info("Contact %d is modified successfully.", contact_id)
+            self.publish_changes()
             return True
         else:
-            print(f"Contact {old_first_name} {old_last_name} is not found.")
+            logger.info("Contact %d is not found.", contact_id)
+            return False
+
+    # Delete contact in the AddressBook by id
+    def delete_contact_by_id(self, contact_id: int):
+        if self.db.delete_contact_by_id(contact_id):
+            logger.info("Contact %d is deleted successfully.", contact_id)
+            self.publish_changes()
+            return True
+        else:
+            logger.info("Contact %d is not found.", contact_id)
             return False
 
     # Delete contact in the AddressBook
     def delete_contact(self, first_name: str, last_name: str):
         if self.db.delete_contact(first_name, last_name):
-            print(f"Contact {first_name} {last_name} is deleted successfully.")
+            logger.info("Contact %s %s is deleted successfully.", first_name, last_name)
+            self.publish_changes()
             return True
         else:
-            print(f"Contact {first_name} {last_name} is not found.")
+            logger.info("Contact %s %s is not found.", first_name, last_name)
             return False
 
+    # Load one contact by id
+    def get_contact(self, contact_id: int):
+        return self.reads.get_contact(contact_id)
+
     # Load all contacts from the AddressBook
     def load_contacts(self):
-        contacts = self.db.get_all_contacts()
-        print(f"{len(contacts)} contacts loaded successfully.")
+        contacts = self.reads.get_all_contacts()
+        logger.debug("%d contacts loaded successfully.", len(contacts))
         return contacts
     
+    # Load one page of contacts, sorted and optionally filtered by category
+    def load_contacts_page(self, limit: int, cursor=None, sort='starred', order='asc', category=None):
+        contacts, next_cursor = self.reads.get_contacts_page(limit, cursor, sort, order, category)
+        logger.debug("%d contacts loaded successfully.", len(contacts))
+        return contacts, next_cursor
+
+    # Count contacts per category and how many of them are starred
+    def load_facets(self):
+        return self.reads.get_facets()
+
+    # Load the changes made after a change sequence number
+    def load_changes(self, since: int, limit: int):
+        changes, last_seq, has_more = self.reads.get_changes(since, limit)
+        logger.debug("%d contact changes since %d loaded successfully.", len(changes), since)
+        return changes, last_seq, has_more
+
+    # Import contacts from an Excel file in one transaction, optionally
+    # merging rows that match an existing contact into it
+    def import_contacts(self, file, filename: str, merge=False):
+        stats = import_excel(self.db, file, filename, merge=merge)
+        logger.info("%d contacts imported, %d merged, %d duplicates and %d invalid rows skipped.",
+                    stats.imported, stats.merged, stats.duplicates, stats.invalid)
+        self.publish_changes()
+        return stats
+
+    # Import every sheet of several Excel files or zip archives, parsing
+    # the sheets in worker processes and committing them in large batches
+    def import_files(self, files, merge=False):
+        stats = ImportStats()
+        with tempfile.TemporaryDirectory(prefix='contacts-upload-') as directory:
+            sources = []
+            for index, file in enumerate(files):
+                path = os.path.join(directory, f"{index}{os.path.splitext(file.filename)[1].lower()}")
+                file.save(path)
+                sources.append((file.filename, path))
+            import_files(self.db, sources, stats, merge=merge)
+        logger.info("%d contacts imported from %d files, %d merged, %d duplicates and %d invalid rows skipped.",
+                    stats.imported, len(stats.files), stats.merged, stats.duplicates, stats.invalid)
+        self.publish_changes()
+        return stats
+
+    # Queue an Excel import to run in the background
+    def start_import_job(self, files, merge=False):
+        job = self.import_jobs.submit_files([(file, file.filename) for file in files], merge)
+        logger.info("Import job %s for %s is queued.", job.id, job.filename)
+        return job
+
+    # Iterate over all contacts in batches, for streaming exports
+    def iter_contact_batches(self, batch_size: int):
+        return self.reads.iter_contact_batches(batch_size)
+
     # Toggle starred status of a contact
     def toggle_starred(self, first_name: str, last_name: str):
         if self.db.toggle_starred(first_name, last_name):
-            print(f"Contact {first_name} {last_name} starred status toggled successfully.")
+            logger.info("Contact %s %s starred status toggled successfully.", first_name, last_name)
+            self.publish_changes()
             return True
         else:
-            print(f"Contact {first_name} {last_name} not found.")
+            logger.info("Contact %s %s not found.", first_name, last_name)
             return False
 
+    # Toggle starred status of a contact by id, returning the new status
+    def toggle_starred_by_id(self, contact_id: int):
+        is_starred = self.db.toggle_starred_by_id(contact_id)
+        if is_starred is not None:
+            logger.info("Contact %d starred status toggled successfully.", contact_id)
+            self.publish_changes()
+        else:
+            logger.info("Contact %d not found.", contact_id)
+        return is_starred
+
+    # Apply a batch of mixed operations in one transaction
+    def apply_batch(self, operations: list):
+        results = self.db.apply_batch(operations)
+        applied = sum(1 for result in results if result['status'] == 'ok')
+        logger.info("%d of %d batch operations applied successfully.", applied, len(operations))
+        if applied:
+            self.publish_changes()
+        return results
+
+    # Find groups of suspected duplicate contacts
+    def find_duplicates(self, limit: int):
+        groups, total = self.reads.find_duplicates(limit)
+        logger.debug("%d groups of duplicate contacts found.", total)
+        return groups, total
+
+    # Find existing contacts that a new contact would duplicate
+    def find_matches(self, contact_data: dict, limit: int):
+        return self.reads.find_matches(contact_data, limit)
+
+    # Search contacts in the AddressBook by keyword
+    def search_contacts(self, search_term: str, limit=None):
+        contacts = self.reads.search_contacts(search_term, limit)
+        logger.debug("%d contacts matched '%s'.", len(contacts), search_term)
+        return contacts
+
 # Create a global AddressBook instance
 address_book = AddressBook()
 
+# Cache of serialised listing and search responses, invalidated by writes
+response_cache = ResponseCache()
+
+# Gauges read from the cache, connection pool, database threads, event
+# stream and import jobs when /metrics is scraped
+def register_gauges(registry):
+    def stat(source, key):
+        return lambda: [((), source()[key])]
+
+    def import_jobs():
+        counts = {}
+        for job in address_book.import_jobs.list():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return [((status,), count) for status, count in counts.items()]
+
+    for key, kind in (('entries', 'gauge'), ('bytes', 'gauge'), ('hits', 'counter'),
+                      ('misses', 'counter'), ('evictions', 'counter')):
+        name = f"contacts_response_cache_{key}" + ('_total' if kind == 'counter' else '')
+        registry.callback(name, f"Response cache {key}", (), stat(response_cache.stats, key), kind)
+
+    if STORAGE == 'sqlite':
+        pool_stats = address_book.db.pool_stats
+        registry.callback('contacts_db_pool_connections', 'Database connections by state', ('state',),
+                          lambda: [((state,), pool_stats()[state]) for state in ('in_use', 'idle', 'created', 'max_size')])
+        registry.callback('contacts_db_pool_checkouts_total', 'Connections borrowed from the pool', (),
+                          stat(pool_stats, 'checkouts'), 'counter')
+        registry.callback('contacts_db_pool_waits_total', 'Borrows that had to wait for a free connection', (),
+                          stat(pool_stats, 'waits'), 'counter')
+
+    executor_stats = address_book.db.stats
+    registry.callback('contacts_db_executor_pending', 'Database calls waiting or running', ('kind',),
+                      lambda: [((kind,), executor_stats()[f"pending_{kind}s"]) for kind in ('read', 'write')])
+    registry.callback('contacts_db_generation', 'Writes committed since startup', (),
+                      lambda: [((), address_book.db.generation)])
+    if address_book.reads is not address_book.db:
+        registry.callback('contacts_db_replica_refreshes_total', 'Changes picked up by the read replica', (),
+                          stat(address_book.reads.pool_stats, 'refreshes'), 'counter')
+
+    event_stats = address_book.events.stats
+    registry.callback('contacts_event_subscribers', 'Connected event stream clients', (),
+                      stat(event_stats, 'subscribers'))
+    registry.callback('contacts_events_published_total', 'Events published to the event stream', (),
+                      stat(event_stats, 'published'), 'counter')
+    registry.callback('contacts_events_dropped_total', 'Events dropped for slow clients of the current subscribers', (),
+                      stat(event_stats, 'dropped'), 'counter')
+    registry.callback('contacts_import_jobs', 'Known import jobs by status', ('status',), import_jobs)
+
+register_gauges(REGISTRY)
+
+# Time every request, labelled by its route pattern rather than the raw path
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - started,
+                                      (request.method, route, str(response.status_code)))
+    return response
+
+# Metrics in the Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# Sample the stacks of all threads for a few seconds and return them in the
+# folded format used by flame graph tools. Disabled unless CONTACTS_PROFILING=1.
+@app.route('/debug/profile', methods=['GET'])
+def profile():
+    if not PROFILING:
+        return jsonify({'error': 'Profiling is disabled, set CONTACTS_PROFILING=1 to enable it'}), 404
+    seconds = min(max(request.args.get('seconds', 5, type=float), 0.1), PROFILE_MAX_SECONDS)
+    interval = max(request.args.get('interval', PROFILE_INTERVAL * 1000, type=float), 1) / 1000
+    return Response(folded(sample_stacks(seconds, interval)), mimetype='text/plain')
+
+# Serve a JSON response from the cache, building its text or bytes with
+# render() on a miss. Entries are tied to the generation of the database reads
+# come from, so any write (or replica refresh) invalidates them, and a matching
+# If-None-Match header is answered with 304 Not Modified. The body is
+# compressed as the client's Accept-Encoding allows, once per cache entry.
+def cached_json_response(key, render):
+    generation = address_book.generation
+    entry = response_cache.get(key, generation)
+    if entry is None:
+        body = render()
+        entry = response_cache.put(key, generation, body.encode('utf-8') if isinstance(body, str) else body)
+
+    encoding = negotiate(request.accept_encodings, len(entry.body))
+    etag = entry.etag if encoding is None else f"{entry.etag}-{encoding}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif encoding is None:
+        response = Response(entry.body, mimetype='application/json')
+    else:
+        response = Response(response_cache.compressed(key, entry, encoding), mimetype='application/json')
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+# Layout of a contact list response from the format query parameter:
+# objects (the default) or columns
+def contact_layout():
+    layout = request.args.get('format', 'objects')
+    if layout not in CONTACT_LAYOUTS:
+        raise ValueError(f"Invalid format '{layout}', expected one of {', '.join(CONTACT_LAYOUTS)}")
+    return layout
+
+# Cache key of the current request: the route and its query parameters
+def request_cache_key():
+    return (request.path, tuple(sorted(request.args.items(multi=True))))
+
 @app.route("/contacts", methods=["GET"])
 def get_contacts():
-    contacts = address_book.load_contacts()
-    return jsonify(contacts)
+    try:
+        layout = contact_layout()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Without any paging parameter return the whole list, as the web UI expects
+    if not any(arg in request.args for arg in PAGE_ARGS):
+        return cached_json_response(request_cache_key(), lambda: encode_contacts(address_book.load_contacts(), layout))
+
+    limit = request.args.get('limit', PAGE_LIMIT, type=int)
+    sort = request.args.get('sort', 'starred')
+    order = request.args.get('order', 'asc')
+    cursor = request.args.get('cursor') or None
+    category = request.args.get('category')
+
+    def load_page():
+        contacts, next_cursor = address_book.load_contacts_page(
+            min(max(limit, 1), PAGE_LIMIT_MAX), cursor=cursor, sort=sort, order=order, category=category)
+        return encode_contacts(contacts, layout, next_cursor=next_cursor)
+
+    try:
+        return cached_json_response(request_cache_key(), load_page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+# Build a Contacts object from a JSON request body
+def contact_from_json(data):
+    return Contacts(data['first_name'], data['last_name'], data.get('category', ''),
+                    data.get('phone_number', ''), data.get('email', ''), data.get('address', ''),
+                    data.get('institution', ''), bool(data.get('is_starred')))
 
 @app.route('/contacts', methods=['POST'])
 def add_contact():
-    data = request.json
-    contact = Contacts(data['first_name'], data['last_name'], data.get('category', ''),
-                      data.get('phone_number', ''), data.get('email', ''), data.get('address', ''),
-                      data.get('institution', ''), data.get('is_starred', False))
-    if address_book.add_contact(contact):
-        return jsonify({'message': f'Contact {contact.first_name} {contact.last_name} added successfully'}), 201
+    contact = contact_from_json(request.json)
+    contact_id = address_book.add_contact(contact)
+    if contact_id:
+        return jsonify({'message': f'Contact {contact.first_name} {contact.last_name} added successfully', 'id': contact_id}), 201
     else:
         return jsonify({'error': f'Contact with name {contact.first_name} {contact.last_name} already exists'}), 400
 
 @app.route('/contacts/<first_name>/<last_name>', methods=['PUT'])
 def update_contact(first_name, last_name):
-    data = request.json
-    contact = Contacts(data['first_name'], data['last_name'], data.get('category', ''),
-                      data.get('phone_number', ''), data.get('email', ''), data.get('address', ''),
-                      data.get('institution', ''), data.get('is_starred', False))
+    contact = contact_from_json(request.json)
     if address_book.modify_contact(first_name, last_name, contact):
         return jsonify({'message': f'Contact {first_name} {last_name} updated successfully'})
     else:
@@ -154,6 +530,155 @@ def delete_contact(first_name, last_name):
     else:
         return jsonify({'error': f'Contact {first_name} {last_name} not found'}), 404
 
+# Get a contact by id
+@app.route('/contacts/<int:contact_id>', methods=['GET'])
+def get_contact(contact_id):
+    contact = address_book.get_contact(contact_id)
+    if contact is None:
+        return jsonify({'error': f'Contact {contact_id} not found'}), 404
+    return Response(contact_json(contact), mimetype='application/json')
+
+# Update a contact by id
+@app.route('/contacts/<int:contact_id>', methods=['PUT'])
+def update_contact_by_id(contact_id):
+    contact = contact_from_json(request.json)
+    try:
+        updated = address_book.modify_contact_by_id(contact_id, contact)
+    except sqlite3.IntegrityError:
+        return jsonify({'error': f'Contact with name {contact.first_name} {contact.last_name} already exists'}), 409
+    if updated:
+        return jsonify({'message': f'Contact {contact_id} updated successfully'})
+    else:
+        return jsonify({'error': f'Contact {contact_id} not found'}), 404
+
+# Delete a contact by id
+@app.route('/contacts/<int:contact_id>', methods=['DELETE'])
+def delete_contact_by_id(contact_id):
+    if address_book.delete_contact_by_id(contact_id):
+        return jsonify({'message': f'Contact {contact_id} deleted successfully'})
+    else:
+        return jsonify({'error': f'Contact {contact_id} not found'}), 404
+
+# Toggle the starred status of a contact by id
+@app.route('/contacts/<int:contact_id>/star', methods=['PUT'])
+def toggle_star_by_id(contact_id):
+    is_starred = address_book.toggle_starred_by_id(contact_id)
+    if is_starred is None:
+        return jsonify({'error': f'Contact {contact_id} not found'}), 404
+    return jsonify({'id': contact_id, 'is_starred': is_starred})
+
+# Apply a list of add, update, delete and star operations in one transaction
+@app.route('/contacts/batch', methods=['POST'])
+def batch_contacts():
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else data
+    if not isinstance(operations, list):
+        return jsonify({'error': 'Request body must be a list of operations or {"operations": [...]}'}), 400
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return jsonify({'error': f'A batch can contain at most {BATCH_MAX_OPERATIONS} operations'}), 400
+
+    results = address_book.apply_batch(operations)
+    summary = {status: 0 for status in ('ok', 'not_found', 'conflict', 'invalid')}
+    for result in results:
+        summary[result['status']] += 1
+    return jsonify({'results': results, 'summary': summary})
+
+# Contact counts per category and starred counts, for the sidebar, read from
+# a summary table the database keeps up to date on every write
+@app.route('/contacts/facets', methods=['GET'])
+def get_facets():
+    return cached_json_response(request_cache_key(), lambda: facets_json(address_book.load_facets()))
+
+# Changes since a sequence number, for clients that sync deltas instead of
+# reloading the whole list. Without since only the current sequence is
+# returned, which a client reads before its first full load.
+@app.route('/contacts/changes', methods=['GET'])
+def get_changes():
+    since = request.args.get('since', type=int)
+    if since is None:
+        if 'since' in request.args:
+            return jsonify({'error': 'since must be an integer'}), 400
+        return jsonify({'changes': [], 'last_seq': address_book.reads.get_change_seq(), 'has_more': False})
+
+    limit = min(max(request.args.get('limit', CHANGES_LIMIT, type=int), 1), CHANGES_LIMIT_MAX)
+    changes, last_seq, has_more = address_book.load_changes(max(since, 0), limit)
+    body = '{"changes":[%s],"has_more":%s,"last_seq":%d}' % (
+        ','.join(map(change_json, changes)), 'true' if has_more else 'false', last_seq)
+    return Response(body, mimetype='application/json')
+
+# Events a client reconnecting with Last-Event-ID missed, and the change
+# sequence they cover. Too many missed changes are replaced by one resync.
+def missed_events(last_event_id):
+    if last_event_id is None:
+        return [], 0
+    changes, last_seq, has_more = address_book.db.get_changes(last_event_id, EVENT_PUBLISH_LIMIT)
+    if has_more:
+        return [RESYNC], 0
+    return [change_event(change) for change in changes], last_seq
+
+# Stream contact changes to the browser as Server-Sent Events. Each event
+# carries one changed contact or a tombstone, with its change sequence as
+# the event id, so a reconnecting client sending Last-Event-ID first gets
+# the changes it missed. Clients that fall behind receive a resync event
+# and catch up through /contacts/changes.
+@app.route('/contacts/events', methods=['GET'])
+def contact_events():
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+
+    def stream():
+        subscription = address_book.events.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            missed, replayed = missed_events(last_event_id)
+            for event in missed:
+                yield event.encode()
+            while True:
+                event = subscription.get()
+                if event is None:
+                    yield ": keep-alive\n\n"
+                elif event.id is None or event.id > replayed:
+                    yield event.encode()
+        finally:
+            address_book.events.unsubscribe(subscription)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Suspected duplicates, grouped, from matching phone numbers and emails after
+# normalisation and from similar names. With first_name and last_name (and
+# optionally phone_number and email) the existing contacts a new contact
+# would duplicate are returned instead, for checking before an add.
+@app.route('/contacts/duplicates', methods=['GET'])
+def get_duplicates():
+    if 'first_name' in request.args or 'last_name' in request.args:
+        contact_data = {field: request.args.get(field, '') for field in ('first_name', 'last_name', 'phone_number', 'email')}
+        limit = min(max(request.args.get('limit', MATCHES_LIMIT, type=int), 1), DUPLICATES_LIMIT_MAX)
+        matches = address_book.find_matches(contact_data, limit)
+        return Response('{"matches":[%s]}' % ','.join(map(duplicate_match_json, matches)), mimetype='application/json')
+
+    limit = min(max(request.args.get('limit', DUPLICATES_LIMIT, type=int), 1), DUPLICATES_LIMIT_MAX)
+
+    def render():
+        groups, total = address_book.find_duplicates(limit)
+        return '{"groups":[%s],"total":%d}' % (','.join(map(duplicate_group_json, groups)), total)
+
+    return cached_json_response(('duplicates', limit), render)
+
+# Search contacts by keyword (search-as-you-type)
+@app.route('/contacts/search', methods=['GET'])
+def search_contacts():
+    query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', SEARCH_LIMIT, type=int)
+    try:
+        layout = contact_layout()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not query:
+        return Response(encode_contacts([], layout), mimetype='application/json')
+    limit = min(max(limit, 1), SEARCH_LIMIT_MAX)
+    return cached_json_response(('search', query, limit, layout),
+                                lambda: encode_contacts(address_book.search_contacts(query, limit), layout))
+
 # Toggle contact starred status
 @app.route('/contacts/<first_name>/<last_name>/star', methods=['PUT'])
 def toggle_star(first_name, last_name):
@@ -162,54 +687,75 @@ def toggle_star(first_name, last_name):
     else:
         return jsonify({'error': f'Contact {first_name} {last_name} not found'}), 404
 
-# Export contacts to Excel
+# Export contacts as a streamed Excel, CSV or NDJSON download
 @app.route('/contacts/export', methods=['GET'])
 def export_contacts():
-    contacts = address_book.load_contacts()
-    
-    # Convert contacts to a more readable format for Excel
-    export_data = []
-    for contact in contacts:
-        export_data.append({
-            'Starred': '★' if contact['is_starred'] else '',
-            'First Name': contact['first_name'],
-            'Last Name': contact['last_name'],
-            'Category': contact['category'],
-            'Institution': contact['institution'],
-            'Phone Number': contact['phone_number'],
-            'Email': contact['email'],
-            'Address': contact['address']
-        })
-    
-    # Create a DataFrame and Excel writer
-    df = pd.DataFrame(export_data)
-    output = BytesIO()
-    
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Contact List')
-        
-        # Get the xlsxwriter worksheet object
-        worksheet = writer.sheets['Contact List']
-        
-        # Adjust column widths
-        worksheet.column_dimensions['A'].width = 10
-        worksheet.column_dimensions['B'].width = 15  # First Name
-        worksheet.column_dimensions['C'].width = 15  # Last Name
-        worksheet.column_dimensions['D'].width = 15  # Category
-        worksheet.column_dimensions['E'].width = 30  # Institution
-        worksheet.column_dimensions['F'].width = 20  # Phone Number
-        worksheet.column_dimensions['G'].width = 30  # Email
-        worksheet.column_dimensions['H'].width = 40  # Address
-    
-    output.seek(0)
-    
-    # Create response
-    response = make_response(output.getvalue())
-    response.headers["Content-Disposition"] = "attachment; filename=contacts_export.xlsx"
-    response.headers["Content-type"] = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    
+    export_format = request.args.get('format', 'xlsx').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unsupported export format '{export_format}', expected one of {', '.join(EXPORT_FORMATS)}"}), 400
+
+    mimetype, writer = EXPORT_FORMATS[export_format]
+    batches = address_book.iter_contact_batches(EXPORT_BATCH_SIZE)
+    response = Response(writer(batches), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename=contacts_export.{export_format}"
     return response
 
+# Convert a contact to one export row, in EXPORT_COLUMNS order
+def export_row(contact):
+    return ['★' if contact.is_starred else '', contact.first_name, contact.last_name,
+            contact.category, contact.institution, contact.phone_number,
+            contact.email, contact.address]
+
+# Stream contacts as CSV, one chunk per database batch
+def write_csv(batches):
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    # UTF-8 BOM so that Excel detects the encoding of the star column
+    buffer.write('\ufeff')
+    writer.writerow([title for title, _ in EXPORT_COLUMNS])
+    for batch in batches:
+        writer.writerows(export_row(contact) for contact in batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+# Stream contacts as newline-delimited JSON, one chunk per database batch
+def write_ndjson(batches):
+    for batch in batches:
+        yield ''.join(contact_json(contact) + '\n' for contact in batch).encode('utf-8')
+
+# Write contacts through openpyxl's write-only mode into a temporary file and
+# stream it back. An xlsx file is a zip archive that can only be finished once
+# all rows are written, but rows are flushed to disk as they are appended, so
+# memory stays flat regardless of the number of contacts.
+def write_xlsx(batches):
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Contact List')
+    for index, (title, width) in enumerate(EXPORT_COLUMNS):
+        worksheet.column_dimensions[get_column_letter(index + 1)].width = width
+    worksheet.append([title for title, _ in EXPORT_COLUMNS])
+    for batch in batches:
+        for contact in batch:
+            worksheet.append(export_row(contact))
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(EXPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+# Export formats: mimetype and writer generator
+EXPORT_FORMATS = {
+    'xlsx': ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", write_xlsx),
+    'csv': ("text/csv; charset=utf-8", write_csv),
+    'ndjson': ("application/x-ndjson", write_ndjson),
+}
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -217,108 +763,87 @@ def index():
 # Main function to run the Flask app
 @app.route('/contacts/import', methods=['POST'])
 def import_contacts():
-    # 检查请求中是否包含文件
+    # 检查请求中是否包含文件（可以上传多个文件）
     if 'file' not in request.files:
         return jsonify({'success': False, 'error': 'No file part in the request'}), 400
     
-    file = request.files['file']
+    files = request.files.getlist('file')
     
     # 检查文件是否为空
-    if file.filename == '':
+    if any(file.filename == '' for file in files):
         return jsonify({'success': False, 'error': 'No file selected for uploading'}), 400
     
-    # 检查文件类型（同时支持 .xlsx 和 .xls 格式）
-    if not (file.filename.endswith('.xlsx') or file.filename.endswith('.xls')):
-        return jsonify({'success': False, 'error': 'Only Excel files (.xlsx or .xls) are allowed'}), 400
+    # 检查文件类型（支持 .xlsx、.xls 格式以及包含它们的 .zip 压缩包）
+    if not all(file.filename.lower().endswith(EXCEL_EXTENSIONS + ARCHIVE_EXTENSIONS) for file in files):
+        return jsonify({'success': False, 'error': 'Only Excel files (.xlsx or .xls) or zip archives of them are allowed'}), 400
     
+    # 合并模式：与已有联系人同名，或电话、邮箱相同且姓名相近的行只补全已有联系人
+    merge = request.values.get('merge', '').lower() in ('1', 'true', 'yes')
+
+    # 异步模式：保存文件后立即返回任务ID，由后台线程导入
+    if request.values.get('async', '').lower() in ('1', 'true', 'yes'):
+        job = address_book.start_import_job(files, merge)
+        return jsonify({'success': True, 'job_id': job.id, 'status': job.status}), 202
+
+    # 单个表格在一个事务中导入；多个文件或压缩包的所有工作表由多个进程并行解析
+    single = len(files) == 1 and not files[0].filename.lower().endswith(ARCHIVE_EXTENSIONS)
     try:
-        # 读取Excel文件，不将第一行作为标题行
-        df = pd.read_excel(file, header=None)
-        
-        # 验证表格列数是否正确
-        if df.shape[1] != 8:
-            return jsonify({'success': False, 'error': f'Excel file must have exactly 8 columns, but found {df.shape[1]} columns'}), 400
-        
-        contacts_data = []
-        invalid_count = 0
-        
-        # 遍历每一行数据
-        for index, row in df.iterrows():
-            try:
-                # 解析星标状态（第一列）
-                is_starred = 1 if row[0] == '★' else 0
-                
-                # 构建联系人数据
-                contact_data = {
-                    'first_name': str(row[1]) if pd.notna(row[1]) else '',
-                    'last_name': str(row[2]) if pd.notna(row[2]) else '',
-                    'category': str(row[3]) if pd.notna(row[3]) else '',
-                    'institution': str(row[4]) if pd.notna(row[4]) else '',
-                    'phone_number': str(row[5]) if pd.notna(row[5]) else '',
-                    'email': str(row[6]) if pd.notna(row[6]) else '',
-                    'address': str(row[7]) if pd.notna(row[7]) else '',
-                    'is_starred': is_starred
-                }
-                
-                # 验证联系人数据的基本完整性
-                if not (contact_data['first_name'] or contact_data['last_name']):
-                    invalid_count += 1
-                    continue
-                
-                contacts_data.append(contact_data)
-            except Exception as e:
-                invalid_count += 1
-                continue
-        
-        # 使用批量添加方法导入联系人
-        if contacts_data:
-            # 检查bulk_add_contacts方法是否存在
-            if hasattr(address_book.db, 'bulk_add_contacts'):
-                added_count, duplicate_contacts = address_book.db.bulk_add_contacts(contacts_data)
-            else:
-                # 如果bulk_add_contacts方法不存在，使用逐个添加的方式
-                added_count = 0
-                duplicate_contacts = []
-                
-                for contact_data in contacts_data:
-                    contact = Contacts(
-                        contact_data['first_name'], 
-                        contact_data['last_name'], 
-                        contact_data['category'],
-                        contact_data['phone_number'],
-                        contact_data['email'],
-                        contact_data['address'],
-                        contact_data['institution'],
-                        contact_data['is_starred']
-                    )
-                    
-                    if address_book.add_contact(contact):
-                        added_count += 1
-                    else:
-                        duplicate_contacts.append(f"{contact_data['first_name']} {contact_data['last_name']}")
-            
-            # 返回与前端期望匹配的响应格式
-            return jsonify({
-                'success': True,
-                'imported': added_count,
-                'duplicates': len(duplicate_contacts),
-                'invalid': invalid_count
-            }), 200
+        if single:
+            stats = address_book.import_contacts(files[0], files[0].filename, merge)
         else:
-            return jsonify({
-                'success': False,
-                'error': 'No valid contacts found in the Excel file'
-            }), 400
-            
+            stats = address_book.import_files(files, merge)
+    except ValueError as e:
+        # 表格列数不正确
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         # 记录详细错误信息以便调试
-        print(f"Import error: {str(e)}")
+        logger.exception("Import error")
         return jsonify({
             'success': False,
             'error': f'Error processing Excel file: {str(e)}'
         }), 500
 
+    if stats.parsed - stats.invalid == 0:
+        errors = [f"{file_stats.filename}: {error}" for file_stats in stats.files for error in file_stats.errors]
+        return jsonify({
+            'success': False,
+            'error': '; '.join(errors) or 'No valid contacts found in the Excel file'
+        }), 400
+
+    # 返回与前端期望匹配的响应格式；多个文件时附带每个文件的统计
+    result = {
+        'success': True,
+        'imported': stats.imported,
+        'merged': stats.merged,
+        'duplicates': stats.duplicates,
+        'invalid': stats.invalid
+    }
+    if not single:
+        result['files'] = [file_stats.to_dict() for file_stats in stats.files]
+    return jsonify(result), 200
+
+# Report the progress or final result of a background import
+@app.route('/contacts/import/jobs/<job_id>', methods=['GET'])
+def get_import_job(job_id):
+    job = address_book.import_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Import job {job_id} not found'}), 404
+    return jsonify(job.to_dict())
+
+# List the background imports that are running or recently finished
+@app.route('/contacts/import/jobs', methods=['GET'])
+def list_import_jobs():
+    return jsonify([job.to_dict() for job in address_book.import_jobs.list()])
+
+# Cancel a background import
+@app.route('/contacts/import/jobs/<job_id>', methods=['DELETE'])
+def cancel_import_job(job_id):
+    job = address_book.import_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': f'Import job {job_id} not found'}), 404
+    return jsonify(job.to_dict())
 
+# Development server; see asgi.py for running under an ASGI server
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=5000, debug=False)
     # app.run(debug=True)
\ No newline at end of file
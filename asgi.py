@@ -0,0 +1,224 @@
+"""
+ASGI entry point of the contacts app.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+The ASGI server keeps client connections on its event loop, so idle
+keep-alive clients cost no thread. Flask routes run on a bounded pool of
+request threads through a small WSGI adapter built on asgiref's public
+sync_to_async and async_to_sync, and their Database calls are queued on the
+DatabaseExecutor's writer and reader threads. The event stream is served
+natively on the event loop: a subscriber waiting for the next change is a
+suspended coroutine, not a blocked thread.
+"""
+
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from asgiref.sync import async_to_sync, sync_to_async
+
+from app import address_book, app, missed_events
+from events import EVENT_KEEPALIVE
+
+
+# Threads running Flask requests. Requests mostly wait on the database
+# executor, so this can be much larger than the number of database threads.
+REQUEST_WORKERS = 64
+
+request_executor = ThreadPoolExecutor(max_workers=REQUEST_WORKERS, thread_name_prefix='asgi-request')
+
+
+# Request bodies larger than this are spooled to a temporary file
+REQUEST_BODY_SPOOL = 64 * 1024
+
+
+def wsgi_environ(scope, body):
+    """
+    Build the WSGI environ of an ASGI HTTP scope.
+
+    Args:
+        scope (dict): ASGI HTTP connection scope
+        body (file): Request body, positioned at its start
+
+    Returns:
+        dict: WSGI environ
+    """
+    script_name = scope.get('root_path', '').encode('utf-8').decode('latin-1')
+    path_info = scope['path'].encode('utf-8').decode('latin-1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # The whole body has been read, so chunked uploads without a
+        # Content-Length can be read to the end
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+            name = f"HTTP_{name}"
+        value = value.decode('latin-1')
+        # Repeated headers are joined as in a single comma-separated header
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def run_wsgi_request(environ, send):
+    """
+    Run one request through the Flask app on a request thread, passing the
+    response to the ASGI server as it is produced.
+
+    Args:
+        environ (dict): WSGI environ
+        send (callable): Synchronous wrapper of the ASGI send callable
+    """
+    response_start = {}
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and response_start.get('sent'):
+            raise exc_info[1].with_traceback(exc_info[2])
+        response_start.update(status=int(status.split(' ', 1)[0]),
+                              headers=[(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                       for name, value in headers])
+
+    def send_start():
+        if not response_start.get('sent'):
+            response_start['sent'] = True
+            send({'type': 'http.response.start', 'status': response_start['status'],
+                  'headers': response_start['headers']})
+
+    result = app(environ, start_response)
+    try:
+        for chunk in result:
+            if chunk:
+                send_start()
+                send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        send_start()
+        send({'type': 'http.response.body'})
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+# asgiref's own WsgiToAsgi runs WSGI apps thread-sensitively, i.e. one
+# request at a time; these run on the request pool instead
+run_wsgi_request_async = sync_to_async(run_wsgi_request, thread_sensitive=False, executor=request_executor)
+
+
+async def wsgi_application(scope, receive, send):
+    """
+    Serve an HTTP request with the Flask app.
+    """
+    with SpooledTemporaryFile(max_size=REQUEST_BODY_SPOOL) as body:
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+        await run_wsgi_request_async(wsgi_environ(scope, body), async_to_sync(send))
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def contact_events(scope, receive, send):
+    """
+    Native ASGI version of GET /contacts/events.
+    """
+    last_event_id = None
+    for name, value in scope['headers']:
+        if name == b'last-event-id':
+            try:
+                last_event_id = int(value)
+            except ValueError:
+                pass
+
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    subscription = address_book.events.subscribe(notify=lambda: loop.call_soon_threadsafe(wakeup.set))
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    disconnected.add_done_callback(lambda _: wakeup.set())
+
+    async def send_text(text):
+        await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+                (b'access-control-allow-origin', b'*'),
+            ],
+        })
+        await send_text("retry: 3000\n\n")
+
+        missed, replayed = await loop.run_in_executor(request_executor, missed_events, last_event_id)
+        for event in missed:
+            await send_text(event.encode())
+
+        while not disconnected.done():
+            # Cleared before reading, so an event queued right after the read still wakes us
+            wakeup.clear()
+            event = subscription.get_nowait()
+            if event is None:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), EVENT_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    await send_text(": keep-alive\n\n")
+            elif event.id is None or event.id > replayed:
+                await send_text(event.encode())
+    finally:
+        address_book.events.unsubscribe(subscription)
+        disconnected.cancel()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            address_book.import_jobs.shutdown()
+            address_book.db.shutdown()
+            if address_book.reads is not address_book.db:
+                address_book.reads.shutdown()
+            request_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'GET' and scope['path'] == '/contacts/events':
+        await contact_events(scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
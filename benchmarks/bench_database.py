@@ -0,0 +1,124 @@
+"""
+Micro-benchmarks of the storage backend methods against a generated database.
+
+Write benchmarks undo their own changes (add then delete, toggle twice), so
+the row count stays the same while measuring. Run it on a copy: the change
+log still grows. With --storage memory the same benchmarks run against the
+in-memory engine, loaded from the database first, and are reported as the
+memory suite.
+
+Usage:
+    python -m benchmarks.bench_database --db benchmarks/data/contacts-100000.db [--storage memory] [--json]
+"""
+
+import argparse
+import itertools
+import random
+
+from benchmarks.harness import measure, print_results, result
+from storage import STORAGE_BACKENDS, open_storage
+
+
+# Suite name of the results of each storage backend
+SUITES = {'sqlite': 'database', 'memory': 'memory'}
+
+
+def contact(first_name, last_name):
+    return {
+        'first_name': first_name, 'last_name': last_name, 'category': 'Work',
+        'phone_number': '+353 1 234 5678', 'email': f"{first_name}.{last_name}@example.org".lower(),
+        'address': '1 Main Street, Dublin', 'institution': 'Maynooth University', 'is_starred': 0,
+    }
+
+
+def run(db_path, budget=1.0, seed=0, storage='sqlite'):
+    """
+    Returns:
+        list: One result per benchmark
+    """
+    db = open_storage(storage, db_path)
+    suite = SUITES[storage]
+    rng = random.Random(seed)
+    contacts = db.get_all_contacts()
+    rows = len(contacts)
+    ids = [contact.id for contact in contacts]
+    names = [(contact.first_name, contact.last_name) for contact in rng.sample(contacts, min(100, rows))]
+    del contacts
+
+    # A cursor roughly in the middle of the listing, for deep page reads
+    middle_cursor = None
+    if rows:
+        _, middle_cursor = db.get_contacts_page(max(1, rows // 2))
+
+    counter = itertools.count()
+    results = []
+
+    def bench(name, function, **options):
+        timings = measure(function, budget=budget, **options)
+        results.append(result(suite, name, rows, timings))
+
+    # Reads
+    bench('get_all_contacts', db.get_all_contacts, max_repeat=10)
+    bench('get_contacts_page_first', lambda: db.get_contacts_page(50))
+    bench('get_contacts_page_deep', lambda: db.get_contacts_page(50, middle_cursor))
+    bench('get_contacts_page_category', lambda: db.get_contacts_page(50, sort='category', category='Work'))
+    bench('iter_contact_batches', lambda: sum(len(batch) for batch in db.iter_contact_batches(1000)), max_repeat=5)
+    bench('get_contact', lambda: db.get_contact(rng.choice(ids)))
+    bench('get_change_seq', db.get_change_seq)
+    bench('get_facets', db.get_facets)
+    bench('get_changes_recent', lambda: db.get_changes(max(0, db.get_change_seq() - 100), 500))
+    bench('search_prefix', lambda: db.search_contacts('jo', 100))
+    bench('search_full_name', lambda: db.search_contacts('mary smith', 100))
+    bench('search_substring', lambda: db.search_contacts('5678', 100))
+    bench('search_no_match', lambda: db.search_contacts('zzzzqq', 100))
+    bench('find_duplicates', lambda: db.find_duplicates(100), max_repeat=3)
+    bench('find_matches', lambda: db.find_matches(contact(*rng.choice(names))))
+
+    # Writes, each undoing itself
+    def add_and_delete():
+        contact_id = db.add_contact(contact('Bench', f"Add {next(counter)}"))
+        db.delete_contact_by_id(contact_id)
+
+    def update():
+        first_name, last_name = rng.choice(names)
+        db.update_contact(first_name, last_name, contact(first_name, last_name))
+
+    def toggle_twice():
+        contact_id = rng.choice(ids)
+        db.toggle_starred_by_id(contact_id)
+        db.toggle_starred_by_id(contact_id)
+
+    def batch():
+        run_id = next(counter)
+        operations = [{'op': 'add', 'contact': contact('Batch', f"{run_id} {i}")} for i in range(50)]
+        operations += [{'op': 'delete', 'first_name': 'Batch', 'last_name': f"{run_id} {i}"} for i in range(50)]
+        db.apply_batch(operations)
+
+    def bulk_add_and_delete():
+        run_id = next(counter)
+        db.bulk_add_rows(tuple(contact('Bulk', f"{run_id} {i}").values()) for i in range(1000))
+        db.apply_batch([{'op': 'delete', 'first_name': 'Bulk', 'last_name': f"{run_id} {i}"} for i in range(1000)])
+
+    bench('add_and_delete_contact', add_and_delete)
+    bench('update_contact', update)
+    bench('toggle_starred_twice', toggle_twice)
+    bench('apply_batch_100', batch)
+    bench('bulk_add_rows_1000_and_delete', bulk_add_and_delete, max_repeat=10)
+
+    db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', required=True, help='generated database to run against')
+    parser.add_argument('--budget', type=float, default=1.0, help='seconds spent per benchmark')
+    parser.add_argument('--storage', choices=STORAGE_BACKENDS, default='sqlite', help='storage backend to measure')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    print_results(run(args.db, args.budget, storage=args.storage), args.json)
+
+
+if __name__ == '__main__':
+    main()
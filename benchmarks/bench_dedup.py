@@ -0,0 +1,105 @@
+"""
+Benchmarks of duplicate detection against a generated database.
+
+Generated contacts all have distinct names, so near-duplicates are added
+first: one contact in a hundred is entered again with a re-typed first
+name, its phone number written without spaces and its email in upper case.
+The benchmarks then time the full duplicate report, checking a single
+contact before an add, a merge import, and filling in the name blocking key
+of every row as the migration that adds it does. Run it on a copy.
+
+Usage:
+    python -m benchmarks.bench_dedup --db benchmarks/data/contacts-1000000.db [--json]
+"""
+
+import argparse
+import itertools
+import random
+
+from benchmarks.harness import measure, print_results, result
+from database import CONTACT_FIELDS, Database
+from migrations import fill_name_keys
+
+
+# Share of contacts entered a second time as a near-duplicate
+DUPLICATE_RATIO = 0.01
+
+
+def near_duplicate(contact, typo=None):
+    """
+    The same person as contact, as a second person might have typed it in:
+    the first name with one letter added (by default its last letter again).
+    """
+    fields = contact._asdict()
+    fields['first_name'] = contact.first_name + (typo or contact.first_name[-1])
+    fields['phone_number'] = (contact.phone_number or '').replace(' ', '')
+    fields['email'] = (contact.email or '').upper()
+    return tuple(fields[field] for field in CONTACT_FIELDS)
+
+
+def run(db_path, budget=1.0, seed=0):
+    """
+    Returns:
+        list: One result per benchmark
+    """
+    db = Database(db_path)
+    rng = random.Random(seed)
+    contacts = db.get_all_contacts()
+    sample = rng.sample(contacts, int(len(contacts) * DUPLICATE_RATIO))
+    del contacts
+    db.bulk_add_rows(near_duplicate(contact) for contact in sample)
+    rows = len(db.get_all_contacts())
+
+    counter = itertools.count()
+    results = []
+
+    def bench(name, function, **options):
+        timings = measure(function, budget=budget, **options)
+        results.append(result('dedup', name, rows, timings))
+
+    groups = []
+    bench('find_duplicates', lambda: groups.append(db.find_duplicates(100)[1]), max_repeat=5)
+    results[-1]['groups'] = groups[-1]
+
+    typo = rng.choice(sample)
+    bench('find_matches_typo', lambda: db.find_matches({'first_name': typo.first_name[:-1] + 'x',
+                                                        'last_name': typo.last_name,
+                                                        'phone_number': typo.phone_number}))
+    bench('find_matches_new', lambda: db.find_matches({'first_name': 'Nobody', 'last_name': 'Known',
+                                                       'phone_number': '+1 555 0100 0199'}))
+
+    def merge_and_delete():
+        # Half the rows match an existing contact by phone and a close name,
+        # the other half are new and are deleted again afterwards
+        run_id = next(counter)
+        matching = [near_duplicate(contact, 'e') for contact in rng.sample(sample, min(500, len(sample)))]
+        new = [('Merge', f"{run_id} {i}", 'Work', '', '', '', '', 0) for i in range(500)]
+        db.bulk_merge_rows(matching + new)
+        db.apply_batch([{'op': 'delete', 'first_name': 'Merge', 'last_name': f"{run_id} {i}"} for i in range(500)])
+
+    bench('bulk_merge_rows_1000_and_delete', merge_and_delete, max_repeat=10)
+
+    def refill_all_name_keys():
+        with db.pool.connection() as conn:
+            conn.execute("UPDATE contacts SET name_key = NULL")
+            fill_name_keys(conn.cursor())
+            conn.commit()
+
+    bench('refill_name_keys_all', refill_all_name_keys, min_repeat=1, max_repeat=3, warmup=0)
+
+    db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', required=True, help='generated database to run against')
+    parser.add_argument('--budget', type=float, default=1.0, help='seconds spent per benchmark')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    print_results(run(args.db, args.budget), args.json)
+
+
+if __name__ == '__main__':
+    main()
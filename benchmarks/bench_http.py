@@ -0,0 +1,133 @@
+"""
+End-to-end benchmarks of the HTTP API through Flask's test client.
+
+Each request goes through routing, the response cache, the database
+executor and serialisation, exactly as in production minus the network.
+Cold variants clear the response cache before every request.
+
+Usage:
+    python -m benchmarks.bench_http --db benchmarks/data/contacts-100000.db [--json]
+"""
+
+import argparse
+import importlib
+import io
+import os
+
+from openpyxl import Workbook
+
+from benchmarks.generate import contact_count
+from benchmarks.harness import measure, print_results, result
+from database import ContactRecord
+
+
+SUITE = 'http'
+
+# Exports above this many rows are measured once, they take seconds each
+EXPORT_SINGLE_RUN_ROWS = 200_000
+
+# Contacts per imported workbook
+IMPORT_ROWS = 1000
+
+
+def load_app(db_path):
+    """
+    Import app.py with its database pointed at db_path.
+    """
+    os.environ['CONTACTS_DB'] = db_path
+    os.environ.setdefault('CONTACTS_LOG_LEVEL', 'WARNING')
+    return importlib.import_module('app')
+
+
+def import_workbook(app_module):
+    """
+    Build an .xlsx with IMPORT_ROWS new contacts in the import layout:
+    export columns, without the header row.
+    """
+    workbook = Workbook()
+    worksheet = workbook.active
+    for i in range(IMPORT_ROWS):
+        worksheet.append(app_module.export_row(ContactRecord(
+            0, 'Import', f"Contact {i}", 'Work', '+353 1 234 5678',
+            f"import.{i}@example.org", '1 Main Street', 'Acme Corporation', 0)))
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def run(db_path, budget=1.0):
+    """
+    Returns:
+        list: One result per benchmark
+    """
+    app_module = load_app(db_path)
+    client = app_module.app.test_client()
+    cache = app_module.response_cache
+    rows = contact_count(db_path)
+    results = []
+
+    def bench(name, method, path, cold=False, status=200, headers=None, **options):
+        def call():
+            if cold:
+                cache.clear()
+            response = client.open(path, method=method, headers=headers)
+            body = response.get_data()
+            if response.status_code != status:
+                raise RuntimeError(f"{method} {path} returned {response.status_code}")
+            return body
+
+        body = call()
+        timings = measure(call, budget=budget, **options)
+        results.append(result(SUITE, name, rows, timings, response_bytes=len(body)))
+
+    bench('list_all_cold', 'GET', '/contacts', cold=True, max_repeat=10)
+    bench('list_all_cached', 'GET', '/contacts')
+    bench('list_all_gzip_cold', 'GET', '/contacts', cold=True, headers={'Accept-Encoding': 'gzip'}, max_repeat=10)
+    bench('list_all_gzip_cached', 'GET', '/contacts', headers={'Accept-Encoding': 'gzip'})
+    bench('list_all_columns_cold', 'GET', '/contacts?format=columns', cold=True, max_repeat=10)
+    etag = client.get('/contacts').headers.get('ETag')
+
+    def not_modified():
+        response = client.get('/contacts', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+    results.append(result(SUITE, 'list_all_not_modified', rows, measure(not_modified, budget=budget)))
+
+    bench('list_page_cold', 'GET', '/contacts?limit=50', cold=True)
+    bench('list_page_category_cold', 'GET', '/contacts?limit=50&sort=category&category=Work', cold=True)
+    bench('search_cold', 'GET', '/contacts/search?q=jo', cold=True)
+    bench('search_cached', 'GET', '/contacts/search?q=jo')
+    bench('facets_cold', 'GET', '/contacts/facets', cold=True)
+    bench('changes_since_latest', 'GET', f"/contacts/changes?since={app_module.address_book.db.get_change_seq()}")
+
+    single = {'min_repeat': 1, 'max_repeat': 1, 'warmup': 0} if rows > EXPORT_SINGLE_RUN_ROWS else {'max_repeat': 5}
+    for export_format in ('csv', 'ndjson', 'xlsx'):
+        bench(f"export_{export_format}", 'GET', f"/contacts/export?format={export_format}", **single)
+
+    # Import new contacts from a workbook, then remove them again
+    workbook = import_workbook(app_module)
+    delete = [{'op': 'delete', 'first_name': 'Import', 'last_name': f"Contact {i}"} for i in range(IMPORT_ROWS)]
+
+    def import_and_delete():
+        response = client.post('/contacts/import', data={'file': (io.BytesIO(workbook), 'contacts.xlsx')})
+        if response.status_code != 200 or response.json['imported'] != IMPORT_ROWS:
+            raise RuntimeError(f"Import returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        client.post('/contacts/batch', json=delete)
+
+    results.append(result(SUITE, f"import_xlsx_{IMPORT_ROWS}_and_delete", rows,
+                          measure(import_and_delete, budget=budget, max_repeat=10)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', required=True, help='generated database to run against')
+    parser.add_argument('--budget', type=float, default=1.0, help='seconds spent per benchmark')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    print_results(run(args.db, args.budget), args.json)
+
+
+if __name__ == '__main__':
+    main()
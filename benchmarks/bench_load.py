@@ -0,0 +1,150 @@
+"""
+Load test with concurrent clients.
+
+Every client runs a loop of requests drawn from a fixed mix of listing
+pages, searches, single contact reads and star toggles, for a fixed time.
+Requests go through Flask's test client in-process by default, or over HTTP
+to a running server with --url. Reports throughput and latency percentiles
+per concurrency level.
+
+Usage:
+    python -m benchmarks.bench_load --db benchmarks/data/contacts-100000.db --clients 1 8 32 [--json]
+    python -m benchmarks.bench_load --url http://127.0.0.1:5000 --clients 64
+"""
+
+import argparse
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.bench_http import load_app
+from benchmarks.generate import contact_count
+from benchmarks.harness import percentile, print_results, result, summarise
+
+
+SUITE = 'load'
+
+# Request mix: (weight, method, path); {prefix} and {id} are filled per request
+REQUEST_MIX = (
+    (50, 'GET', '/contacts?limit=50'),
+    (20, 'GET', '/contacts/search?q={prefix}'),
+    (15, 'GET', '/contacts/{id}'),
+    (10, 'GET', '/contacts?limit=50&sort=category&category=Work'),
+    (5, 'PUT', '/contacts/{id}/star'),
+)
+
+SEARCH_PREFIXES = ('jo', 'ma', 'li', 'wang', 'smi', 'chen', 'sa', 'da', 'an', 'ke')
+
+
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path):
+        response = self.client.open(path, method=method)
+        response.get_data()
+        return response.status_code
+
+
+class HttpSession:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def request(self, method, path):
+        request = urllib.request.Request(self.url + path, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+def client_loop(session, deadline, max_id, seed, latencies, errors):
+    rng = random.Random(seed)
+    weights = [weight for weight, _, _ in REQUEST_MIX]
+    while time.perf_counter() < deadline:
+        _, method, path = rng.choices(REQUEST_MIX, weights)[0]
+        path = path.format(prefix=rng.choice(SEARCH_PREFIXES), id=rng.randint(1, max_id))
+        start = time.perf_counter()
+        try:
+            status = session.request(method, path)
+        except Exception:
+            status = None
+        latencies.append(time.perf_counter() - start)
+        if status is None or status >= 500:
+            errors.append(path)
+
+
+def run_level(make_session, clients, seconds, max_id):
+    """
+    Run one concurrency level.
+
+    Returns:
+        tuple: (latencies of all requests, failed request paths, elapsed seconds)
+    """
+    latencies, errors = [], []
+    sessions = [make_session() for _ in range(clients)]
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client_loop, args=(session, deadline, max_id, index, latencies, errors))
+               for index, session in enumerate(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def run(db_path=None, url=None, clients=(1, 8, 32), seconds=5.0):
+    """
+    Returns:
+        list: One result per concurrency level; median and p95 are request
+            latencies, plus requests_per_second and errors
+    """
+    if url:
+        rows = None
+        make_session = lambda: HttpSession(url)
+    else:
+        rows = contact_count(db_path)
+        app = load_app(db_path).app
+        make_session = lambda: TestClientSession(app)
+    max_id = rows or 1000
+
+    results = []
+    for level in clients:
+        latencies, errors, elapsed = run_level(make_session, level, seconds, max_id)
+        if not latencies:
+            continue
+        results.append(result(SUITE, f"mixed_clients_{level}", rows, summarise(latencies),
+                              clients=level, requests=len(latencies),
+                              requests_per_second=round(len(latencies) / elapsed, 1),
+                              p99=round(percentile(sorted(latencies), 0.99), 6),
+                              errors=len(errors)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--db', help='generated database to run the app against in-process')
+    target.add_argument('--url', help='base URL of a running server')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--seconds', type=float, default=5.0, help='duration of each concurrency level')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.db, args.url, args.clients, args.seconds)
+    if args.json:
+        print_results(results, True)
+        return
+    for record in results:
+        print(f"{record['clients']:>4} clients {record['requests_per_second']:>9} req/s  "
+              f"p50 {record['median'] * 1000:8.2f} ms  p95 {record['p95'] * 1000:8.2f} ms  "
+              f"p99 {record['p99'] * 1000:8.2f} ms  errors {record['errors']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Memory and throughput of the contact listing path: dict per row + stdlib
+json (the previous implementation) against ContactRecord tuples serialised
+straight to JSON.
+
+Usage:
+    python -m benchmarks.bench_records [--sizes 10000 100000 1000000]
+"""
+
+import argparse
+import gc
+import json
+import random
+import sqlite3
+import string
+import time
+import tracemalloc
+
+from database import CONTACT_FIELDS, RECORD_COLUMNS, contact_cursor
+from serialization import contacts_json
+
+
+SELECT_CONTACTS = f"SELECT {RECORD_COLUMNS} FROM contacts ORDER BY is_starred DESC, first_name, last_name"
+
+
+def make_database(size, seed=0):
+    """
+    Build an in-memory contacts table with size synthetic rows.
+    """
+    rng = random.Random(seed)
+    letters = string.ascii_letters
+
+    def word(length):
+        return ''.join(rng.choices(letters, k=length))
+
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f"CREATE TABLE contacts (id INTEGER PRIMARY KEY, {', '.join(CONTACT_FIELDS)})")
+    # Same listing index as Database, so the query itself does not dominate
+    conn.execute("CREATE INDEX idx_contacts_starred_name ON contacts(is_starred DESC, first_name, last_name)")
+    conn.executemany(
+        f"INSERT INTO contacts ({', '.join(CONTACT_FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        ((word(6), word(8), rng.choice(('Family', 'Friends', 'Work', '')),
+          str(rng.randrange(10 ** 10, 10 ** 11)), word(8) + '@example.com',
+          f"{rng.randrange(1, 999)} {word(10)} Road", word(12), int(rng.random() < 0.1))
+         for _ in range(size)))
+    conn.commit()
+    return conn
+
+
+def dict_path(conn):
+    rows = conn.execute(SELECT_CONTACTS).fetchall()
+    contacts = [{"id": row[0], "first_name": row[1], "last_name": row[2], "category": row[3], "phone_number": row[4],
+                 "email": row[5], "address": row[6], "institution": row[7], "is_starred": bool(row[8])} for row in rows]
+    return json.dumps(contacts, sort_keys=True, separators=(',', ':'))
+
+
+def record_path(conn):
+    records = contact_cursor(conn).execute(SELECT_CONTACTS).fetchall()
+    return contacts_json(records)
+
+
+def measure(path, conn):
+    """
+    Run one path and return (seconds, peak traced bytes, output length).
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    body = path(conn)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    # Timing again without tracemalloc, which slows allocation heavy code
+    gc.collect()
+    start = time.perf_counter()
+    path(conn)
+    elapsed = min(elapsed, time.perf_counter() - start)
+    return elapsed, peak, len(body)
+
+
+def run(sizes):
+    results = []
+    for size in sizes:
+        conn = make_database(size)
+        for name, path in (('dict', dict_path), ('record', record_path)):
+            elapsed, peak, length = measure(path, conn)
+            results.append({
+                "rows": size,
+                "path": name,
+                "seconds": round(elapsed, 4),
+                "rows_per_second": round(size / elapsed),
+                "peak_mib": round(peak / 1024 / 1024, 1),
+                "output_bytes": length,
+            })
+        conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.sizes)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'rows':>9} {'path':>7} {'seconds':>9} {'rows/s':>10} {'peak MiB':>9}")
+    for result in results:
+        print(f"{result['rows']:>9} {result['path']:>7} {result['seconds']:>9} "
+              f"{result['rows_per_second']:>10} {result['peak_mib']:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Generate a contacts database filled with realistic synthetic contacts.
+
+The rows go through Database.bulk_add_rows, so the schema, indexes, search
+tables and change log are exactly what the app itself builds. Output is
+deterministic for a given seed.
+
+Usage:
+    python -m benchmarks.generate --rows 100000 --output benchmarks/data/contacts-100000.db
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import time
+
+from database import Database
+
+
+FIRST_NAMES = (
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen',
+    'Christopher', 'Lisa', 'Daniel', 'Nancy', 'Matthew', 'Betty', 'Anthony', 'Margaret', 'Mark', 'Sandra',
+    'Wei', 'Fang', 'Jing', 'Lei', 'Min', 'Yan', 'Hao', 'Xin', 'Jie', 'Ying', 'Chen', 'Tao', 'Lin', 'Yu',
+    'Hiroshi', 'Yuki', 'Sakura', 'Kenji', 'Aiko', 'Priya', 'Arjun', 'Ananya', 'Rahul', 'Sofia', 'Mateo',
+    'Lucía', 'Hugo', 'Chloé', 'Léa', 'Björn', 'Zoë', 'Noah', 'Emma', 'Liam', 'Olivia', 'Ava', 'Ethan',
+    'Mia', 'Lucas', 'Amelia', 'Oliver', 'Isla', 'Jack', 'Freya', 'Omar', 'Fatima', 'Yusuf', 'Aisha',
+)
+LAST_NAMES = (
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson',
+    'Wang', 'Li', 'Zhang', 'Liu', 'Chen', 'Yang', 'Huang', 'Zhao', 'Wu', 'Zhou', 'Xu', 'Sun', 'Ma', 'Hu',
+    'Sato', 'Suzuki', 'Takahashi', 'Tanaka', 'Kim', 'Park', 'Nguyen', 'Tran', 'Patel', 'Sharma', 'Singh',
+    'Müller', 'Schmidt', 'Dubois', 'Rossi', 'Russo', 'Silva', 'Santos', 'Novak', 'Kowalski', 'Ivanov',
+    "O'Brien", 'Murphy', 'Kelly', 'Walsh', 'Andersen', 'Nielsen', 'Hansen', 'Larsen', 'Berg', 'Haddad',
+)
+CATEGORIES = ('Family', 'Friends', 'Work', 'Classmates', 'Clients', '', '', '')
+INSTITUTIONS = (
+    'Fuzhou University', 'Maynooth University', 'Acme Corporation', 'City Hospital', 'Northwind Traders',
+    'Globex', 'Initech', 'Umbrella Labs', 'Stark Industries', 'Wayne Enterprises', '', '', '',
+)
+STREETS = ('Main Street', 'High Street', 'Park Avenue', 'Oak Road', 'Station Road', 'Church Lane',
+           'Xueyuan Road', 'Wulong River Avenue', 'Maple Drive', 'Harbour View')
+CITIES = ('Fuzhou', 'Dublin', 'London', 'Shanghai', 'New York', 'Berlin', 'Tokyo', 'Sydney', 'Toronto')
+EMAIL_DOMAINS = ('gmail.com', 'outlook.com', 'qq.com', '163.com', 'yahoo.com', 'example.org')
+
+# Rows written per transaction while generating
+GENERATE_CHUNK_SIZE = 50_000
+
+
+def contact_rows(size, seed=0, starred_ratio=0.05):
+    """
+    Yield size unique contacts as tuples in CONTACT_FIELDS order.
+
+    Every (first, last) pair is used once before any name gets a numeric
+    suffix, so small databases look natural and large ones stay unique.
+    """
+    rng = random.Random(seed)
+    pairs = len(FIRST_NAMES) * len(LAST_NAMES)
+    order = list(range(pairs))
+    rng.shuffle(order)
+
+    for i in range(size):
+        first_name = FIRST_NAMES[order[i % pairs] % len(FIRST_NAMES)]
+        last_name = LAST_NAMES[order[i % pairs] // len(FIRST_NAMES)]
+        if i >= pairs:
+            last_name = f"{last_name} {i // pairs + 1}"
+        local = f"{first_name}.{last_name}".lower().replace(' ', '').replace("'", '')
+        yield (
+            first_name,
+            last_name,
+            rng.choice(CATEGORIES),
+            f"+{rng.choice((86, 353, 44, 1))} {rng.randrange(100, 999)} {rng.randrange(1000, 9999)} {rng.randrange(1000, 9999)}",
+            f"{local}{rng.randrange(100) if rng.random() < 0.3 else ''}@{rng.choice(EMAIL_DOMAINS)}",
+            f"{rng.randrange(1, 300)} {rng.choice(STREETS)}, {rng.choice(CITIES)}",
+            rng.choice(INSTITUTIONS),
+            1 if rng.random() < starred_ratio else 0,
+        )
+
+
+def generate_database(path, size, seed=0):
+    """
+    Create a database at path with size contacts, replacing any existing file.
+
+    Returns:
+        float: Seconds spent generating
+    """
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    start = time.perf_counter()
+    db = Database(path)
+    rows = contact_rows(size, seed)
+    while True:
+        chunk = [row for _, row in zip(range(GENERATE_CHUNK_SIZE), rows)]
+        if not chunk:
+            break
+        db.bulk_add_rows(chunk)
+    with db.pool.connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("ANALYZE")
+    db.pool.close()
+    return time.perf_counter() - start
+
+
+def contact_count(path):
+    """
+    Number of contacts in an existing database, or None if it is missing.
+    """
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM contacts").fetchone()[0]
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+def ensure_database(directory, size, seed=0):
+    """
+    Return the path of a generated database with size contacts, generating
+    it only if it does not exist yet.
+    """
+    path = os.path.join(directory, f"contacts-{size}.db")
+    if contact_count(path) != size:
+        seconds = generate_database(path, size, seed)
+        print(f"Generated {size} contacts in {seconds:.1f} s: {path}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--output', default=None, help='database file, by default contacts-<rows>.db')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    output = args.output or f"contacts-{args.rows}.db"
+    seconds = generate_database(output, args.rows, args.seed)
+    print(f"Generated {args.rows} contacts in {seconds:.1f} s: {output}")
+
+
+if __name__ == '__main__':
+    main()
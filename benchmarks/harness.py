@@ -0,0 +1,134 @@
+"""
+Timing, result records and baseline comparison shared by the benchmark suites.
+
+A result is a flat JSON object identified by (suite, name, rows). Timings
+are in seconds; the median is what baselines are compared on, because it is
+far less sensitive to a single slow run than the mean.
+"""
+
+import json
+import statistics
+import time
+
+
+# Default regression threshold: fail when a median is this much slower
+REGRESSION_THRESHOLD = 0.20
+
+# Differences below this many seconds are noise, whatever the ratio
+REGRESSION_MIN_DELTA = 0.0005
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarise(times):
+    """
+    Returns:
+        dict: repeat, min, median, p95, max and mean of a list of durations
+    """
+    ordered = sorted(times)
+    return {
+        "repeat": len(ordered),
+        "min": round(ordered[0], 6),
+        "median": round(statistics.median(ordered), 6),
+        "p95": round(percentile(ordered, 0.95), 6),
+        "max": round(ordered[-1], 6),
+        "mean": round(statistics.fmean(ordered), 6),
+    }
+
+
+def measure(function, min_repeat=3, max_repeat=50, budget=1.0, warmup=1):
+    """
+    Call function repeatedly and summarise the durations.
+
+    Runs at least min_repeat times, then keeps going until budget seconds
+    have been spent or max_repeat runs are done.
+
+    Args:
+        function (callable): Code to time, called without arguments
+        min_repeat (int): Minimum number of timed runs
+        max_repeat (int): Maximum number of timed runs
+        budget (float): Seconds after which no new run is started
+        warmup (int): Untimed runs before measuring
+
+    Returns:
+        dict: See summarise()
+    """
+    for _ in range(warmup):
+        function()
+
+    times = []
+    spent = 0.0
+    while len(times) < min_repeat or (len(times) < max_repeat and spent < budget):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        spent += elapsed
+    return summarise(times)
+
+
+def result(suite, name, rows, timings, **extra):
+    record = {"suite": suite, "name": name, "rows": rows}
+    record.update(timings)
+    record.update(extra)
+    return record
+
+
+def print_results(results, as_json=False):
+    """
+    Print results as one JSON array, or as a table for reading.
+    """
+    if as_json:
+        print(json.dumps(results))
+        return
+    for record in results:
+        print(f"{record['suite']:>9} {record['name']:>34} {record['rows']:>9} "
+              f"median {record['median'] * 1000:10.3f} ms  p95 {record['p95'] * 1000:10.3f} ms")
+
+
+def result_key(record):
+    return record["suite"], record["name"], record["rows"]
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return data["results"] if isinstance(data, dict) else data
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD, min_delta=REGRESSION_MIN_DELTA):
+    """
+    Compare results with a baseline run.
+
+    Args:
+        results (list): Current results
+        baseline (list): Results of the baseline run
+        threshold (float): Allowed relative slowdown of the median
+        min_delta (float): Allowed absolute slowdown in seconds
+
+    Returns:
+        list: One dict per benchmark present in both runs with the key,
+            both medians, the ratio and whether it regressed
+    """
+    previous = {result_key(record): record for record in baseline}
+    comparisons = []
+    for record in results:
+        base = previous.get(result_key(record))
+        if base is None or not base.get("median"):
+            continue
+        ratio = record["median"] / base["median"]
+        comparisons.append({
+            "suite": record["suite"],
+            "name": record["name"],
+            "rows": record["rows"],
+            "baseline": base["median"],
+            "median": record["median"],
+            "ratio": round(ratio, 3),
+            "regressed": ratio > 1 + threshold and record["median"] - base["median"] > min_delta,
+        })
+    return comparisons
@@ -0,0 +1,111 @@
+"""
+Run the benchmark suites and compare them with a baseline.
+
+For every size a database is generated once under --data-dir and reused by
+later runs. Each suite runs in its own process on a fresh copy of it, so
+suites cannot warm caches or grow tables for each other. With --baseline,
+exits with status 1 when any median is slower than the baseline by more
+than --threshold.
+
+Usage:
+    python -m benchmarks.run --sizes 10000 100000 --output results.json
+    python -m benchmarks.run --sizes 10000 --baseline results.json --threshold 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generate import ensure_database
+from benchmarks.harness import REGRESSION_THRESHOLD, compare, load_results, print_results
+
+
+SUITES = ('database', 'memory', 'dedup', 'http', 'load')
+# Suites run by another suite's module, with the options that select them
+SUITE_MODULES = {'memory': ('database', ['--storage', 'memory'])}
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(REPO_DIR, 'benchmarks', 'data')
+
+
+def run_suite(suite, db_path, options):
+    """
+    Run one suite in a subprocess on a copy of db_path.
+
+    Returns:
+        list: The suite's results
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        copy = os.path.join(directory, os.path.basename(db_path))
+        shutil.copyfile(db_path, copy)
+        module, suite_options = SUITE_MODULES.get(suite, (suite, []))
+        command = [sys.executable, '-m', f"benchmarks.bench_{module}", '--db', copy, '--json'] + suite_options + options
+        env = dict(os.environ, CONTACTS_LOG_LEVEL='WARNING')
+        output = subprocess.run(command, check=True, capture_output=True, text=True, env=env,
+                                cwd=REPO_DIR).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument('--data-dir', default=DATA_DIR, help='where generated databases are kept')
+    parser.add_argument('--budget', type=float, default=1.0, help='seconds spent per micro-benchmark')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32], help='load test concurrency levels')
+    parser.add_argument('--seconds', type=float, default=5.0, help='duration of each load test level')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='results file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='allowed relative slowdown of a median before failing')
+    args = parser.parse_args()
+
+    options = {
+        'database': ['--budget', str(args.budget)],
+        'memory': ['--budget', str(args.budget)],
+        'dedup': ['--budget', str(args.budget)],
+        'http': ['--budget', str(args.budget)],
+        'load': ['--seconds', str(args.seconds), '--clients'] + [str(level) for level in args.clients],
+    }
+
+    results = []
+    for size in args.sizes:
+        db_path = ensure_database(args.data_dir, size)
+        for suite in args.suites:
+            start = time.perf_counter()
+            suite_results = run_suite(suite, db_path, options[suite])
+            print(f"{suite} on {size} rows: {len(suite_results)} benchmarks in {time.perf_counter() - start:.1f} s",
+                  file=sys.stderr)
+            results.extend(suite_results)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results,
+            }, f, indent=2)
+
+    if args.baseline:
+        comparisons = compare(results, load_results(args.baseline), args.threshold)
+        regressions = [comparison for comparison in comparisons if comparison['regressed']]
+        for comparison in comparisons:
+            marker = 'REGRESSED' if comparison['regressed'] else ''
+            print(f"{comparison['suite']:>9} {comparison['name']:>34} {comparison['rows']:>9} "
+                  f"{comparison['baseline'] * 1000:10.3f} -> {comparison['median'] * 1000:10.3f} ms "
+                  f"x{comparison['ratio']:<6} {marker}")
+        if regressions:
+            print(f"{len(regressions)} of {len(comparisons)} benchmarks regressed by more than "
+                  f"{args.threshold:.0%}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Read-through cache of serialised JSON responses.
+
+Entries are tagged with the database generation they were built from. Every
+write to the database bumps the generation, so a stale entry is simply a
+miss and never has to be found and deleted. The cache is bounded by entry
+count, total bytes and age, and evicts the least recently used entries.
+Compressed copies of a body are kept with its entry and count towards the
+byte bound.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from compression import compress
+
+
+# Default bounds of the response cache
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_TTL = 60.0
+
+
+class CacheEntry:
+    """
+    One cached response body.
+
+    Attributes:
+        generation (int): Database generation the body was built from
+        body (bytes): Serialised JSON
+        etag (str): Strong validator derived from the body
+        expires_at (float): time.monotonic() after which the entry is stale
+        encoded (dict): Compressed bodies by content encoding
+    """
+
+    __slots__ = ('generation', 'body', 'etag', 'expires_at', 'encoded')
+
+    def __init__(self, generation, body, ttl):
+        self.generation = generation
+        self.body = body
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.expires_at = time.monotonic() + ttl
+        self.encoded = {}
+
+    @property
+    def size(self):
+        return len(self.body) + sum(map(len, self.encoded.values()))
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache bounded by size and TTL.
+
+    Args:
+        max_entries (int): Maximum number of cached responses
+        max_bytes (int): Maximum total size of the cached bodies
+        ttl (float): Seconds an entry stays valid even without writes
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, generation):
+        """
+        Return the entry for key if it was built from this generation and
+        has not expired, otherwise None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.generation != generation or entry.expires_at < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, generation, body):
+        """
+        Store a serialised body and return its entry. Bodies larger than
+        max_bytes are returned without being cached.
+        """
+        entry = CacheEntry(generation, body, self.ttl)
+        if len(body) > self.max_bytes:
+            return entry
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            self._evict()
+        return entry
+
+    def compressed(self, key, entry, encoding):
+        """
+        Return the body of an entry compressed with a content encoding,
+        compressing it on first use. The result is kept with the entry while
+        the entry is cached under key.
+        """
+        body = entry.encoded.get(encoding)
+        if body is not None:
+            return body
+
+        body = compress(entry.body, encoding)
+        with self._lock:
+            if self._entries.get(key) is entry and encoding not in entry.encoded:
+                entry.encoded[encoding] = body
+                self._bytes += len(body)
+                self._evict()
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
@@ -0,0 +1,55 @@
+"""
+Compression of response bodies negotiated with Accept-Encoding.
+
+gzip is always available. brotli is offered too when the brotli package is
+installed, and preferred when the client accepts both with the same
+quality, since it makes contact lists about a fifth smaller at a similar
+cost. Bodies are compressed once per cache entry (see cache.ResponseCache),
+so the compression level can be higher than for per-request compression.
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Supported encodings, most preferred first
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encodings, size):
+    """
+    Pick the encoding of a response body.
+
+    Args:
+        accept_encodings (werkzeug.datastructures.Accept): Parsed
+            Accept-Encoding header of the request
+        size (int): Length of the uncompressed body
+
+    Returns:
+        str: One of ENCODINGS, or None to send the body as it is
+    """
+    if size < COMPRESS_MIN_BYTES:
+        return None
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def compress(body, encoding):
+    """
+    Compress a body with one of ENCODINGS.
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # A fixed mtime keeps the output, and so its ETag, reproducible
+        return gzip.compress(body, GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported content encoding '{encoding}'")
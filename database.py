@@ -1,244 +1,1346 @@
+import base64
+import itertools
+import json
+import pathlib
+import queue
 import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from dedup import (KEY_GROUP_MAX, NAME_SIMILARITY, group_pairs, name_key, name_pairs, name_similarity,
+                   normalize_name, same_person)
+from logs import get_logger
+from migrations import (PHONE_KEY_DIGITS, SEARCH_COLUMNS, create_search_indexes, email_key_sql, fill_name_keys, migrate,
+                        phone_key_sql, search_indexes_exist)
+
+logger = get_logger(__name__)
+
+# 所需的最低SQLite版本：合并导入使用UPDATE ... FROM（3.33），批量导入使用
+# INSERT ... ON CONFLICT（3.24）和窗口函数（3.25）。FTS5和trigram分词是可选的
+MIN_SQLITE_VERSION = (3, 33, 0)
+
+# contacts表中联系人的字段，按插入顺序排列
+CONTACT_FIELDS = ('first_name', 'last_name', 'category', 'phone_number', 'email', 'address', 'institution', 'is_starred')
+
+# 写入contacts表的字段：CONTACT_FIELDS加上由姓名计算的重复检测分块键name_key
+STORED_FIELDS = CONTACT_FIELDS + ('name_key',)
+
+# 联系人记录：基于元组，没有__dict__，字段为id加上CONTACT_FIELDS。
+# 比每行一个字典节省大部分内存，并且可以直接序列化为JSON
+RECORD_FIELDS = ('id',) + CONTACT_FIELDS
+RECORD_COLUMNS = ", ".join(RECORD_FIELDS)
+ContactRecord = namedtuple('ContactRecord', RECORD_FIELDS)
+
+# 变更日志中的一条变更：op为insert、update或delete，删除时contact为None
+ContactChange = namedtuple('ContactChange', ('seq', 'op', 'id', 'contact'))
+
+# 一个分组的联系人数量，以及其中星标联系人的数量
+FacetCount = namedtuple('FacetCount', ('category', 'count', 'starred'))
+
+# 疑似重复的一组联系人，reasons为匹配的依据：name、phone或email
+DuplicateGroup = namedtuple('DuplicateGroup', ('ids', 'reasons', 'contacts'))
+
+# 与某个联系人疑似重复的已有联系人，score为姓名相似度
+DuplicateMatch = namedtuple('DuplicateMatch', ('contact', 'reasons', 'score'))
+
+# 查找单个联系人的重复项时，最多比较的候选联系人数量
+MATCH_CANDIDATES_MAX = 1000
+
+# bm25 中各字段的权重，与 SEARCH_COLUMNS 一一对应，姓名命中排在最前
+SEARCH_WEIGHTS = (10.0, 10.0, 2.0, 4.0, 4.0, 1.0, 2.0)
+
+# 批量修改支持的操作，以及每次批量查询目标联系人的数量（受SQLite参数个数限制）
+BATCH_OPERATIONS = ('add', 'update', 'delete', 'star')
+BATCH_LOOKUP_SIZE = 400
+
+# 只读副本的mmap上限，足以把常见规模的数据库整个映射进内存，读取时不再复制页面
+REPLICA_MMAP_SIZE = 4 * 1024 * 1024 * 1024
+
+# 内存快照两次刷新之间的最短间隔（秒），也是副本读取落后于主库的最长时间
+REPLICA_REFRESH_INTERVAL = 1.0
+
+# 分页支持的排序方式：(首排序表达式, 升序时首字段的方向)，之后统一按姓名排序。
+# 每种排序都有对应的索引，游标翻页时只做索引范围查找
+PAGE_SORTS = {
+    'name': (None, None),
+    'category': ("IFNULL(category, '')", 'ASC'),
+    'starred': ('is_starred', 'DESC'),
+}
+
+
+def contact_row_factory(cursor, row):
+    return ContactRecord._make(row)
+
+
+def contact_cursor(conn):
+    """
+    返回把每一行构造成ContactRecord的游标，查询的字段必须按RECORD_FIELDS排列
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = contact_row_factory
+    return cursor
+
+
+def contact_row(contact_data):
+    """
+    把联系人字典转换为按CONTACT_FIELDS排列的元组，可选字段默认为空。
+    is_starred统一存为0或1，NULL会让星标排序的分页游标匹配不到任何行
+    """
+    return (contact_data['first_name'], contact_data['last_name'],
+            contact_data.get('category', ''), contact_data.get('phone_number', ''),
+            contact_data.get('email', ''), contact_data.get('address', ''),
+            contact_data.get('institution', ''), 1 if contact_data.get('is_starred') else 0)
+
+
+def stored_row(row):
+    """
+    在按CONTACT_FIELDS排列的元组后加上name_key，得到按STORED_FIELDS排列的元组
+    """
+    return row + (name_key(row[0], row[1]),)
+
+
+def _select_by_names(conn, columns, names):
+    """
+    按(first_name, last_name)分块批量查询联系人
+
+    Yields:
+        tuple: first_name、last_name以及columns中的字段
+    """
+    names = list(set(names))
+    for start in range(0, len(names), BATCH_LOOKUP_SIZE):
+        chunk = names[start:start + BATCH_LOOKUP_SIZE]
+        values = ", ".join("(?, ?)" for _ in chunk)
+        params = [part for name in chunk for part in name]
+        yield from conn.execute(
+            f"SELECT first_name, last_name, {columns} FROM contacts WHERE (first_name, last_name) IN (VALUES {values})", params)
+
+
+def batch_item_error(item):
+    """
+    检查批量操作中的一项，返回错误信息，有效时返回None
+    """
+    if not isinstance(item, dict) or item.get('op') not in BATCH_OPERATIONS:
+        return f"op must be one of {', '.join(BATCH_OPERATIONS)}"
+    if item['op'] in ('add', 'update'):
+        contact = item.get('contact')
+        if not isinstance(contact, dict):
+            return "contact is required"
+        if not isinstance(contact.get('first_name'), str) or not isinstance(contact.get('last_name'), str):
+            return "contact.first_name and contact.last_name are required"
+    if item['op'] != 'add':
+        if 'id' in item:
+            if not isinstance(item['id'], int) or isinstance(item['id'], bool):
+                return "id must be an integer"
+        elif not isinstance(item.get('first_name'), str) or not isinstance(item.get('last_name'), str):
+            return "id or first_name and last_name are required"
+    return None
+
+
+def encode_cursor(sort, order, key):
+    """
+    把排序方式和上一页最后一行的排序键编码为分页游标
+    """
+    payload = json.dumps([sort, order, key], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort, order, key_length):
+    """
+    解码分页游标，返回排序键列表
+
+    Raises:
+        ValueError: 游标无效，或者与请求的排序方式不一致
+    """
+    try:
+        cursor_sort, cursor_order, key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort or cursor_order != order:
+        raise ValueError("Cursor does not match the requested sort order")
+    if not isinstance(key, list) or len(key) != key_length:
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def duplicate_match(first_name, last_name, new_phone_key, new_email_key, contact, phone_key, email_key):
+    """
+    比较待添加的联系人与一个候选联系人
+
+    Args:
+        first_name (str): 待添加联系人的名
+        last_name (str): 待添加联系人的姓
+        new_phone_key (str): 待添加联系人电话号码的归一化键
+        new_email_key (str): 待添加联系人邮箱的归一化键
+        contact (ContactRecord): 候选联系人
+        phone_key (str): 候选联系人电话号码的归一化键
+        email_key (str): 候选联系人邮箱的归一化键
+
+    Returns:
+        DuplicateMatch: 没有任何匹配理由时为None
+    """
+    similarity = name_similarity(first_name, last_name, contact.first_name, contact.last_name)
+    reasons = []
+    if similarity >= NAME_SIMILARITY:
+        reasons.append('name')
+    if len(new_phone_key) == PHONE_KEY_DIGITS and phone_key == new_phone_key:
+        reasons.append('phone')
+    if '@' in new_email_key[1:] and email_key == new_email_key:
+        reasons.append('email')
+    return DuplicateMatch(contact, reasons, round(similarity, 3)) if reasons else None
+
+
+def rank_matches(matches, limit):
+    """
+    匹配理由多、姓名更相近的排在前面，返回前limit个
+    """
+    matches.sort(key=lambda match: (-len(match.reasons), -match.score, match.contact.id))
+    return matches[:limit]
+
+
+class ConnectionPool:
+    """
+    有界、线程安全的SQLite连接池
+
+    每个连接只在创建时配置一次（WAL、synchronous、mmap、cache），
+    操作结束后归还到池中复用，避免每次请求都重新建立连接和预热页缓存。
+    同一线程内的嵌套借用会复用该线程已持有的连接。
+    设置statement_timer时，每个连接都会统计SQL语句的耗时。
+    read_only时db_file为URI（例如mode=ro），连接设置为query_only，不修改日志模式。
+    """
+
+    def __init__(self, db_file, max_size=5, timeout=30.0,
+                 mmap_size=256 * 1024 * 1024, cache_size=-64000, statement_timer=None, read_only=False):
+        self.db_file = db_file
+        self.statement_timer = statement_timer
+        self.max_size = max_size
+        self.timeout = timeout
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.read_only = read_only
+        self.closed = False
+
+        self._idle = queue.LifoQueue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._created = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._in_use = 0
+
+    def _create_connection(self):
+        conn = sqlite3.connect(self.db_file, timeout=self.timeout,
+                               check_same_thread=False, uri=self.read_only)
+        if self.read_only:
+            conn.execute("PRAGMA query_only=1")
+        else:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if self.statement_timer is not None:
+            self.statement_timer.attach(conn)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.max_size:
+                self._created += 1
+                create = True
+            else:
+                self._waits += 1
+                create = False
+
+        if create:
+            try:
+                return self._create_connection()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(
+                f"No database connection available after {self.timeout}s")
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self.statement_timer is not None:
+            self.statement_timer.finish(conn)
+        if self.closed:
+            # 池已关闭（例如只读快照已被替换），借出的连接归还时直接关闭
+            self._close_connection(conn)
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        借出一个连接，退出上下文时自动归还
+
+        Yields:
+            sqlite3.Connection: 已配置好的连接
+        """
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            # 同一线程嵌套借用时复用已持有的连接，由最外层负责归还
+            yield held
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            with self._lock:
+                self._in_use -= 1
+            self._release(conn)
+
+    def stats(self):
+        """
+        返回连接池的统计信息
+
+        Returns:
+            dict: max_size、created、in_use、idle、checkouts、waits
+        """
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+            }
+
+    def close(self):
+        """关闭池中所有空闲连接，仍被借出的连接在归还时关闭"""
+        self.closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close_connection(conn)
+            with self._lock:
+                self._created -= 1
+
+    def _close_connection(self, conn):
+        if self.statement_timer is not None:
+            self.statement_timer.detach(conn)
+        conn.close()
+
+
+def check_sqlite_version(version=sqlite3.sqlite_version_info):
+    """
+    检查SQLite版本是否满足MIN_SQLITE_VERSION
+
+    Raises:
+        RuntimeError: SQLite版本过低
+    """
+    if version < MIN_SQLITE_VERSION:
+        raise RuntimeError(f"SQLite {'.'.join(map(str, MIN_SQLITE_VERSION))} or newer is required, "
+                           f"found {'.'.join(map(str, version))}")
+
 
 class Database:
-    def __init__(self, db_file="contacts.db"):
+    def __init__(self, db_file="contacts.db", pool_size=5, statement_timer=None):
+        check_sqlite_version()
         self.db_file = db_file
+        self.pool = ConnectionPool(db_file, max_size=pool_size, statement_timer=statement_timer)
+        self.fts_enabled = False
+        self.migrations = []
+        self._generation = 0
+        self._generation_lock = threading.Lock()
         self.init_db()
 
+    def pool_stats(self):
+        return self.pool.stats()
+
+    def close(self):
+        """关闭连接池"""
+        self.pool.close()
+
+    @property
+    def generation(self):
+        """
+        数据版本号，每次写入提交后加一，缓存据此判断数据是否已变化
+        """
+        return self._generation
+
+    def _bump_generation(self):
+        with self._generation_lock:
+            self._generation += 1
+
     def init_db(self):
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-
-        # 检查当前表结构
-        cursor.execute("PRAGMA table_info(contacts)")
-        columns = [column[1] for column in cursor.fetchall()]
-
-        # 如果表不存在或字段不完整，则创建或修改表
-        if not columns:
-            # 创建全新的表
-            cursor.execute("""
-                CREATE TABLE contacts (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    first_name TEXT NOT NULL,
-                    last_name TEXT NOT NULL,
-                    category TEXT,
-                    phone_number TEXT,
-                    email TEXT,
-                    address TEXT,
-                    institution TEXT,
-                    is_starred INTEGER DEFAULT 0,
-                    UNIQUE(first_name, last_name)
-                )
-            """)
-        else:
-            # 表已存在，检查并添加缺失的字段
-            if 'first_name' not in columns or 'last_name' not in columns:
-                # 需要从name字段拆分first_name和last_name
-                # 创建临时表
-                cursor.execute("""
-                    CREATE TABLE contacts_temp (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        first_name TEXT NOT NULL,
-                        last_name TEXT NOT NULL,
-                        category TEXT,
-                        phone_number TEXT,
-                        email TEXT,
-                        address TEXT,
-                        institution TEXT,
-                        is_starred INTEGER DEFAULT 0,
-                        UNIQUE(first_name, last_name)
-                    )
-                """)
-
-                # 从原表复制数据并拆分姓名
-                cursor.execute("SELECT name, phone_number, email, address FROM contacts")
-                rows = cursor.fetchall()
-
-                for row in rows:
-                    full_name = row[0]
-                    # 简单拆分姓名，实际应用中可能需要更复杂的逻辑
-                    name_parts = full_name.split(' ', 1)
-                    if len(name_parts) == 1:
-                        first_name = name_parts[0]
-                        last_name = ''
-                    else:
-                        first_name = name_parts[0]
-                        last_name = name_parts[1]
-
-                    cursor.execute(
-                        "INSERT INTO contacts_temp (first_name, last_name, category, phone_number, email, address, institution, is_starred) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                        (first_name, last_name, '', row[1], row[2], row[3], '', 0)
-                    )
-
-                # 删除原表并重命名临时表
-                cursor.execute("DROP TABLE contacts")
-                cursor.execute("ALTER TABLE contacts_temp RENAME TO contacts")
-
-            # 添加category字段（如果不存在）
-            if 'category' not in columns:
-                cursor.execute("ALTER TABLE contacts ADD COLUMN category TEXT")
-            
-            # 添加institution字段（如果不存在）
-            if 'institution' not in columns:
-                cursor.execute("ALTER TABLE contacts ADD COLUMN institution TEXT")
-            
-            # 添加is_starred字段（如果不存在）
-            if 'is_starred' not in columns:
-                cursor.execute("ALTER TABLE contacts ADD COLUMN is_starred INTEGER DEFAULT 0")
-
-        conn.commit()
-        conn.close()
+        """
+        执行尚未应用的schema迁移，并检查全文索引是否可用
+
+        两张FTS5表都存在时才启用全文搜索。之前因SQLite不支持而跳过的全文索引
+        在每次启动时重试，换用支持FTS5的SQLite后会自动建立。其他工具插入的
+        联系人没有name_key，也在启动时补上。
+        """
+        with self.pool.connection() as conn:
+            self.migrations = migrate(conn)
+            filled = fill_name_keys(conn.cursor())
+            conn.commit()
+            if filled:
+                logger.info("Name keys filled in for %d contacts.", filled)
+            self.fts_enabled = search_indexes_exist(conn.cursor())
+            if not self.fts_enabled:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self.fts_enabled = search_indexes_exist(conn.cursor()) or create_search_indexes(conn.cursor())
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
 
     def get_all_contacts(self):
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        # 按is_starred降序排序，让星标联系人优先显示
-        cursor.execute('SELECT first_name, last_name, category, phone_number, email, address, institution, is_starred FROM contacts ORDER BY is_starred DESC')
-        rows = cursor.fetchall()
-        conn.close()
+        with self.pool.connection() as conn:
+            cursor = contact_cursor(conn)
+            # 按is_starred降序排序，让星标联系人优先显示
+            cursor.execute(f'SELECT {RECORD_COLUMNS} FROM contacts ORDER BY is_starred DESC, first_name, last_name')
+            return cursor.fetchall()
+
+    def get_contacts_page(self, limit, cursor=None, sort='starred', order='asc', category=None):
+        """
+        使用键集（keyset）分页获取一页联系人
+
+        游标记录上一页最后一行的排序键，下一页从该位置之后的索引范围开始读取，
+        因此无论翻到第几页，代价都与第一页相同。
+
+        Args:
+            limit (int): 每页条数
+            cursor (str): 上一页返回的next_cursor，None表示第一页
+            sort (str): 排序方式，name、category或starred
+            order (str): asc或desc
+            category (str): 只返回该分组的联系人，None表示不过滤
+
+        Returns:
+            tuple: (ContactRecord列表, 下一页游标或None)
+
+        Raises:
+            ValueError: 排序参数或游标无效
+        """
+        if sort not in PAGE_SORTS:
+            raise ValueError(f"Unsupported sort '{sort}', expected one of {', '.join(PAGE_SORTS)}")
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"Unsupported order '{order}', expected asc or desc")
+
+        lead, lead_direction = PAGE_SORTS[sort]
+        after = decode_cursor(cursor, sort, order, 2 if lead is None else 3) if cursor else None
+
+        # desc时所有字段的方向整体反转
+        flip = {'ASC': 'DESC', 'DESC': 'ASC'}
+        name_direction = 'ASC' if order == 'asc' else 'DESC'
+        if lead is not None and order == 'desc':
+            lead_direction = flip[lead_direction]
+        compare = {'ASC': '>', 'DESC': '<'}
+
+        order_by = [f"first_name {name_direction}", f"last_name {name_direction}"]
+        if lead is not None:
+            order_by.insert(0, f"{lead} {lead_direction}")
+
+        base_where, base_params = [], []
+        if category is not None:
+            base_where.append("IFNULL(category, '') = ?")
+            base_params.append(category)
+
+        # 每一步都是一次索引范围查找：先读完游标所在的首字段分区，再继续后面的分区
+        steps = []
+        if after is None:
+            steps.append(([], []))
+        elif lead is None:
+            steps.append(([f"(first_name, last_name) {compare[name_direction]} (?, ?)"], list(after)))
+        else:
+            steps.append(([f"{lead} = ?", f"(first_name, last_name) {compare[name_direction]} (?, ?)"], list(after)))
+            steps.append(([f"{lead} {compare[lead_direction]} ?"], [after[0]]))
+
+        rows = []
+        with self.pool.connection() as conn:
+            for where, params in steps:
+                clauses = base_where + where
+                query = f"SELECT {RECORD_COLUMNS} FROM contacts"
+                if clauses:
+                    query += " WHERE " + " AND ".join(clauses)
+                query += " ORDER BY " + ", ".join(order_by) + " LIMIT ?"
+                rows.extend(contact_cursor(conn).execute(query, base_params + params + [limit + 1 - len(rows)]).fetchall())
+                if len(rows) > limit:
+                    break
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            key = [last.first_name, last.last_name]
+            if sort == 'category':
+                key.insert(0, last.category or '')
+            elif sort == 'starred':
+                key.insert(0, last.is_starred)
+            next_cursor = encode_cursor(sort, order, key)
+
+        return rows, next_cursor
+
+    def iter_contact_batches(self, batch_size=1000, sort='starred', order='asc'):
+        """
+        按批次遍历所有联系人，用于流式导出
+
+        每一批都是一次独立的键集分页查询，只在读取该批时占用连接，
+        因此内存占用与联系人总数无关，也不会长时间占住连接池。
+
+        Yields:
+            list: 每批最多batch_size个ContactRecord
+        """
+        cursor = None
+        while True:
+            contacts, cursor = self.get_contacts_page(batch_size, cursor, sort, order)
+            if contacts:
+                yield contacts
+            if cursor is None:
+                break
+
+    def get_facets(self):
+        """
+        按分组统计联系人数量和其中星标联系人的数量
+
+        直接读取由触发器维护的汇总表contact_facets，耗时只与分组数量有关。
 
-        return [{"first_name": row[0], "last_name": row[1], "category": row[2], "phone_number": row[3], "email": row[4],
-                 "address": row[5], "institution": row[6], "is_starred": bool(row[7])} for row in rows]
+        Returns:
+            list: FacetCount列表，按分组名称排序，没有分组的联系人归入空字符串
+        """
+        with self.pool.connection() as conn:
+            rows = conn.execute("""
+                SELECT category, SUM(count), SUM(CASE WHEN is_starred THEN count ELSE 0 END)
+                FROM contact_facets GROUP BY category ORDER BY category
+            """).fetchall()
+        return [FacetCount._make(row) for row in rows]
+
+    def get_change_seq(self):
+        """
+        返回变更日志中最新的seq，没有任何变更时为0
+        """
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT IFNULL(MAX(seq), 0) FROM contact_changes").fetchone()[0]
+
+    def get_changes(self, since=0, limit=500):
+        """
+        获取seq之后的变更，用于客户端增量同步
+
+        同一个联系人在这段时间内的多次变更只返回最新的一条：插入和修改返回
+        联系人当前的内容，删除返回墓碑（只有id）。结果按seq排列，
+        客户端依次应用后把last_seq作为下一次的since。
+
+        Args:
+            since (int): 客户端已同步到的seq，0表示从头开始
+            limit (int): 最多返回的变更条数
+
+        Returns:
+            tuple: (ContactChange列表, last_seq, 是否还有更多变更)
+        """
+        with self.pool.connection() as conn:
+            # 先确定本次的上界，之后写入的变更留给下一次同步
+            latest = conn.execute("SELECT IFNULL(MAX(seq), 0) FROM contact_changes").fetchone()[0]
+            rows = conn.execute(f"""
+                SELECT ch.seq, ch.op, ch.contact_id, {", ".join("c." + field for field in RECORD_FIELDS)}
+                FROM contact_changes AS ch
+                LEFT JOIN contacts AS c ON c.id = ch.contact_id
+                WHERE ch.seq > ? AND ch.seq <= ?
+                  AND NOT EXISTS (SELECT 1 FROM contact_changes AS later
+                                  WHERE later.contact_id = ch.contact_id AND later.seq > ch.seq AND later.seq <= ?)
+                ORDER BY ch.seq
+                LIMIT ?
+            """, (since, latest, latest, limit + 1)).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        changes = []
+        for seq, op, contact_id, *record in rows:
+            if op == 'delete' or record[0] is None:
+                # 联系人在上界之后被删除时也按删除返回，下一次同步会再收到一次墓碑
+                changes.append(ContactChange(seq, 'delete', contact_id, None))
+            else:
+                changes.append(ContactChange(seq, op, contact_id, ContactRecord._make(record)))
+
+        last_seq = changes[-1].seq if has_more else max(since, latest)
+        return changes, last_seq, has_more
+
+    def get_contact(self, contact_id):
+        """
+        按id获取联系人
+
+        Returns:
+            ContactRecord: 联系人，不存在时为None
+        """
+        with self.pool.connection() as conn:
+            cursor = contact_cursor(conn)
+            cursor.execute(f"SELECT {RECORD_COLUMNS} FROM contacts WHERE id = ?", (contact_id,))
+            return cursor.fetchone()
 
     def add_contact(self, contact_data):
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        """
+        添加联系人
 
-        try:
-            cursor.execute("""
-                INSERT INTO contacts (first_name, last_name, category, phone_number, email, address, institution, is_starred)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (contact_data['first_name'], contact_data['last_name'],
-                  contact_data.get('category', ''), contact_data['phone_number'],
-                  contact_data['email'], contact_data['address'],
-                  contact_data.get('institution', ''), contact_data.get('is_starred', 0)))
-            conn.commit()
-            print(f"Contact {contact_data['first_name']} {contact_data['last_name']} is added successfully.")
-            return True
-        except sqlite3.IntegrityError:
-            print(
-                f"Error: Contact with name '{contact_data['first_name']} {contact_data['last_name']}' already exists.")
-            return False
-        finally:
-            conn.close()
+        Returns:
+            int: 新联系人的id，同名联系人已存在时返回False
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(f"""
+                    INSERT INTO contacts ({', '.join(STORED_FIELDS)}) VALUES ({', '.join('?' * len(STORED_FIELDS))})
+                """, stored_row(contact_row(contact_data)))
+                conn.commit()
+                self._bump_generation()
+                logger.debug("Contact %s %s is added successfully.", contact_data['first_name'], contact_data['last_name'])
+                return cursor.lastrowid
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                logger.debug("Contact with name '%s %s' already exists.", contact_data['first_name'], contact_data['last_name'])
+                return False
 
     def update_contact(self, old_first_name, old_last_name, contact_data):
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        updated = self._update_contact("first_name = ? AND last_name = ?", (old_first_name, old_last_name), contact_data)
+        logger.debug("Contact %s %s updated: %s", old_first_name, old_last_name, updated)
+        return updated
 
-        try:
-            cursor.execute("""
-                UPDATE contacts
-                SET first_name = ?, last_name = ?, category = ?, phone_number = ?, email = ?, address = ?, institution = ?, is_starred = ?
-                WHERE first_name = ? AND last_name = ?
-            """, (contact_data['first_name'], contact_data['last_name'], contact_data.get('category', ''),
-                  contact_data['phone_number'], contact_data['email'], contact_data['address'],
-                  contact_data.get('institution', ''), contact_data.get('is_starred', 0),
-                  old_first_name, old_last_name))
+    def update_contact_by_id(self, contact_id, contact_data):
+        """
+        按id更新联系人
+
+        Raises:
+            sqlite3.IntegrityError: 新姓名与其他联系人重复
+        """
+        return self._update_contact("id = ?", (contact_id,), contact_data)
+
+    def _update_contact(self, where, params, contact_data):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute(f"""
+                UPDATE contacts SET {', '.join(f'{field} = ?' for field in STORED_FIELDS)}
+                WHERE {where}
+            """, stored_row(contact_row(contact_data)) + tuple(params))
             conn.commit()
-            print(f"Contact {old_first_name} {old_last_name} is updated successfully.")
+            # 没有匹配的联系人时数据未变，缓存仍然有效
+            if cursor.rowcount > 0:
+                self._bump_generation()
             return cursor.rowcount > 0
-        finally:
-            conn.close()
 
     def delete_contact(self, first_name, last_name):
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        # 添加调试信息
-        print(f"Attempting to delete contact: '{first_name}' '{last_name}'")
-        
-        # 先检查联系人是否存在
-        cursor.execute('SELECT first_name, last_name FROM contacts WHERE first_name=? AND last_name=?', (first_name, last_name))
-        existing = cursor.fetchone()
-        
-        if not existing:
-            print(f"Contact not found: '{first_name}' '{last_name}'")
-            conn.close()
-            return False
-        
-        # 执行删除操作
-        cursor.execute('DELETE FROM contacts WHERE first_name=? AND last_name=?', (first_name, last_name))
-        conn.commit()
-        affected = cursor.rowcount > 0
-        
-        print(f"Delete operation affected {cursor.rowcount} rows")
-        
-        conn.close()
-        return affected
-        
+        logger.debug("Attempting to delete contact: '%s' '%s'", first_name, last_name)
+        return self._delete_contact("first_name = ? AND last_name = ?", (first_name, last_name))
+
+    def delete_contact_by_id(self, contact_id):
+        return self._delete_contact("id = ?", (contact_id,))
+
+    def _delete_contact(self, where, params):
+        # 直接删除，根据影响的行数判断联系人是否存在，不再先查询
+        with self.pool.connection() as conn:
+            cursor = conn.execute(f"DELETE FROM contacts WHERE {where}", params)
+            conn.commit()
+            if cursor.rowcount > 0:
+                self._bump_generation()
+            logger.debug("Delete operation affected %d rows", cursor.rowcount)
+            return cursor.rowcount > 0
+
     # 更新联系人星标状态的方法
     def toggle_starred(self, first_name, last_name):
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        # 先查询当前星标状态
-        cursor.execute('SELECT is_starred FROM contacts WHERE first_name=? AND last_name=?', (first_name, last_name))
-        row = cursor.fetchone()
-        
-        if not row:
-            conn.close()
-            return False
-        
-        # 切换星标状态
-        new_starred = 0 if row[0] else 1
-        cursor.execute('UPDATE contacts SET is_starred=? WHERE first_name=? AND last_name=?', 
-                      (new_starred, first_name, last_name))
-        conn.commit()
-        conn.close()
-        return True
+        return self._toggle_starred("first_name = ? AND last_name = ?", (first_name, last_name)) is not None
+
+    def toggle_starred_by_id(self, contact_id):
+        """
+        按id切换星标状态
+
+        Returns:
+            bool: 切换后的星标状态，联系人不存在时为None
+        """
+        return self._toggle_starred("id = ?", (contact_id,))
+
+    def _toggle_starred(self, where, params):
+        # 由一条UPDATE在SQLite中完成切换，不经过Python读取旧值，并发切换不会丢失。
+        # 新状态在同一事务中读回：UPDATE ... RETURNING需要SQLite 3.35，高于MIN_SQLITE_VERSION
+        with self.pool.connection() as conn:
+            try:
+                cursor = conn.execute(f"UPDATE contacts SET is_starred = IFNULL(is_starred, 0) = 0 WHERE {where}", params)
+                if cursor.rowcount == 0:
+                    conn.rollback()
+                    return None
+                starred = conn.execute(f"SELECT is_starred FROM contacts WHERE {where}", params).fetchone()[0]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        self._bump_generation()
+        return bool(starred)
+
+    def apply_batch(self, operations):
+        """
+        在一个事务中执行一组混合的修改操作
+
+        操作按顺序执行，连续的同类操作合并为一次executemany；目标联系人是否
+        存在、姓名是否重复等都通过每组一次的批量查询预先判断，从而为每个操作
+        单独给出结果。任何一项失败都不会影响其他项，最后只提交一次。
+
+        支持的操作（目标可以是id，也可以是first_name加last_name）：
+            {"op": "add", "contact": {...}}
+            {"op": "update", "id": 1, "contact": {...}}
+            {"op": "delete", "id": 1}
+            {"op": "star", "id": 1, "is_starred": true}  省略is_starred时切换状态
+
+        Args:
+            operations (list): 操作字典列表
+
+        Returns:
+            list: 与operations一一对应的结果字典，status为ok、not_found、conflict或invalid
+        """
+        results = [None] * len(operations)
+        handlers = {
+            'add': self._batch_add,
+            'update': self._batch_update,
+            'delete': self._batch_delete,
+            'star': self._batch_star,
+        }
+
+        # 按顺序把连续的同类操作分成一组，无效的操作直接给出结果
+        runs = []
+        for index, item in enumerate(operations):
+            error = batch_item_error(item)
+            if error:
+                results[index] = {"index": index, "status": "invalid", "error": error}
+                continue
+            if runs and runs[-1][0] == item['op']:
+                runs[-1][1].append((index, item))
+            else:
+                runs.append((item['op'], [(index, item)]))
+
+        with self.pool.connection() as conn:
+            for op, run in runs:
+                handlers[op](conn, run, results)
+            conn.commit()
+
+        if any(result['status'] == 'ok' for result in results):
+            self._bump_generation()
+        return results
+
+    def _batch_targets(self, conn, run):
+        """
+        批量查询一组操作的目标联系人
+
+        Returns:
+            dict: 操作序号 -> [id, is_starred]，联系人不存在时没有该序号
+        """
+        found = {}
+        by_id = [(index, item['id']) for index, item in run if 'id' in item]
+        by_name = [(index, (item['first_name'], item['last_name'])) for index, item in run if 'id' not in item]
+
+        rows = {}
+        ids = list({contact_id for _, contact_id in by_id})
+        for start in range(0, len(ids), BATCH_LOOKUP_SIZE):
+            chunk = ids[start:start + BATCH_LOOKUP_SIZE]
+            for contact_id, is_starred in conn.execute(
+                    f"SELECT id, is_starred FROM contacts WHERE id IN ({', '.join('?' * len(chunk))})", chunk):
+                rows[contact_id] = (contact_id, is_starred)
+        for index, contact_id in by_id:
+            if contact_id in rows:
+                found[index] = list(rows[contact_id])
+
+        rows = {(first_name, last_name): (contact_id, is_starred)
+                for first_name, last_name, contact_id, is_starred
+                in _select_by_names(conn, "id, is_starred", [name for _, name in by_name])}
+        for index, name in by_name:
+            if name in rows:
+                found[index] = list(rows[name])
+
+        # 同一组中指向同一联系人的操作共享状态
+        shared = {}
+        for index in found:
+            found[index] = shared.setdefault(found[index][0], found[index])
+        return found
+
+    def _batch_add(self, conn, run, results):
+        names = [(item['contact']['first_name'], item['contact']['last_name']) for _, item in run]
+        existing = {(first_name, last_name) for first_name, last_name, _ in _select_by_names(conn, "id", names)}
+
+        rows, added = [], []
+        for (index, item), name in zip(run, names):
+            if name in existing:
+                results[index] = {"index": index, "status": "conflict", "error": f"Contact {name[0]} {name[1]} already exists"}
+                continue
+            existing.add(name)
+            rows.append(stored_row(contact_row(item['contact'])))
+            added.append((index, name))
+
+        conn.executemany(f"""
+            INSERT INTO contacts ({', '.join(STORED_FIELDS)}) VALUES ({', '.join('?' * len(STORED_FIELDS))})
+            ON CONFLICT(first_name, last_name) DO NOTHING
+        """, rows)
+
+        # 取回新增联系人的id
+        ids = {(first_name, last_name): contact_id
+               for first_name, last_name, contact_id in _select_by_names(conn, "id", [name for _, name in added])}
+        for index, name in added:
+            results[index] = {"index": index, "status": "ok", "id": ids.get(name)}
+
+    def _batch_update(self, conn, run, results):
+        # 改名可能与其他联系人冲突，因此逐条执行以便单独报告冲突，但仍在同一事务中
+        targets = self._batch_targets(conn, run)
+        for index, item in run:
+            target = targets.get(index)
+            if target is None:
+                results[index] = {"index": index, "status": "not_found"}
+                continue
+            try:
+                conn.execute(f"""
+                    UPDATE contacts SET {', '.join(f'{field} = ?' for field in STORED_FIELDS)}
+                    WHERE id = ?
+                """, stored_row(contact_row(item['contact'])) + (target[0],))
+            except sqlite3.IntegrityError:
+                contact = item['contact']
+                results[index] = {"index": index, "status": "conflict", "id": target[0],
+                                  "error": f"Contact {contact['first_name']} {contact['last_name']} already exists"}
+                continue
+            target[1] = 1 if item['contact'].get('is_starred') else 0
+            results[index] = {"index": index, "status": "ok", "id": target[0]}
+
+    def _batch_delete(self, conn, run, results):
+        targets = self._batch_targets(conn, run)
+        deleted = set()
+        params = []
+        for index, item in run:
+            target = targets.get(index)
+            if target is None or target[0] in deleted:
+                results[index] = {"index": index, "status": "not_found"}
+                continue
+            deleted.add(target[0])
+            params.append((target[0],))
+            results[index] = {"index": index, "status": "ok", "id": target[0]}
+        conn.executemany("DELETE FROM contacts WHERE id = ?", params)
+
+    def _batch_star(self, conn, run, results):
+        # 切换操作根据预先查询的当前状态换算成设置操作，整组用一条executemany完成
+        targets = self._batch_targets(conn, run)
+        params = []
+        for index, item in run:
+            target = targets.get(index)
+            if target is None:
+                results[index] = {"index": index, "status": "not_found"}
+                continue
+            is_starred = bool(item['is_starred']) if 'is_starred' in item else not target[1]
+            target[1] = int(is_starred)
+            params.append((int(is_starred), target[0]))
+            results[index] = {"index": index, "status": "ok", "id": target[0], "is_starred": is_starred}
+        conn.executemany("UPDATE contacts SET is_starred = ? WHERE id = ?", params)
 
     def bulk_add_contacts(self, contacts_data):
         """
         批量添加联系人以提高性能
+
+        Args:
+            contacts_data (iterable): 联系人字典
+
+        Returns:
+            tuple: (新增数量, 重复联系人姓名列表)
         """
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        added_count = 0
-        duplicate_contacts = []
-        
-        try:
-            for contact_data in contacts_data:
-                try:
-                    cursor.execute("""
-                        INSERT INTO contacts (first_name, last_name, category, phone_number, email, address, institution, is_starred)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (contact_data['first_name'], contact_data['last_name'],
-                          contact_data.get('category', ''), contact_data['phone_number'],
-                          contact_data['email'], contact_data['address'],
-                          contact_data.get('institution', ''), contact_data.get('is_starred', 0)))
-                    added_count += 1
-                except sqlite3.IntegrityError:
-                    # 联系人已存在
-                    duplicate_contacts.append(f"{contact_data['first_name']} {contact_data['last_name']}")
+        return self.bulk_add_rows(contact_row(contact_data) for contact_data in contacts_data)
+
+    def bulk_add_rows(self, rows):
+        """
+        在一个事务中批量添加联系人，重复检测完全在SQL中完成
+
+        先用executemany把数据写入临时表，再用窗口函数一次性找出重复的姓名
+        （库中已存在的，或者同一批中后出现的），最后用INSERT ... SELECT ...
+        ON CONFLICT DO NOTHING整体插入，同名时保留批内第一次出现的记录。
+
+        Args:
+            rows (iterable): 按CONTACT_FIELDS顺序排列的元组，可以是生成器
+
+        Returns:
+            tuple: (新增数量, 重复联系人姓名列表)
+        """
+        with self.pool.connection() as conn:
+            self._load_import_batch(conn, rows)
+            added_count, duplicates = self._insert_import_batch(conn)
+            conn.commit()
+            if added_count > 0:
+                self._bump_generation()
+        return added_count, duplicates
+
+    def bulk_merge_rows(self, rows):
+        """
+        在一个事务中批量导入联系人，并把疑似重复的行合并到已有联系人中
+
+        与已有联系人同名，或者电话号码、邮箱的归一化键相同且姓名相近的行，
+        只用来补全该联系人为空的字段（并在导入行带星标时加上星标），
+        不会覆盖已有的内容，也不会新建联系人。其余的行与bulk_add_rows相同。
+
+        Args:
+            rows (iterable): 按CONTACT_FIELDS顺序排列的元组，可以是生成器
+
+        Returns:
+            tuple: (新增数量, 合并数量, 重复联系人姓名列表)
+        """
+        with self.pool.connection() as conn:
+            self._load_import_batch(conn, rows)
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS import_matches (seq INTEGER PRIMARY KEY, contact_id INTEGER NOT NULL)")
+
+            # 同名的行直接对应已有联系人
+            conn.execute("""
+                INSERT INTO import_matches (seq, contact_id)
+                SELECT b.seq, c.id FROM import_batch AS b
+                JOIN contacts AS c ON c.first_name = b.first_name AND c.last_name = b.last_name
+            """)
+
+            # 其余的行按电话号码和邮箱的归一化键查找候选，再比较姓名
+            candidates = conn.execute(f"""
+                SELECT b.seq, b.first_name, b.last_name, c.id, c.first_name, c.last_name
+                FROM import_batch AS b
+                JOIN contacts AS c ON {phone_key_sql('c.phone_number')} = {phone_key_sql('b.phone_number')}
+                WHERE length({phone_key_sql('b.phone_number')}) = {PHONE_KEY_DIGITS}
+                  AND b.seq NOT IN (SELECT seq FROM import_matches)
+                UNION
+                SELECT b.seq, b.first_name, b.last_name, c.id, c.first_name, c.last_name
+                FROM import_batch AS b
+                JOIN contacts AS c ON {email_key_sql('c.email')} = {email_key_sql('b.email')}
+                WHERE instr({email_key_sql('b.email')}, '@') > 1
+                  AND b.seq NOT IN (SELECT seq FROM import_matches)
+            """).fetchall()
+            matches = {}
+            for seq, first_name, last_name, contact_id, contact_first_name, contact_last_name in candidates:
+                if seq in matches:
                     continue
-                    
+                if same_person(first_name, last_name, contact_first_name, contact_last_name):
+                    matches[seq] = contact_id
+            conn.executemany("INSERT INTO import_matches (seq, contact_id) VALUES (?, ?)", matches.items())
+
+            # 每个联系人用第一条匹配的行补全为空的字段，没有变化时不写入
+            fill_fields = ('category', 'phone_number', 'email', 'address', 'institution')
+            assignments = ", ".join(
+                f"{field} = CASE WHEN IFNULL(contacts.{field}, '') = '' THEN b.{field} ELSE contacts.{field} END"
+                for field in fill_fields)
+            changed = " OR ".join(
+                [f"(IFNULL(contacts.{field}, '') = '' AND IFNULL(b.{field}, '') != '')" for field in fill_fields]
+                + ["b.is_starred > IFNULL(contacts.is_starred, 0)"])
+            filled_count = conn.execute(f"""
+                UPDATE contacts SET {assignments}, is_starred = MAX(IFNULL(contacts.is_starred, 0), b.is_starred)
+                FROM (
+                    SELECT m.contact_id, b.* FROM import_matches AS m JOIN import_batch AS b ON b.seq = m.seq
+                    WHERE m.seq IN (SELECT MIN(seq) FROM import_matches GROUP BY contact_id)
+                ) AS b
+                WHERE contacts.id = b.contact_id AND ({changed})
+            """).rowcount
+
+            merged_count = conn.execute("SELECT COUNT(*) FROM import_matches").fetchone()[0]
+            conn.execute("DELETE FROM import_batch WHERE seq IN (SELECT seq FROM import_matches)")
+            conn.execute("DELETE FROM import_matches")
+            added_count, duplicates = self._insert_import_batch(conn)
             conn.commit()
-            return added_count, duplicate_contacts
-        finally:
-            conn.close()
+            # 匹配但没有补全任何字段的行不改变数据
+            if added_count > 0 or filled_count > 0:
+                self._bump_generation()
+        return added_count, merged_count, duplicates
 
-    def search_contacts(self, search_term):
+    @staticmethod
+    def _load_import_batch(conn, rows):
+        """
+        把待导入的行写入临时表import_batch，seq为行的顺序，同时计算name_key
+        """
+        fields = ", ".join(STORED_FIELDS)
+        conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS import_batch (seq INTEGER PRIMARY KEY, {fields})")
+        conn.executemany(f"INSERT INTO import_batch ({fields}) VALUES ({', '.join('?' * len(STORED_FIELDS))})",
+                         map(stored_row, rows))
+
+    @staticmethod
+    def _insert_import_batch(conn):
+        """
+        找出import_batch中重复的姓名，插入其余的行并清空临时表，不提交事务
+
+        Returns:
+            tuple: (新增数量, 重复联系人姓名列表)
+        """
+        fields = ", ".join(STORED_FIELDS)
+        duplicates = conn.execute("""
+            SELECT first_name, last_name FROM (
+                SELECT seq, first_name, last_name,
+                       ROW_NUMBER() OVER (PARTITION BY first_name, last_name ORDER BY seq) AS occurrence
+                FROM import_batch
+            ) AS b
+            WHERE occurrence > 1
+               OR EXISTS (SELECT 1 FROM contacts AS c WHERE c.first_name = b.first_name AND c.last_name = b.last_name)
+            ORDER BY seq
+        """).fetchall()
+
+        # WHERE true 用于消除 INSERT ... SELECT ... ON CONFLICT 的语法歧义
+        cursor = conn.execute(f"""
+            INSERT INTO contacts ({fields})
+            SELECT {fields} FROM import_batch WHERE true ORDER BY seq
+            ON CONFLICT(first_name, last_name) DO NOTHING
+        """)
+        added_count = cursor.rowcount
+
+        conn.execute("DELETE FROM import_batch")
+        return added_count, [f"{first_name} {last_name}" for first_name, last_name in duplicates]
+
+    def find_duplicates(self, limit=100):
+        """
+        查找疑似重复的联系人，按组返回
+
+        电话号码和邮箱按归一化键分组，直接使用表达式索引；姓名按写入时保存的
+        语音键name_key分块，只比较同一块内的联系人，不需要把所有联系人两两比较。
+        被太多联系人共用的号码和邮箱（总机、公共邮箱）不算作重复。
+
+        Args:
+            limit (int): 最多返回的组数，返回人数最多的组
+
+        Returns:
+            tuple: (DuplicateGroup列表, 重复组的总数)
+        """
+        pairs = []
+        with self.pool.connection() as conn:
+            for reason, key, valid in (
+                    ('phone', phone_key_sql('phone_number'), f"length({phone_key_sql('phone_number')}) = {PHONE_KEY_DIGITS}"),
+                    ('email', email_key_sql('email'), f"instr({email_key_sql('email')}, '@') > 1")):
+                for (ids,) in conn.execute(f"""
+                    SELECT group_concat(id) FROM contacts WHERE {valid}
+                    GROUP BY {key} HAVING COUNT(*) BETWEEN 2 AND ?
+                """, (KEY_GROUP_MAX,)):
+                    ids = [int(contact_id) for contact_id in ids.split(',')]
+                    pairs.extend((ids[0], contact_id, reason) for contact_id in ids[1:])
+
+            # 只读取至少有两个联系人的分块：分组统计和读取都只扫描name_key索引，
+            # 姓名各不相同的大多数联系人不会被读入Python
+            rows = conn.execute("""
+                SELECT id, first_name, last_name, name_key FROM contacts
+                WHERE name_key IN (SELECT name_key FROM contacts GROUP BY name_key HAVING COUNT(*) > 1)
+                ORDER BY name_key
+            """)
+            pairs.extend((a, b, 'name') for a, b, _ in name_pairs(rows))
+
+            groups = group_pairs(pairs)
+            shown = groups[:limit]
+            contacts = {}
+            ids = [contact_id for group_ids, _ in shown for contact_id in group_ids]
+            cursor = contact_cursor(conn)
+            for start in range(0, len(ids), BATCH_LOOKUP_SIZE):
+                chunk = ids[start:start + BATCH_LOOKUP_SIZE]
+                cursor.execute(f"SELECT {RECORD_COLUMNS} FROM contacts WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+                contacts.update((contact.id, contact) for contact in cursor.fetchall())
+
+        return [DuplicateGroup(group_ids, reasons, [contacts[contact_id] for contact_id in group_ids])
+                for group_ids, reasons in shown], len(groups)
+
+    def find_matches(self, contact_data, limit=10):
+        """
+        查找与一个（通常是即将添加的）联系人疑似重复的已有联系人
+
+        候选来自电话号码和邮箱归一化键的索引、姓名分块键name_key的索引，以及全文
+        索引中名相同且姓的首字母相同、或姓相同且名的首字母相同的联系人，
+        再在Python中比较姓名。
+
+        Args:
+            contact_data (dict): first_name、last_name，可选phone_number和email
+            limit (int): 最多返回的条数
+
+        Returns:
+            list: DuplicateMatch列表，匹配理由多、姓名更相近的排在前面
+        """
+        params = {
+            'first_name': contact_data.get('first_name') or '',
+            'last_name': contact_data.get('last_name') or '',
+            'phone_number': contact_data.get('phone_number') or '',
+            'email': contact_data.get('email') or '',
+            'limit': MATCH_CANDIDATES_MAX,
+        }
+        params['name_key'] = name_key(params['first_name'], params['last_name'])
+        candidates = [
+            f"""SELECT id FROM contacts WHERE {phone_key_sql('phone_number')} = {phone_key_sql(':phone_number')}
+                AND length({phone_key_sql(':phone_number')}) = {PHONE_KEY_DIGITS}""",
+            f"""SELECT id FROM contacts WHERE {email_key_sql('email')} = {email_key_sql(':email')}
+                AND instr({email_key_sql(':email')}, '@') > 1""",
+            "SELECT id FROM contacts WHERE first_name = :first_name AND last_name = :last_name",
+            "SELECT id FROM contacts WHERE name_key = :name_key",
+        ]
+        names = self._match_names_query(params['first_name'], params['last_name'])
+        if names:
+            candidates.append("SELECT rowid FROM contacts_fts WHERE contacts_fts MATCH :names")
+            params['names'] = names
+
+        query = f"""
+            SELECT {RECORD_COLUMNS}, {phone_key_sql('phone_number')}, {email_key_sql('email')},
+                   {phone_key_sql(':phone_number')}, {email_key_sql(':email')}
+            FROM contacts WHERE id IN (SELECT id FROM ({" UNION ".join(candidates)}) LIMIT :limit)
+        """
+        with self.pool.connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        matches = []
+        for row in rows:
+            phone_key, email_key, new_phone_key, new_email_key = row[len(RECORD_FIELDS):]
+            match = duplicate_match(params['first_name'], params['last_name'], new_phone_key, new_email_key,
+                                    ContactRecord._make(row[:len(RECORD_FIELDS)]), phone_key, email_key)
+            if match is not None:
+                matches.append(match)
+        return rank_matches(matches, limit)
+
+    def _match_names_query(self, first_name, last_name):
+        """
+        全文索引查询：名相同且姓的首字母相同，或者姓相同且名的首字母相同。
+        不支持FTS5或姓名为空时返回None
+        """
+        # 完整的词交给FTS5分词器处理（去掉音调、拆分O'Brien），首字母取归一化后的
+        first, last = first_name.split(), last_name.split()
+        first_initial, last_initial = normalize_name(first_name)[:1], normalize_name(last_name)[:1]
+        if not self.fts_enabled or not first_initial or not last_initial:
+            return None
+
+        def quote(token):
+            return '"' + token.replace('"', '""') + '"'
+
+        return (f"(first_name : {quote(first[0])} AND last_name : {quote(last_initial)}*) OR "
+                f"(last_name : {quote(last[0])} AND first_name : {quote(first_initial)}*)")
+
+    def search_contacts(self, search_term, limit=None):
         """
         搜索联系人，在所有字段中查找匹配的关键词
+
+        支持FTS5时使用全文索引：按词前缀匹配的结果优先，其次是trigram子串匹配，
+        同一层级内按bm25相关度排序，星标联系人始终排在最前面。
+
+        Args:
+            search_term (str): 搜索关键词，多个词之间为AND关系
+            limit (int): 最多返回的条数，None表示不限制
+
+        Returns:
+            list: ContactRecord列表
         """
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        # 构建SQL查询，在所有文本字段中搜索
-        query = """
-            SELECT first_name, last_name, category, phone_number, email, address, institution, is_starred 
-            FROM contacts 
-            WHERE first_name LIKE ? OR last_name LIKE ? OR category LIKE ? OR phone_number LIKE ? OR email LIKE ? OR address LIKE ? OR institution LIKE ?
-            ORDER BY is_starred DESC
-        """
-        
-        # 使用%进行模糊匹配
-        search_pattern = f'%{search_term}%'
-        cursor.execute(query, (search_pattern, search_pattern, search_pattern, search_pattern, search_pattern, search_pattern, search_pattern))
-        rows = cursor.fetchall()
-        conn.close()
+        terms = search_term.split()
+        if not terms:
+            return []
+        if not self.fts_enabled:
+            return self._search_contacts_like(search_term, limit)
+
+        # 每个词作为带前缀通配的短语，双引号需要转义
+        quoted = ['"' + term.replace('"', '""') + '"' for term in terms]
+        hits = ["""
+            SELECT rowid, 0 AS tier, bm25(contacts_fts, {weights}) AS score
+            FROM contacts_fts WHERE contacts_fts MATCH ?
+        """.format(weights=", ".join(str(w) for w in SEARCH_WEIGHTS))]
+        params = [" AND ".join(q + "*" for q in quoted)]
+
+        # trigram只能匹配长度不小于3的子串
+        if all(len(term) >= 3 for term in terms):
+            hits.append("""
+                SELECT rowid, 1 AS tier, bm25(contacts_trigram) AS score
+                FROM contacts_trigram WHERE contacts_trigram MATCH ?
+            """)
+            params.append(" AND ".join(quoted))
+
+        # LIMIT -1不限制行数，只是阻止SQLite把hits展开到外层的GROUP BY中，
+        # 否则bm25()会在聚合中调用而报错（MATERIALIZED需要SQLite 3.35）
+        query = f"""
+            WITH hits AS ({" UNION ALL ".join(hits)} LIMIT -1)
+            SELECT c.id, c.first_name, c.last_name, c.category, c.phone_number, c.email, c.address, c.institution, c.is_starred
+            FROM (SELECT rowid, MIN(tier) AS tier, MIN(score) AS score FROM hits GROUP BY rowid) AS h
+            JOIN contacts AS c ON c.id = h.rowid
+            ORDER BY c.is_starred DESC, h.tier, h.score
+        """
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+
+        with self.pool.connection() as conn:
+            return contact_cursor(conn).execute(query, params).fetchall()
+
+    def _search_contacts_like(self, search_term, limit=None):
+        """
+        不支持FTS5时的后备搜索，使用LIKE在所有文本字段中查找
+        """
+        with self.pool.connection() as conn:
+            cursor = contact_cursor(conn)
+
+            # 构建SQL查询，在所有文本字段中搜索
+            query = """
+                SELECT id, first_name, last_name, category, phone_number, email, address, institution, is_starred
+                FROM contacts
+                WHERE first_name LIKE ? OR last_name LIKE ? OR category LIKE ? OR phone_number LIKE ? OR email LIKE ? OR address LIKE ? OR institution LIKE ?
+                ORDER BY is_starred DESC
+            """
+
+            # 使用%进行模糊匹配
+            search_pattern = f'%{search_term}%'
+            params = [search_pattern] * len(SEARCH_COLUMNS)
+            if limit is not None:
+                query += " LIMIT ?"
+                params.append(int(limit))
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+
+class ReadReplica(Database):
+    """
+    主库的只读副本，与Database有相同的读方法，用于分担读请求。
+
+    默认以mode=ro的URI打开同一个数据库文件，并使用更大的mmap，页面直接
+    从操作系统的页缓存映射读取；WAL模式下每个读事务都能看到主库最新提交的
+    数据，包括其他进程的写入。in_memory为True时，用sqlite3的backup API把
+    数据库复制到一个共享缓存的内存数据库，所有读连接共享这一份快照。
+
+    后台线程每隔refresh_interval秒检查一次主库的PRAGMA data_version，读取
+    本身不做检查也不加锁。发现新的提交时，文件模式下只增加generation，使
+    响应缓存失效；内存模式下重新复制快照，因此读取最多落后主库这么久。
+    副本的连接设置了query_only，调用写方法会抛出sqlite3.OperationalError。
+    """
+
+    _snapshot_ids = itertools.count(1)
+
+    def __init__(self, db_file="contacts.db", pool_size=5, statement_timer=None,
+                 in_memory=False, refresh_interval=REPLICA_REFRESH_INTERVAL, mmap_size=REPLICA_MMAP_SIZE):
+        self.db_file = db_file
+        self.pool_size = pool_size
+        self.statement_timer = statement_timer
+        self.in_memory = in_memory
+        self.refresh_interval = refresh_interval
+        self.mmap_size = mmap_size
+        self.fts_enabled = False
+        self.migrations = []
+        self.refreshes = 0
+        self._generation = 0
+        self._generation_lock = threading.Lock()
+        self._refresh_lock = threading.RLock()
+        self._source_uri = f"{pathlib.Path(db_file).resolve().as_uri()}?mode=ro"
+
+        # 专门用于检查data_version的连接，其他连接的每次提交都会改变它的返回值
+        self._watch = sqlite3.connect(self._source_uri, uri=True, check_same_thread=False)
+        self._version = self._data_version()
+        self._keeper = None
+        self._pool = self._open_pool()
+        self.init_db()
+
+        self._closed = threading.Event()
+        self._watcher = threading.Thread(target=self._watch_changes, name="replica-watch", daemon=True)
+        self._watcher.start()
+
+    @property
+    def pool(self):
+        """
+        当前快照的连接池
+        """
+        return self._pool
+
+    @property
+    def generation(self):
+        """
+        副本的数据版本号，后台线程发现主库有新的提交时加一
+        """
+        return self._generation
+
+    def init_db(self):
+        """
+        只读副本不执行迁移，只检查全文索引是否可用
+        """
+        with self._pool.connection() as conn:
+            self.fts_enabled = search_indexes_exist(conn.cursor())
+
+    def _data_version(self):
+        return self._watch.execute("PRAGMA data_version").fetchone()[0]
+
+    def _open_pool(self):
+        """
+        文件模式下直接以只读方式打开数据库文件；内存模式下先把数据库复制到
+        一个新的共享缓存内存数据库，由self._keeper连接保持其存活
+        """
+        if not self.in_memory:
+            return ConnectionPool(self._source_uri, max_size=self.pool_size, mmap_size=self.mmap_size,
+                                  statement_timer=self.statement_timer, read_only=True)
+
+        snapshot_uri = f"file:contacts-replica-{id(self)}-{next(self._snapshot_ids)}?mode=memory&cache=shared"
+        keeper = sqlite3.connect(snapshot_uri, uri=True, check_same_thread=False)
+        source = sqlite3.connect(self._source_uri, uri=True)
+        try:
+            source.backup(keeper)
+        finally:
+            source.close()
+        self._keeper, old_keeper = keeper, self._keeper
+        if old_keeper is not None:
+            # 旧快照仍被借出的连接会让它继续存活，直到这些连接归还
+            old_keeper.close()
+        return ConnectionPool(snapshot_uri, max_size=self.pool_size, statement_timer=self.statement_timer,
+                              read_only=True)
+
+    def _watch_changes(self):
+        """
+        后台线程：每隔refresh_interval秒与主库同步一次，直到副本关闭
+        """
+        while not self._closed.wait(self.refresh_interval):
+            try:
+                self.sync()
+            except sqlite3.Error:
+                logger.exception("Checking %s for new commits failed.", self.db_file)
+
+    def sync(self):
+        """
+        检查主库自上次检查以来是否有新的提交，有则刷新副本
+
+        Returns:
+            bool: 是否执行了刷新
+        """
+        with self._refresh_lock:
+            # 在复制之前记下版本，复制期间的新提交会在下次检查时再次触发刷新
+            version = self._data_version()
+            if version == self._version:
+                return False
+            self._version = version
+            return self.refresh()
+
+    def refresh(self, wait=True):
+        """
+        重新复制内存快照，文件模式下只增加generation
+
+        Args:
+            wait (bool): 其他线程正在刷新时是否等待它完成
+
+        Returns:
+            bool: 是否执行了刷新
+        """
+        if not self._refresh_lock.acquire(blocking=wait):
+            return False
+        try:
+            if self.in_memory:
+                old_pool, self._pool = self._pool, self._open_pool()
+                old_pool.close()
+            self.refreshes += 1
+            self._bump_generation()
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def pool_stats(self):
+        stats = self._pool.stats()
+        stats["refreshes"] = self.refreshes
+        return stats
 
-        return [{"first_name": row[0], "last_name": row[1], "category": row[2], "phone_number": row[3], "email": row[4],
-                 "address": row[5], "institution": row[6], "is_starred": bool(row[7])} for row in rows]
\ No newline at end of file
+    def close(self):
+        """停止后台检查，关闭副本的所有连接"""
+        self._closed.set()
+        self._watcher.join()
+        self._pool.close()
+        if self._keeper is not None:
+            self._keeper.close()
+        self._watch.close()
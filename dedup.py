@@ -0,0 +1,205 @@
+"""
+Fuzzy duplicate detection for contacts.
+
+Contacts are never compared all against all. Phone numbers and emails are
+matched on normalised keys that SQLite indexes (see migrations.py), and
+names are grouped into blocks by a phonetic key, so only contacts in the
+same block are compared. A block that is too large is sorted by name and
+each contact is compared with its next few neighbours only, which bounds the
+work at a fixed number of comparisons per contact. Names in a block are
+confirmed by the overlap of their character bigrams, a set intersection
+that costs about a microsecond per pair.
+"""
+
+import unicodedata
+from functools import lru_cache
+from itertools import combinations, groupby
+from operator import itemgetter
+
+
+# Minimum name similarity (0 to 1) for two contacts in the same phonetic
+# block to be reported as the same person
+NAME_SIMILARITY = 0.75
+
+# With a shared phone number or email a weaker name match is enough,
+# e.g. "Bob Smith" and "Robert Smith"
+MATCH_NAME_SIMILARITY = 0.6
+
+# Blocks up to this size compare all pairs; larger blocks compare each
+# contact with the next BLOCK_WINDOW contacts in name order
+BLOCK_SIZE = 50
+BLOCK_WINDOW = 10
+
+# Phone and email keys shared by more contacts than this belong to a
+# switchboard or a shared inbox rather than to one person
+KEY_GROUP_MAX = 20
+
+_SOUNDEX_CODES = {letter: code
+                  for letters, code in (('bfpv', '1'), ('cgjkqsxz', '2'), ('dt', '3'),
+                                        ('l', '4'), ('mn', '5'), ('r', '6'))
+                  for letter in letters}
+
+
+@lru_cache(maxsize=100_000)
+def normalize_name(name):
+    """
+    Case-fold a name, strip accents and punctuation and collapse whitespace,
+    so that "Zoë O'Brien" and "zoe obrien" compare equal.
+    """
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    letters = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    letters = ''.join(c if c.isalnum() else ' ' if c.isspace() else '' for c in letters.casefold())
+    return ' '.join(letters.split())
+
+
+@lru_cache(maxsize=100_000)
+def soundex(token):
+    """
+    American Soundex code of a normalised token ("john" and "jon" both give
+    J500). Tokens that are not ASCII letters, such as Chinese names or
+    numbers, are returned unchanged.
+    """
+    if not token.isascii() or not token.isalpha():
+        return token
+    code = token[0].upper()
+    previous = _SOUNDEX_CODES.get(token[0])
+    for letter in token[1:]:
+        digit = _SOUNDEX_CODES.get(letter)
+        if digit is not None and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # h and w do not separate letters with the same code, vowels do
+        if letter not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+@lru_cache(maxsize=100_000)
+def phonetic(name):
+    """
+    Soundex codes of the words of a name part.
+    """
+    return ' '.join(map(soundex, normalize_name(name).split()))
+
+
+def name_key(first_name, last_name):
+    """
+    Phonetic blocking key of a name. The two parts are sorted, so a name
+    entered with first and last name swapped lands in the same block.
+    """
+    first, last = phonetic(first_name or ''), phonetic(last_name or '')
+    return f"{first}|{last}" if first <= last else f"{last}|{first}"
+
+
+def name_text(first_name, last_name):
+    """
+    Normalised name with its parts sorted, so that swapped first and last
+    names give the same text.
+    """
+    return ' '.join(sorted(part for part in (normalize_name(first_name), normalize_name(last_name)) if part))
+
+
+def name_grams(first_name, last_name):
+    """
+    Character bigrams of a normalised name.
+    """
+    text = name_text(first_name, last_name)
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def gram_similarity(grams_a, grams_b):
+    """
+    Dice coefficient of two bigram sets, from 0 to 1.
+    """
+    if not grams_a or not grams_b:
+        return 0.0
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+def name_similarity(first_a, last_a, first_b, last_b):
+    """
+    Similarity of two names from 0 to 1: "Jon Smith" and "John Smith" score
+    0.82, "Jane Smith" and "John Smith" 0.56.
+    """
+    return gram_similarity(name_grams(first_a, last_a), name_grams(first_b, last_b))
+
+
+def same_person(first_a, last_a, first_b, last_b, threshold=MATCH_NAME_SIMILARITY):
+    """
+    Whether two names that already share a phone number or email belong to
+    the same person. The phonetic key alone is not enough here: "Jane Smith"
+    and "John Smith" share one, and often a home phone number too.
+    """
+    return name_similarity(first_a, last_a, first_b, last_b) >= threshold
+
+
+def name_pairs(rows, threshold=NAME_SIMILARITY):
+    """
+    Find pairs of contacts with similar names.
+
+    Args:
+        rows (iterable): (id, first_name, last_name, name_key) tuples sorted
+            by name_key
+        threshold (float): Minimum name similarity of a reported pair
+
+    Yields:
+        tuple: (id, id, similarity) of each matching pair
+    """
+    for _, block in groupby(rows, itemgetter(3)):
+        block = list(block)
+        if len(block) < 2:
+            continue
+        if len(block) > BLOCK_SIZE:
+            block.sort(key=lambda row: name_text(row[1], row[2]))
+        grams = [name_grams(row[1], row[2]) for row in block]
+        if len(block) <= BLOCK_SIZE:
+            candidates = combinations(range(len(block)), 2)
+        else:
+            candidates = ((i, j) for i in range(len(block))
+                          for j in range(i + 1, min(len(block), i + 1 + BLOCK_WINDOW)))
+        for i, j in candidates:
+            similarity = gram_similarity(grams[i], grams[j])
+            if similarity >= threshold:
+                yield block[i][0], block[j][0], similarity
+
+
+def group_pairs(pairs):
+    """
+    Merge matching pairs into groups of contacts that are all duplicates of
+    each other, directly or through another member.
+
+    Args:
+        pairs (iterable): (id, id, reason) tuples
+
+    Returns:
+        list: (ids, reasons) tuples with sorted lists, largest group first
+    """
+    parent = {}
+
+    def find(contact_id):
+        root = parent.setdefault(contact_id, contact_id)
+        while root != parent[root]:
+            root = parent[root]
+        while parent[contact_id] != root:
+            parent[contact_id], contact_id = root, parent[contact_id]
+        return root
+
+    reasons = []
+    for a, b, reason in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+        reasons.append((a, reason))
+
+    groups = {}
+    for contact_id in parent:
+        groups.setdefault(find(contact_id), []).append(contact_id)
+    group_reasons = {root: set() for root in groups}
+    for contact_id, reason in reasons:
+        group_reasons[find(contact_id)].add(reason)
+
+    return sorted(((sorted(ids), sorted(group_reasons[root])) for root, ids in groups.items()),
+                  key=lambda group: (-len(group[0]), group[0][0]))
@@ -0,0 +1,171 @@
+"""
+In-process publish/subscribe of contact changes for Server-Sent Events.
+
+Every connected client owns a bounded queue. Publishing never blocks: when a
+client reads too slowly and its queue is full, the queued events are
+replaced by a single resync marker, and the client catches up through
+/contacts/changes instead. Memory per client therefore stays bounded no
+matter how fast contacts change.
+"""
+
+import queue
+import threading
+
+from serialization import change_json
+
+
+# Number of events queued per client before it is asked to resync
+EVENT_QUEUE_SIZE = 256
+
+# Seconds without events after which a keep-alive comment is sent
+EVENT_KEEPALIVE = 15.0
+
+
+class Event:
+    """
+    One server-sent event.
+
+    Attributes:
+        name (str): Event type, contact or resync
+        data (str): JSON payload
+        id (int): Change sequence number, sent as the SSE id
+    """
+
+    __slots__ = ('name', 'data', 'id')
+
+    def __init__(self, name, data, event_id=None):
+        self.name = name
+        self.data = data
+        self.id = event_id
+
+    def encode(self):
+        """
+        Returns:
+            str: The event in text/event-stream format
+        """
+        lines = []
+        if self.id is not None:
+            lines.append(f"id: {self.id}")
+        lines.append(f"event: {self.name}")
+        lines.append(f"data: {self.data}")
+        return "\n".join(lines) + "\n\n"
+
+
+# Tells a client to fetch what it missed from /contacts/changes
+RESYNC = Event('resync', '{}')
+
+
+def change_event(change):
+    """
+    Build the event for one entry of the change log.
+
+    Args:
+        change (ContactChange): Entry returned by Database.get_changes
+
+    Returns:
+        Event: contact event whose id is the change sequence number
+    """
+    return Event('contact', change_json(change), change.seq)
+
+
+class Subscription:
+    """
+    Bounded queue of events for one client.
+
+    Args:
+        maxsize (int): Number of events kept before the client must resync
+        notify (callable): Called after each queued event, used by the ASGI
+            stream to wake its coroutine instead of blocking a thread
+    """
+
+    def __init__(self, maxsize=EVENT_QUEUE_SIZE, notify=None):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.notify = notify
+        self.dropped = 0
+
+    def put(self, event):
+        """
+        Queue an event without blocking. A full queue is emptied and a
+        resync marker queued in its place.
+        """
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                while True:
+                    try:
+                        self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self.dropped += 1
+                self.dropped += 1
+                self._queue.put_nowait(RESYNC)
+        if self.notify is not None:
+            self.notify()
+
+    def get(self, timeout=EVENT_KEEPALIVE):
+        """
+        Wait for the next event.
+
+        Returns:
+            Event: The event, or None if nothing arrived within timeout
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get_nowait(self):
+        """
+        Returns:
+            Event: The next queued event, or None if the queue is empty
+        """
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+
+class EventBroker:
+    """
+    Fans events out to every subscribed client.
+
+    Args:
+        queue_size (int): Size of each client's queue
+    """
+
+    def __init__(self, queue_size=EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, notify=None):
+        subscription = Subscription(self.queue_size, notify)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "published": self.published,
+                "dropped": sum(subscription.dropped for subscription in self._subscribers),
+            }
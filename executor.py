@@ -0,0 +1,146 @@
+"""
+Dedicated thread pools for Database calls.
+
+Writes run one at a time on a single writer thread, so they never wait on
+SQLite's write lock behind each other, and reads run on a small bounded pool
+next to it. Web request threads only wait for the result. A long import is a
+series of writer tasks and a streamed export a series of reader tasks, so
+small requests queue between their chunks instead of behind the whole job.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Database methods that modify data and therefore run on the writer thread
+WRITE_METHODS = frozenset((
+    'init_db', 'add_contact', 'update_contact', 'update_contact_by_id', 'delete_contact', 'delete_contact_by_id',
+    'toggle_starred', 'toggle_starred_by_id', 'apply_batch', 'bulk_add_contacts', 'bulk_add_rows', 'bulk_merge_rows',
+))
+
+# Reader threads for backends without a connection pool to size them by
+DEFAULT_READERS = 4
+
+# Methods cheap enough to run directly on the calling thread
+DIRECT_METHODS = frozenset(('pool_stats',))
+
+
+class DatabaseExecutor:
+    """
+    Runs the methods of a Database on one writer thread and a bounded pool of
+    reader threads, with the same interface as the Database itself.
+
+    Calls made from one of the executor's own threads run directly, so
+    database code can call other database methods without deadlocking.
+
+    Args:
+        db (Database): Database whose methods are run
+        readers (int): Number of reader threads, by default one less than
+            the connection pool so the writer always has a connection, or
+            DEFAULT_READERS for backends without one
+        observer (callable): Called after each call with the method name,
+            seconds queued, seconds running, the result and the exception
+            raised, if any
+    """
+
+    def __init__(self, db, readers=None, observer=None):
+        self.db = db
+        pool = getattr(db, 'pool', None)
+        self.readers = readers or (max(1, pool.max_size - 1) if pool is not None else DEFAULT_READERS)
+        self.observer = observer
+        self._local = threading.local()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer',
+                                          initializer=self._mark_worker)
+        self._reader = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix='db-reader',
+                                          initializer=self._mark_worker)
+        self._lock = threading.Lock()
+        self._pending = {'read': 0, 'write': 0}
+        self._completed = {'read': 0, 'write': 0}
+
+    def _mark_worker(self):
+        self._local.worker = True
+
+    def __getattr__(self, name):
+        attribute = getattr(self.db, name)
+        if not callable(attribute) or name in DIRECT_METHODS:
+            return attribute
+
+        kind = 'write' if name in WRITE_METHODS else 'read'
+
+        def call(*args, **kwargs):
+            return self.run(kind, attribute, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    def run(self, kind, function, *args, **kwargs):
+        """
+        Run function on the writer or a reader thread and wait for its result.
+
+        Args:
+            kind (str): read or write
+            function (callable): Function to run
+
+        Returns:
+            The function's return value; its exceptions are re-raised here
+        """
+        if getattr(self._local, 'worker', False):
+            return function(*args, **kwargs)
+
+        executor = self._writer if kind == 'write' else self._reader
+        submitted = time.perf_counter()
+
+        def call():
+            started = time.perf_counter()
+            result = error = None
+            try:
+                result = function(*args, **kwargs)
+                return result
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                if self.observer is not None:
+                    self.observer(function.__name__, started - submitted, time.perf_counter() - started, result, error)
+
+        with self._lock:
+            self._pending[kind] += 1
+        try:
+            return executor.submit(call).result()
+        finally:
+            with self._lock:
+                self._pending[kind] -= 1
+                self._completed[kind] += 1
+
+    def iter_contact_batches(self, batch_size=1000, sort='starred', order='asc'):
+        """
+        Same as Database.iter_contact_batches, with each batch read as its
+        own reader task so other requests are served in between.
+        """
+        cursor = None
+        while True:
+            contacts, cursor = self.get_contacts_page(batch_size, cursor, sort, order)
+            if contacts:
+                yield contacts
+            if cursor is None:
+                break
+
+    def stats(self):
+        """
+        Returns:
+            dict: Thread counts, and calls waiting or running and completed per kind
+        """
+        with self._lock:
+            return {
+                "readers": self.readers,
+                "writers": 1,
+                "pending_reads": self._pending['read'],
+                "pending_writes": self._pending['write'],
+                "completed_reads": self._completed['read'],
+                "completed_writes": self._completed['write'],
+            }
+
+    def shutdown(self):
+        self._writer.shutdown(wait=True)
+        self._reader.shutdown(wait=True)
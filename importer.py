@@ -0,0 +1,451 @@
+"""
+Bulk import of contacts from Excel files.
+
+Sheets are read in chunks (openpyxl read-only mode for .xlsx), every chunk
+is validated and normalised column-wise with pandas, and the resulting rows
+are streamed into Database.bulk_add_rows, which detects duplicates in SQL
+and inserts everything in a single transaction. In merge mode rows go to
+Database.bulk_merge_rows instead, which folds rows matching an existing
+contact into it.
+
+import_files() takes several workbooks or zip archives of them and parses
+all their sheets in parallel worker processes, while the calling thread
+remains the only writer.
+"""
+
+import multiprocessing
+import os
+import tempfile
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+
+import pandas as pd
+from openpyxl import load_workbook
+
+
+# Number of columns an import sheet must have:
+# Starred, First Name, Last Name, Category, Institution, Phone Number, Email, Address
+IMPORT_COLUMNS = 8
+
+# Number of sheet rows parsed and normalised at a time
+IMPORT_CHUNK_SIZE = 5000
+
+# File types accepted by import_files; zip archives may contain the others
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+ARCHIVE_EXTENSIONS = ('.zip',)
+
+# Worker processes parsing sheets for import_files
+IMPORT_PROCESSES = os.cpu_count() or 1
+
+# Rows written per transaction by import_files
+IMPORT_WRITE_BATCH = 50_000
+
+# Largest total uncompressed size of the workbooks in one zip archive
+IMPORT_ARCHIVE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Bytes decompressed at a time while extracting an archive member
+ARCHIVE_READ_SIZE = 1024 * 1024
+
+
+class ImportStats:
+    """
+    Counters collected while an import runs.
+
+    Attributes:
+        parsed (int): Non-empty rows read from the sheet
+        invalid (int): Rows rejected because both names are empty
+        imported (int): Contacts inserted into the database
+        merged (int): Rows merged into an existing contact (merge mode only)
+        duplicates (int): Rows skipped because the name already exists
+        filename (str): File the counters belong to, for per-file stats
+        errors (list): Sheets or files that could not be imported, per-file stats only
+        files (list): ImportStats of each file, when several were imported
+    """
+
+    COUNTERS = ('parsed', 'invalid', 'imported', 'merged', 'duplicates')
+
+    def __init__(self, filename=None):
+        self.parsed = 0
+        self.invalid = 0
+        self.imported = 0
+        self.merged = 0
+        self.duplicates = 0
+        self.filename = filename
+        self.errors = []
+        self.files = []
+
+    def add(self, other):
+        """
+        Add the counters of another ImportStats to these.
+        """
+        for counter in self.COUNTERS:
+            setattr(self, counter, getattr(self, counter) + getattr(other, counter))
+
+    def to_dict(self):
+        result = {
+            "parsed": self.parsed,
+            "invalid": self.invalid,
+            "imported": self.imported,
+            "merged": self.merged,
+            "duplicates": self.duplicates,
+        }
+        if self.filename is not None:
+            result["filename"] = self.filename
+            result["errors"] = list(self.errors)
+        if self.files:
+            result["files"] = [file_stats.to_dict() for file_stats in self.files]
+        return result
+
+
+def read_excel_chunks(file, filename, chunk_size=IMPORT_CHUNK_SIZE, sheet=0):
+    """
+    Read one sheet of an Excel file as a sequence of DataFrames.
+
+    .xlsx files are streamed with openpyxl's read-only mode so that only one
+    chunk of rows is held in memory; legacy .xls files are read by pandas in
+    one go.
+
+    Args:
+        file: Path or binary file object
+        filename (str): Original file name, used to pick the reader
+        chunk_size (int): Maximum number of rows per DataFrame
+        sheet (int): Index of the sheet, the first one by default
+
+    Yields:
+        pandas.DataFrame: Raw rows without a header, columns numbered from 0
+    """
+    if not filename.lower().endswith('.xlsx'):
+        yield pd.read_excel(file, header=None, sheet_name=sheet)
+        return
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[sheet].iter_rows(values_only=True)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            yield pd.DataFrame(chunk)
+    finally:
+        workbook.close()
+
+
+def normalise_frame(df, stats):
+    """
+    Validate and normalise one chunk of import rows without per-row loops.
+
+    Args:
+        df (pandas.DataFrame): Raw sheet rows with IMPORT_COLUMNS columns
+        stats (ImportStats): Updated with the parsed and invalid counts
+
+    Returns:
+        list: Tuples in database.CONTACT_FIELDS order
+    """
+    df = df.dropna(how='all')
+    stats.parsed += len(df)
+    if df.empty:
+        return []
+
+    starred = (df[0] == '★').astype(int)
+    text = df.iloc[:, 1:IMPORT_COLUMNS]
+    text = text.where(text.notna(), '').astype(str)
+
+    valid = (text[1] != '') | (text[2] != '')
+    stats.invalid += int((~valid).sum())
+    text = text[valid]
+    starred = starred[valid]
+
+    # Sheet order: Starred, First, Last, Category, Institution, Phone, Email, Address
+    return list(zip(text[1].tolist(), text[2].tolist(), text[3].tolist(),
+                    text[5].tolist(), text[6].tolist(), text[7].tolist(),
+                    text[4].tolist(), starred.tolist()))
+
+
+def iter_import_rows(chunks, stats):
+    """
+    Normalise chunks lazily and yield the valid rows one by one.
+
+    Raises:
+        ValueError: If the sheet does not have exactly IMPORT_COLUMNS columns
+    """
+    for df in chunks:
+        if df.shape[1] != IMPORT_COLUMNS:
+            raise ValueError(f'Excel file must have exactly {IMPORT_COLUMNS} columns, but found {df.shape[1]} columns')
+        yield from normalise_frame(df, stats)
+
+
+def add_rows(db, rows, stats, merge=False):
+    """
+    Write normalised rows with Database.bulk_add_rows, or bulk_merge_rows in
+    merge mode, and add the outcome to stats.
+    """
+    if merge:
+        added_count, merged_count, duplicates = db.bulk_merge_rows(rows)
+        stats.merged += merged_count
+    else:
+        added_count, duplicates = db.bulk_add_rows(rows)
+    stats.imported += added_count
+    stats.duplicates += len(duplicates)
+
+
+def import_excel(db, file, filename, chunk_size=IMPORT_CHUNK_SIZE, merge=False):
+    """
+    Import the first sheet of an Excel file into the database.
+
+    Args:
+        db (Database): Target database
+        file: Path or binary file object
+        filename (str): Original file name
+        chunk_size (int): Rows parsed per chunk
+        merge (bool): Merge rows matching an existing contact into it
+
+    Returns:
+        ImportStats: Final counters of the import
+
+    Raises:
+        ValueError: If the sheet does not have exactly IMPORT_COLUMNS columns
+    """
+    stats = ImportStats()
+    rows = iter_import_rows(read_excel_chunks(file, filename, chunk_size), stats)
+
+    # Validate the column count before a transaction is opened
+    first = next(rows, None)
+    if first is None:
+        return stats
+
+    add_rows(db, chain([first], rows), stats, merge)
+    return stats
+
+
+def import_excel_in_batches(db, file, filename, stats, cancelled=None, chunk_size=IMPORT_CHUNK_SIZE, merge=False):
+    """
+    Import an Excel file committing one transaction per chunk.
+
+    Used by background jobs: the counters in stats reflect rows that are
+    really committed, and the import can stop between two chunks. Duplicates
+    are still detected by Database.bulk_add_rows, including names committed
+    by earlier chunks of the same file.
+
+    Args:
+        db (Database): Target database
+        file: Path or binary file object
+        filename (str): Original file name
+        stats (ImportStats): Counters updated as chunks are committed
+        cancelled (threading.Event): Stops the import when set
+        chunk_size (int): Rows parsed and committed per chunk
+        merge (bool): Merge rows matching an existing contact into it
+
+    Returns:
+        bool: True if the whole file was imported, False if it was cancelled
+
+    Raises:
+        ValueError: If the sheet does not have exactly IMPORT_COLUMNS columns
+    """
+    for df in read_excel_chunks(file, filename, chunk_size):
+        if cancelled is not None and cancelled.is_set():
+            return False
+        if df.shape[1] != IMPORT_COLUMNS:
+            raise ValueError(f'Excel file must have exactly {IMPORT_COLUMNS} columns, but found {df.shape[1]} columns')
+
+        rows = normalise_frame(df, stats)
+        if rows:
+            add_rows(db, rows, stats, merge)
+    return True
+
+
+def sheet_names(path, filename):
+    """
+    Names of the sheets of an Excel file, in workbook order.
+    """
+    if not filename.lower().endswith('.xlsx'):
+        return pd.ExcelFile(path).sheet_names
+    workbook = load_workbook(path, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def parse_sheet(path, filename, sheet, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Read and normalise every row of one sheet. Runs in a worker process of
+    import_files, so it takes a path and returns plain data.
+
+    Returns:
+        tuple: (list of rows in database.CONTACT_FIELDS order, ImportStats
+            with the parsed and invalid counts)
+
+    Raises:
+        ValueError: If the sheet does not have exactly IMPORT_COLUMNS columns
+    """
+    stats = ImportStats()
+    rows = list(iter_import_rows(read_excel_chunks(path, filename, chunk_size, sheet), stats))
+    return rows, stats
+
+
+def expand_archives(sources, directory, max_bytes=IMPORT_ARCHIVE_MAX_BYTES):
+    """
+    Replace zip archives in a list of files by the Excel files they contain.
+
+    Members are extracted under generated names into directory, so paths
+    inside the archive cannot point outside it. Other members are ignored.
+
+    Args:
+        sources (list): (filename, path) pairs
+        directory (str): Where archive members are extracted
+        max_bytes (int): Largest total uncompressed size of the workbooks of
+            one archive, counted while they are extracted since the sizes
+            recorded in the archive can be forged
+
+    Returns:
+        list: (filename, path) pairs of Excel files; an archive member is
+            named archive.zip/member.xlsx
+
+    Raises:
+        ValueError: If an archive is not a zip file or is too large
+    """
+    expanded = []
+    for filename, path in sources:
+        if not filename.lower().endswith(ARCHIVE_EXTENSIONS):
+            expanded.append((filename, path))
+            continue
+        try:
+            archive = zipfile.ZipFile(path)
+        except zipfile.BadZipFile:
+            raise ValueError(f"{filename} is not a valid zip archive")
+        with archive:
+            members = [info for info in archive.infolist()
+                       if not info.is_dir() and info.filename.lower().endswith(EXCEL_EXTENSIONS)
+                       and not os.path.basename(info.filename).startswith(('.', '~$'))]
+            remaining = max_bytes
+            for info in members:
+                target = os.path.join(directory, f"{len(os.listdir(directory))}{os.path.splitext(info.filename)[1].lower()}")
+                try:
+                    with archive.open(info) as member, open(target, 'wb') as output:
+                        # Read at most one byte past the limit, enough to know it was exceeded
+                        while chunk := member.read(min(ARCHIVE_READ_SIZE, remaining + 1)):
+                            remaining -= len(chunk)
+                            if remaining < 0:
+                                raise ValueError(f"{filename} expands to more than {max_bytes // (1024 * 1024)} MB")
+                            output.write(chunk)
+                except (zipfile.BadZipFile, zlib.error, EOFError):
+                    raise ValueError(f"{filename} is not a valid zip archive")
+                expanded.append((f"{filename}/{info.filename}", target))
+    return expanded
+
+
+def _process_pool(processes):
+    # Forked workers start without importing the main module again, which
+    # for app.py would open the database in every worker
+    methods = multiprocessing.get_all_start_methods()
+    return ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('fork' if 'fork' in methods else None))
+
+
+def import_files(db, sources, stats, cancelled=None, merge=False, processes=IMPORT_PROCESSES,
+                 batch_size=IMPORT_WRITE_BATCH):
+    """
+    Import every sheet of several Excel files and zip archives of them.
+
+    Sheets are parsed in parallel by a pool of worker processes, a few
+    sheets ahead of the writer. The calling thread is the only writer: it
+    takes the parsed sheets in file and sheet order, so the first of two
+    rows with the same name wins as in a single file, and commits them in
+    transactions of up to batch_size rows. A sheet or file that cannot be
+    read is recorded in its file's errors and the others are still imported.
+
+    Args:
+        db (Database): Target database
+        sources (list): (filename, path) pairs of .xlsx, .xls and .zip files
+        stats (ImportStats): Totals updated as rows are committed; one
+            ImportStats per Excel file is appended to stats.files
+        cancelled (threading.Event): Stops the import when set
+        merge (bool): Merge rows matching an existing contact into it
+        processes (int): Maximum number of worker processes
+        batch_size (int): Rows committed per transaction
+
+    Returns:
+        bool: True if all files were imported, False if it was cancelled
+
+    Raises:
+        ValueError: If a zip archive is invalid or too large
+    """
+    with tempfile.TemporaryDirectory(prefix='contacts-import-') as directory:
+        tasks = []
+        for filename, path in expand_archives(sources, directory):
+            file_stats = ImportStats(filename)
+            stats.files.append(file_stats)
+            try:
+                names = sheet_names(path, filename)
+            except Exception as e:
+                file_stats.errors.append(f"Cannot read file: {e}")
+                continue
+            tasks.extend((file_stats, path, filename, index, name) for index, name in enumerate(names))
+
+        processes = max(1, min(processes, len(tasks)))
+        pool = _process_pool(processes) if processes > 1 else None
+        try:
+            return _write_sheets(db, tasks, pool, processes, stats, cancelled, merge, batch_size)
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _write_sheets(db, tasks, pool, processes, stats, cancelled, merge, batch_size):
+    """
+    Commit the sheets of import_files in order, keeping up to twice as many
+    sheets as there are workers parsed or being parsed.
+    """
+    def parse(task):
+        _, path, filename, index, _ = task
+        if pool is None:
+            try:
+                return _Result(parse_sheet(path, filename, index))
+            except Exception as e:
+                return _Result(error=e)
+        return pool.submit(parse_sheet, path, filename, index)
+
+    waiting = iter(tasks)
+    in_flight = deque((task, parse(task)) for task in islice(waiting, processes * 2))
+    while in_flight:
+        task, future = in_flight.popleft()
+        next_task = next(waiting, None)
+        if next_task is not None:
+            in_flight.append((next_task, parse(next_task)))
+        if cancelled is not None and cancelled.is_set():
+            return False
+
+        file_stats, _, _, _, name = task
+        try:
+            rows, sheet_stats = future.result()
+        except Exception as e:
+            file_stats.errors.append(f"{name}: {e}")
+            continue
+        file_stats.add(sheet_stats)
+        stats.add(sheet_stats)
+
+        for start in range(0, len(rows), batch_size):
+            if cancelled is not None and cancelled.is_set():
+                return False
+            batch_stats = ImportStats()
+            add_rows(db, rows[start:start + batch_size], batch_stats, merge)
+            file_stats.add(batch_stats)
+            stats.add(batch_stats)
+    return True
+
+
+class _Result:
+    """
+    Result of a sheet parsed in the calling thread, with the interface of a Future.
+    """
+
+    def __init__(self, value=None, error=None):
+        self.value = value
+        self.error = error
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
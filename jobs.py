@@ -0,0 +1,208 @@
+"""
+Background import jobs.
+
+Uploaded workbooks or zip archives are saved to temporary files and
+imported on a small thread pool, so the request that uploads them returns
+immediately with a job id. Clients poll the job for progress and the final
+counts, and can cancel it between two committed chunks.
+"""
+
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from importer import ARCHIVE_EXTENSIONS, ImportStats, import_excel_in_batches, import_files
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+
+# Number of imports running at the same time
+IMPORT_JOB_WORKERS = 2
+
+# Number of finished jobs kept for polling before the oldest are forgotten
+IMPORT_JOB_HISTORY = 100
+
+
+class ImportJob:
+    """
+    State of one background import.
+
+    Attributes:
+        id (str): Job identifier returned to the client
+        filename (str): Original name of the uploaded file, or the names of
+            all files separated by commas
+        sources (list): (filename, path) pairs of the saved uploads
+        status (str): queued, running, completed, failed or cancelled
+        merge (bool): Whether rows matching an existing contact are merged
+        stats (ImportStats): Rows parsed, imported, duplicate and invalid so far
+        error (str): Error message when the job failed
+    """
+
+    FINISHED = ('completed', 'failed', 'cancelled')
+
+    def __init__(self, sources, merge=False):
+        self.id = uuid.uuid4().hex
+        self.filename = ', '.join(filename for filename, _ in sources)
+        self.sources = sources
+        self.status = 'queued'
+        self.merge = merge
+        self.stats = ImportStats()
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancelled = threading.Event()
+        self.future = None
+
+    @property
+    def finished(self):
+        return self.status in self.FINISHED
+
+    def to_dict(self):
+        result = {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "merge": self.merge,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        result.update(self.stats.to_dict())
+        return result
+
+
+class ImportJobManager:
+    """
+    Runs import jobs on a bounded thread pool and keeps track of them.
+
+    Args:
+        db (Database): Database the contacts are imported into
+        max_workers (int): Number of imports running concurrently
+        history (int): Number of finished jobs kept for polling
+        on_finished (callable): Called with the job after it completes
+    """
+
+    def __init__(self, db, max_workers=IMPORT_JOB_WORKERS, history=IMPORT_JOB_HISTORY, on_finished=None):
+        self.db = db
+        self.history = history
+        self.on_finished = on_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='import-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, file, filename, merge=False):
+        """
+        Save an uploaded file and queue it for import.
+
+        Args:
+            file: Binary file object of the upload
+            filename (str): Original file name
+            merge (bool): Merge rows matching an existing contact into it
+
+        Returns:
+            ImportJob: The queued job
+        """
+        return self.submit_files([(file, filename)], merge)
+
+    def submit_files(self, files, merge=False):
+        """
+        Save several uploaded files and queue them as one import. Every
+        sheet of every workbook is imported, and zip archives are expanded.
+
+        Args:
+            files (list): (binary file object, original file name) pairs
+            merge (bool): Merge rows matching an existing contact into it
+
+        Returns:
+            ImportJob: The queued job
+        """
+        sources = []
+        for file, filename in files:
+            suffix = os.path.splitext(filename)[1]
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as upload:
+                while True:
+                    chunk = file.read(64 * 1024)
+                    if not chunk:
+                        break
+                    upload.write(chunk)
+            sources.append((filename, upload.name))
+
+        job = ImportJob(sources, merge)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. A queued job never starts; a running job stops after
+        the chunk it is currently committing.
+
+        Returns:
+            ImportJob: The job, or None if it does not exist
+        """
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+
+        job.cancelled.set()
+        if job.future.cancel():
+            self._finish(job, 'cancelled')
+        return job
+
+    def _run(self, job):
+        if job.cancelled.is_set():
+            self._finish(job, 'cancelled')
+            return
+
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            if len(job.sources) == 1 and not job.filename.lower().endswith(ARCHIVE_EXTENSIONS):
+                filename, path = job.sources[0]
+                completed = import_excel_in_batches(self.db, path, filename, job.stats, job.cancelled,
+                                                    merge=job.merge)
+            else:
+                completed = import_files(self.db, job.sources, job.stats, job.cancelled, merge=job.merge)
+            self._finish(job, 'completed' if completed else 'cancelled')
+        except Exception as e:
+            logger.exception("Import job %s failed", job.id)
+            job.error = str(e)
+            self._finish(job, 'failed')
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        for _, path in job.sources:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if self.on_finished is not None:
+            self.on_finished(job)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        for job in self.list():
+            job.cancelled.set()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,60 @@
+"""
+Leveled, asynchronous logging for the contacts app.
+
+Modules log through get_logger(). Records are put on an in-memory queue and
+written to stderr by a background listener thread, so request threads never
+wait on console I/O. The level comes from the CONTACTS_LOG_LEVEL environment
+variable (DEBUG, INFO, WARNING, ERROR or OFF); messages below it are dropped
+before they are formatted.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+
+LOGGER_NAME = 'contacts'
+LOG_LEVEL = 'INFO'
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+_listener = None
+
+
+def get_logger(name):
+    """
+    Return the logger of one module, below the app's 'contacts' logger.
+
+    Args:
+        name (str): Module name, usually __name__
+    """
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+def configure_logging(level=None):
+    """
+    Send the app's log records through a queue to a stderr writer thread.
+
+    Calling it again only changes the level.
+
+    Args:
+        level (str): Level name, or OFF to silence the app's logs. Defaults
+            to CONTACTS_LOG_LEVEL, then INFO
+    """
+    global _listener
+
+    level = (level or os.environ.get('CONTACTS_LOG_LEVEL') or LOG_LEVEL).upper()
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logging.CRITICAL + 1 if level == 'OFF' else level)
+
+    if _listener is None:
+        records = queue.SimpleQueue()
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        _listener = logging.handlers.QueueListener(records, handler)
+        _listener.start()
+        atexit.register(_listener.stop)
+        logger.addHandler(logging.handlers.QueueHandler(records))
+        logger.propagate = False
+    return logger
@@ -0,0 +1,854 @@
+"""
+In-memory storage engine with the same interface as database.Database.
+
+Contacts live in a dict keyed by id, next to a handful of indexes that are
+updated on every write:
+
+- a hash index on (first_name, last_name), which also enforces unique names
+- a hash index on category, holding each category's names in sorted order
+- sorted name and starred-then-name orders for the listing and pages
+- a word index with a sorted vocabulary for prefix and substring search
+- hash indexes on the phone and email keys used by duplicate detection
+
+Nothing is written to disk. The engine is meant for tests and for
+short-lived caches in front of the SQLite database, and can start from a
+copy of one with from_sqlite(). A single lock serialises all calls, so a
+reader never sees an index half way through an update.
+"""
+
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+
+from database import (CONTACT_FIELDS, PAGE_SORTS, RECORD_COLUMNS, ContactChange, ContactRecord, DuplicateGroup,
+                      FacetCount, MATCH_CANDIDATES_MAX, batch_item_error, contact_row, decode_cursor,
+                      duplicate_match, encode_cursor, rank_matches)
+from dedup import KEY_GROUP_MAX, group_pairs, name_key, name_pairs, normalize_name, same_person
+from logs import get_logger
+from migrations import PHONE_KEY_DIGITS, email_key, phone_key
+
+logger = get_logger(__name__)
+
+
+# Fields whose words are searchable, in CONTACT_FIELDS order
+SEARCH_FIELDS = CONTACT_FIELDS[:-1]
+
+# Substring search, like SQLite's trigram index, needs at least 3 characters
+SUBSTRING_MIN_LENGTH = 3
+
+# Batches larger than this rebuild the sorted indexes with one sort instead
+# of inserting every key on its own
+BULK_SORT_SIZE = 100
+
+_WORD = re.compile(r'\w+')
+
+
+def words(text):
+    """
+    Searchable words of a text: case-folded, without accents, split on
+    anything that is not a letter or digit.
+    """
+    if not text:
+        return []
+    text = str(text).casefold()
+    if not text.isascii():
+        text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return _WORD.findall(text)
+
+
+def _category(contact):
+    return contact.category or ''
+
+
+def _walk(keys, after, descending):
+    """
+    Yield the keys of a sorted list that come after the key `after` in the
+    given direction, or all of them when after is None.
+    """
+    if descending:
+        end = len(keys) if after is None else bisect_left(keys, after)
+        for index in range(end - 1, -1, -1):
+            yield keys[index]
+    else:
+        start = 0 if after is None else bisect_right(keys, after)
+        for index in range(start, len(keys)):
+            yield keys[index]
+
+
+class MemoryDatabase:
+    """
+    Contacts kept in Python data structures, with the interface of Database.
+
+    Args:
+        records (iterable): ContactRecords to start with, e.g. read from a
+            SQLite database; each one is also logged as an insert, so
+            change sync starting from 0 returns all of them
+    """
+
+    def __init__(self, records=()):
+        self.db_file = None
+        self._lock = threading.RLock()
+        self._generation = 0
+        self._contacts = {}
+        self._next_id = 1
+        # (first_name, last_name) -> id
+        self._by_name = {}
+        # category -> sorted [(first_name, last_name)]
+        self._by_category = {}
+        # sorted [(first_name, last_name)] and [(0 if starred else 1, first_name, last_name)]
+        self._name_order = []
+        self._starred_order = []
+        # word -> set of ids, and all words in sorted order
+        self._words = {}
+        self._vocabulary = []
+        # phone and email key -> set of ids
+        self._phone_keys = {}
+        self._email_keys = {}
+        # category -> [count, starred count]
+        self._facets = {}
+        # Change log: entry i has seq i + 1
+        self._changes = []
+        self._add_all(records, log_op='insert')
+
+    @classmethod
+    def from_sqlite(cls, db_file):
+        """
+        Start from a copy of the contacts in a SQLite database. The file is
+        opened read-only; a missing file or table gives an empty engine.
+        """
+        records = []
+        if os.path.exists(db_file):
+            conn = sqlite3.connect(f"{pathlib.Path(db_file).resolve().as_uri()}?mode=ro", uri=True)
+            try:
+                records = [ContactRecord._make(row)
+                           for row in conn.execute(f"SELECT {RECORD_COLUMNS} FROM contacts ORDER BY id")]
+            except sqlite3.OperationalError:
+                records = []
+            finally:
+                conn.close()
+        db = cls(records)
+        db.db_file = db_file
+        logger.info("%d contacts loaded into memory from %s.", len(records), db_file)
+        return db
+
+    @property
+    def generation(self):
+        """
+        Data version, incremented after every write; caches compare it to
+        tell whether the data has changed
+        """
+        return self._generation
+
+    def _bump_generation(self):
+        self._generation += 1
+
+    def init_db(self):
+        """There is no schema to migrate"""
+
+    def close(self):
+        """Nothing to release"""
+
+    # Indexes
+
+    def _index(self, contact, sort=True):
+        """
+        Add a contact to every index. With sort=False the sorted lists are
+        only appended to, and the caller sorts them afterwards.
+        """
+        contact_id = contact.id
+        name = (contact.first_name, contact.last_name)
+        starred_key = (0 if contact.is_starred else 1,) + name
+        category = _category(contact)
+        self._contacts[contact_id] = contact
+        self._by_name[name] = contact_id
+
+        names = self._by_category.setdefault(category, [])
+        if sort:
+            insort(names, name)
+            insort(self._name_order, name)
+            insort(self._starred_order, starred_key)
+        else:
+            names.append(name)
+            self._name_order.append(name)
+            self._starred_order.append(starred_key)
+
+        for word in self._contact_words(contact):
+            ids = self._words.get(word)
+            if ids is None:
+                ids = self._words[word] = set()
+                if sort:
+                    insort(self._vocabulary, word)
+                else:
+                    self._vocabulary.append(word)
+            ids.add(contact_id)
+
+        self._phone_keys.setdefault(phone_key(contact.phone_number), set()).add(contact_id)
+        self._email_keys.setdefault(email_key(contact.email), set()).add(contact_id)
+
+        facet = self._facets.setdefault(category, [0, 0])
+        facet[0] += 1
+        facet[1] += 1 if contact.is_starred else 0
+
+    def _unindex(self, contact):
+        """
+        Remove a contact from every index.
+        """
+        contact_id = contact.id
+        name = (contact.first_name, contact.last_name)
+        category = _category(contact)
+        del self._contacts[contact_id]
+        del self._by_name[name]
+
+        names = self._by_category[category]
+        del names[bisect_left(names, name)]
+        if not names:
+            del self._by_category[category]
+        del self._name_order[bisect_left(self._name_order, name)]
+        del self._starred_order[bisect_left(self._starred_order, (0 if contact.is_starred else 1,) + name)]
+
+        for word in self._contact_words(contact):
+            ids = self._words[word]
+            ids.discard(contact_id)
+            if not ids:
+                del self._words[word]
+                del self._vocabulary[bisect_left(self._vocabulary, word)]
+
+        for keys, key in ((self._phone_keys, phone_key(contact.phone_number)),
+                          (self._email_keys, email_key(contact.email))):
+            ids = keys[key]
+            ids.discard(contact_id)
+            if not ids:
+                del keys[key]
+
+        facet = self._facets[category]
+        facet[0] -= 1
+        facet[1] -= 1 if contact.is_starred else 0
+        if not facet[0]:
+            del self._facets[category]
+
+    @staticmethod
+    def _contact_words(contact):
+        found = set()
+        for value in contact[1:len(SEARCH_FIELDS) + 1]:
+            found.update(words(value))
+        return found
+
+    def _add_all(self, records, log_op=None):
+        """
+        Index many contacts at once, sorting the sorted indexes once at the end
+        """
+        records = list(records)
+        bulk = len(records) > BULK_SORT_SIZE
+        for contact in records:
+            self._index(contact, sort=not bulk)
+            self._next_id = max(self._next_id, contact.id + 1)
+            if log_op:
+                self._changes.append((log_op, contact.id))
+        if bulk:
+            for keys in (self._name_order, self._starred_order, self._vocabulary, *self._by_category.values()):
+                keys.sort()
+
+    def _store(self, row, contact_id=None):
+        """
+        Add a contact from a row in CONTACT_FIELDS order and log it
+
+        Returns:
+            ContactRecord: The stored contact
+        """
+        if contact_id is None:
+            contact_id = self._next_id
+            self._next_id += 1
+        *fields, is_starred = row
+        contact = ContactRecord(contact_id, *fields, 1 if is_starred else 0)
+        self._index(contact)
+        self._changes.append(('insert', contact_id))
+        return contact
+
+    def _replace(self, contact, row):
+        """
+        Replace the fields of a contact with a row in CONTACT_FIELDS order
+
+        Raises:
+            sqlite3.IntegrityError: The new name belongs to another contact,
+                the same error Database raises, so callers handle one type
+        """
+        existing = self._by_name.get((row[0], row[1]))
+        if existing is not None and existing != contact.id:
+            raise sqlite3.IntegrityError("UNIQUE constraint failed: contacts.first_name, contacts.last_name")
+        self._unindex(contact)
+        *fields, is_starred = row
+        updated = ContactRecord(contact.id, *fields, 1 if is_starred else 0)
+        self._index(updated)
+        self._changes.append(('update', contact.id))
+        return updated
+
+    def _remove(self, contact):
+        self._unindex(contact)
+        self._changes.append(('delete', contact.id))
+
+    def _find(self, contact_id=None, name=None):
+        if contact_id is not None:
+            return self._contacts.get(contact_id)
+        contact_id = self._by_name.get(name)
+        return None if contact_id is None else self._contacts[contact_id]
+
+    # Reads
+
+    def get_all_contacts(self):
+        with self._lock:
+            return [self._contacts[self._by_name[(first_name, last_name)]]
+                    for _, first_name, last_name in self._starred_order]
+
+    def get_contacts_page(self, limit, cursor=None, sort='starred', order='asc', category=None):
+        """
+        One page of contacts, with the same sorts, cursors and errors as
+        Database.get_contacts_page. Each page starts with a binary search
+        for the cursor in a sorted index.
+
+        Returns:
+            tuple: (list of ContactRecord, next page cursor or None)
+
+        Raises:
+            ValueError: Unknown sort or order, or an invalid cursor
+        """
+        if sort not in PAGE_SORTS:
+            raise ValueError(f"Unsupported sort '{sort}', expected one of {', '.join(PAGE_SORTS)}")
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"Unsupported order '{order}', expected asc or desc")
+        after = decode_cursor(cursor, sort, order, 2 if sort == 'name' else 3) if cursor else None
+        if after is not None:
+            if not all(isinstance(part, str) for part in after[-2:]) or \
+                    (sort == 'starred' and not isinstance(after[0], int)) or \
+                    (sort == 'category' and not isinstance(after[0], str)):
+                raise ValueError("Invalid cursor")
+
+        with self._lock:
+            rows = []
+            for name in self._page_names(sort, order == 'desc', category, after):
+                rows.append(self._contacts[self._by_name[name]])
+                if len(rows) > limit:
+                    break
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            key = [last.first_name, last.last_name]
+            if sort == 'category':
+                key.insert(0, last.category or '')
+            elif sort == 'starred':
+                key.insert(0, last.is_starred)
+            next_cursor = encode_cursor(sort, order, key)
+        return rows, next_cursor
+
+    def _page_names(self, sort, descending, category, after):
+        """
+        Yield (first_name, last_name) in page order after a decoded cursor
+        """
+        if sort == 'name':
+            keys = self._name_order if category is None else self._by_category.get(category, [])
+            yield from _walk(keys, tuple(after) if after else None, descending)
+            return
+
+        if sort == 'starred':
+            if category is None:
+                after_key = (1 - after[0],) + tuple(after[1:]) if after else None
+                for _, first_name, last_name in _walk(self._starred_order, after_key, descending):
+                    yield first_name, last_name
+                return
+            # Within one category, walk its names once for starred and once
+            # for the other contacts
+            flags = (0, 1) if descending else (1, 0)
+            names = self._by_category.get(category, [])
+            for flag in flags:
+                if after is not None and flags.index(flag) < flags.index(1 if after[0] else 0):
+                    continue
+                start = tuple(after[1:]) if after is not None and flag == (1 if after[0] else 0) else None
+                for name in _walk(names, start, descending):
+                    if (1 if self._contacts[self._by_name[name]].is_starred else 0) == flag:
+                        yield name
+            return
+
+        categories = sorted(self._by_category) if category is None else [category]
+        if descending:
+            categories.reverse()
+        for current in categories:
+            if after is not None and (current > after[0] if descending else current < after[0]):
+                continue
+            start = tuple(after[1:]) if after is not None and current == after[0] else None
+            yield from _walk(self._by_category.get(current, []), start, descending)
+
+    def iter_contact_batches(self, batch_size=1000, sort='starred', order='asc'):
+        """
+        Yield all contacts in lists of at most batch_size, one page at a time
+        """
+        cursor = None
+        while True:
+            contacts, cursor = self.get_contacts_page(batch_size, cursor, sort, order)
+            if contacts:
+                yield contacts
+            if cursor is None:
+                break
+
+    def get_facets(self):
+        """
+        Returns:
+            list: FacetCount per category, sorted by category; contacts
+                without a category are counted under the empty string
+        """
+        with self._lock:
+            return [FacetCount(category, count, starred)
+                    for category, (count, starred) in sorted(self._facets.items())]
+
+    def get_change_seq(self):
+        with self._lock:
+            return len(self._changes)
+
+    def get_changes(self, since=0, limit=500):
+        """
+        Changes after since, latest per contact, as in Database.get_changes
+
+        Returns:
+            tuple: (list of ContactChange, last_seq, whether more changes follow)
+        """
+        with self._lock:
+            latest = len(self._changes)
+            seen = set()
+            picked = []
+            for seq in range(latest, max(since, 0), -1):
+                op, contact_id = self._changes[seq - 1]
+                if contact_id not in seen:
+                    seen.add(contact_id)
+                    picked.append((seq, op, contact_id))
+            picked.reverse()
+            has_more = len(picked) > limit
+            changes = []
+            for seq, op, contact_id in picked[:limit]:
+                contact = self._contacts.get(contact_id)
+                if op == 'delete' or contact is None:
+                    changes.append(ContactChange(seq, 'delete', contact_id, None))
+                else:
+                    changes.append(ContactChange(seq, op, contact_id, contact))
+
+        last_seq = changes[-1].seq if has_more else max(since, latest)
+        return changes, last_seq, has_more
+
+    def get_contact(self, contact_id):
+        with self._lock:
+            return self._contacts.get(contact_id)
+
+    # Writes
+
+    def add_contact(self, contact_data):
+        """
+        Returns:
+            int: Id of the new contact, False if the name already exists
+        """
+        row = (contact_data['first_name'], contact_data['last_name'],
+               contact_data.get('category', ''), contact_data['phone_number'],
+               contact_data['email'], contact_data['address'],
+               contact_data.get('institution', ''), contact_data.get('is_starred', 0))
+        with self._lock:
+            if (row[0], row[1]) in self._by_name:
+                return False
+            contact = self._store(row)
+            self._bump_generation()
+            return contact.id
+
+    def update_contact(self, old_first_name, old_last_name, contact_data):
+        with self._lock:
+            return self._update_contact(self._find(name=(old_first_name, old_last_name)), contact_data)
+
+    def update_contact_by_id(self, contact_id, contact_data):
+        """
+        Raises:
+            sqlite3.IntegrityError: The new name belongs to another contact
+        """
+        with self._lock:
+            return self._update_contact(self._find(contact_id), contact_data)
+
+    def _update_contact(self, contact, contact_data):
+        row = (contact_data['first_name'], contact_data['last_name'], contact_data.get('category', ''),
+               contact_data['phone_number'], contact_data['email'], contact_data['address'],
+               contact_data.get('institution', ''), contact_data.get('is_starred', 0))
+        if contact is None:
+            return False
+        self._replace(contact, row)
+        self._bump_generation()
+        return True
+
+    def delete_contact(self, first_name, last_name):
+        with self._lock:
+            return self._delete_contact(self._find(name=(first_name, last_name)))
+
+    def delete_contact_by_id(self, contact_id):
+        with self._lock:
+            return self._delete_contact(self._find(contact_id))
+
+    def _delete_contact(self, contact):
+        if contact is None:
+            return False
+        self._remove(contact)
+        self._bump_generation()
+        return True
+
+    def toggle_starred(self, first_name, last_name):
+        with self._lock:
+            return self._toggle_starred(self._find(name=(first_name, last_name))) is not None
+
+    def toggle_starred_by_id(self, contact_id):
+        """
+        Returns:
+            bool: The new starred status, None if the contact does not exist
+        """
+        with self._lock:
+            return self._toggle_starred(self._find(contact_id))
+
+    def _toggle_starred(self, contact):
+        if contact is None:
+            return None
+        updated = self._replace(contact, contact[1:-1] + (1 - (contact.is_starred or 0),))
+        self._bump_generation()
+        return bool(updated.is_starred)
+
+    def apply_batch(self, operations):
+        """
+        Apply add, update, delete and star operations in order, with one
+        result per operation; see Database.apply_batch for the format.
+
+        Returns:
+            list: Result dicts, status ok, not_found, conflict or invalid
+        """
+        results = []
+        with self._lock:
+            for index, item in enumerate(operations):
+                error = batch_item_error(item)
+                if error:
+                    results.append({"index": index, "status": "invalid", "error": error})
+                    continue
+                if item['op'] == 'add':
+                    row = contact_row(item['contact'])
+                    if (row[0], row[1]) in self._by_name:
+                        results.append({"index": index, "status": "conflict",
+                                        "error": f"Contact {row[0]} {row[1]} already exists"})
+                    else:
+                        results.append({"index": index, "status": "ok", "id": self._store(row).id})
+                    continue
+
+                target = self._find(item['id']) if 'id' in item else self._find(name=(item['first_name'], item['last_name']))
+                if target is None:
+                    results.append({"index": index, "status": "not_found"})
+                elif item['op'] == 'update':
+                    try:
+                        self._replace(target, contact_row(item['contact']))
+                    except sqlite3.IntegrityError:
+                        contact = item['contact']
+                        results.append({"index": index, "status": "conflict", "id": target.id,
+                                        "error": f"Contact {contact['first_name']} {contact['last_name']} already exists"})
+                        continue
+                    results.append({"index": index, "status": "ok", "id": target.id})
+                elif item['op'] == 'delete':
+                    self._remove(target)
+                    results.append({"index": index, "status": "ok", "id": target.id})
+                else:
+                    is_starred = bool(item['is_starred']) if 'is_starred' in item else not target.is_starred
+                    self._replace(target, target[1:-1] + (int(is_starred),))
+                    results.append({"index": index, "status": "ok", "id": target.id, "is_starred": is_starred})
+
+            if any(result['status'] == 'ok' for result in results):
+                self._bump_generation()
+        return results
+
+    def bulk_add_contacts(self, contacts_data):
+        """
+        Returns:
+            tuple: (number added, names of duplicate contacts)
+        """
+        return self.bulk_add_rows(
+            (contact_data['first_name'], contact_data['last_name'],
+             contact_data.get('category', ''), contact_data['phone_number'],
+             contact_data['email'], contact_data['address'],
+             contact_data.get('institution', ''), contact_data.get('is_starred', 0))
+            for contact_data in contacts_data)
+
+    def bulk_add_rows(self, rows):
+        """
+        Add rows in CONTACT_FIELDS order. A name that already exists, or
+        appears earlier in the batch, is reported as a duplicate.
+
+        Returns:
+            tuple: (number added, names of duplicate contacts)
+        """
+        rows = list(rows)
+        with self._lock:
+            added, duplicates = self._add_rows(rows)
+            if added:
+                self._bump_generation()
+        return added, duplicates
+
+    def _add_rows(self, rows):
+        names = set()
+        records, duplicates = [], []
+        for row in rows:
+            name = (row[0], row[1])
+            if name in names or name in self._by_name:
+                # SQLite's INSERT ... ON CONFLICT DO NOTHING uses up an id for
+                # every skipped row; doing the same keeps ids equal to it
+                self._next_id += 1
+                duplicates.append(f"{row[0]} {row[1]}")
+                continue
+            names.add(name)
+            *fields, is_starred = row
+            records.append(ContactRecord(self._next_id, *fields, 1 if is_starred else 0))
+            self._next_id += 1
+        self._add_all(records, log_op='insert')
+        return len(records), duplicates
+
+    def bulk_merge_rows(self, rows):
+        """
+        Add rows, merging those that match an existing contact (same name, or
+        the same phone or email key and a similar name) into it, as in
+        Database.bulk_merge_rows: empty fields are filled from the first
+        matching row and the star is kept if either has it.
+
+        Returns:
+            tuple: (number added, number merged, names of duplicate contacts)
+        """
+        rows = list(rows)
+        fill_fields = range(2, len(CONTACT_FIELDS) - 1)
+        with self._lock:
+            matches = {}
+            for seq, row in enumerate(rows):
+                contact_id = self._by_name.get((row[0], row[1]))
+                if contact_id is None:
+                    contact_id = self._match_row(row)
+                if contact_id is not None:
+                    matches[seq] = contact_id
+
+            # Each contact is filled from its first matching row
+            first_rows = {}
+            filled = 0
+            for seq, contact_id in matches.items():
+                first_rows.setdefault(contact_id, seq)
+            for contact_id, seq in sorted(first_rows.items()):
+                contact, row = self._contacts[contact_id], rows[seq]
+                merged = list(contact[1:])
+                for field in fill_fields:
+                    if not merged[field]:
+                        merged[field] = row[field]
+                merged[-1] = max(merged[-1] or 0, 1 if row[-1] else 0)
+                if tuple(merged) != contact[1:]:
+                    self._replace(contact, tuple(merged))
+                    filled += 1
+
+            added, duplicates = self._add_rows(row for seq, row in enumerate(rows) if seq not in matches)
+            if added or filled:
+                self._bump_generation()
+        return added, len(matches), duplicates
+
+    def _match_row(self, row):
+        """
+        Id of the first existing contact sharing the row's phone or email key
+        whose name is close enough, or None
+        """
+        candidates = []
+        key = phone_key(row[3])
+        if len(key) == PHONE_KEY_DIGITS:
+            candidates.extend(sorted(self._phone_keys.get(key, ())))
+        key = email_key(row[4])
+        if key.find('@') > 0:
+            candidates.extend(sorted(self._email_keys.get(key, ())))
+        for contact_id in candidates:
+            contact = self._contacts[contact_id]
+            if same_person(row[0], row[1], contact.first_name, contact.last_name):
+                return contact_id
+        return None
+
+    # Duplicates
+
+    def find_duplicates(self, limit=100):
+        """
+        Groups of suspected duplicates, found the same way as
+        Database.find_duplicates, from the phone and email key indexes and
+        phonetic name blocks.
+
+        Returns:
+            tuple: (list of DuplicateGroup, total number of groups)
+        """
+        with self._lock:
+            pairs = []
+            for reason, keys, valid in (
+                    ('phone', self._phone_keys, lambda key: len(key) == PHONE_KEY_DIGITS),
+                    ('email', self._email_keys, lambda key: key.find('@') > 0)):
+                for key, ids in keys.items():
+                    if 2 <= len(ids) <= KEY_GROUP_MAX and valid(key):
+                        ids = sorted(ids)
+                        pairs.extend((ids[0], contact_id, reason) for contact_id in ids[1:])
+
+            rows = sorted(((contact.id, contact.first_name, contact.last_name,
+                            name_key(contact.first_name, contact.last_name))
+                           for contact in self._contacts.values()), key=lambda row: row[3])
+            pairs.extend((a, b, 'name') for a, b, _ in name_pairs(rows))
+
+            groups = group_pairs(pairs)
+            shown = groups[:limit]
+            return [DuplicateGroup(ids, reasons, [self._contacts[contact_id] for contact_id in ids])
+                    for ids, reasons in shown], len(groups)
+
+    def find_matches(self, contact_data, limit=10):
+        """
+        Existing contacts that a new contact would duplicate. Candidates
+        share the phone or email key or the name, or have the same first
+        name and last name initial (or the other way round).
+
+        Returns:
+            list: DuplicateMatch, most reasons and closest names first
+        """
+        first_name = contact_data.get('first_name') or ''
+        last_name = contact_data.get('last_name') or ''
+        new_phone_key = phone_key(contact_data.get('phone_number') or '')
+        new_email_key = email_key(contact_data.get('email') or '')
+
+        with self._lock:
+            candidates = set()
+            if len(new_phone_key) == PHONE_KEY_DIGITS:
+                candidates.update(self._phone_keys.get(new_phone_key, ()))
+            if new_email_key.find('@') > 0:
+                candidates.update(self._email_keys.get(new_email_key, ()))
+            contact_id = self._by_name.get((first_name, last_name))
+            if contact_id is not None:
+                candidates.add(contact_id)
+            candidates.update(self._name_candidates(first_name, last_name, 0))
+            candidates.update(self._name_candidates(last_name, first_name, 1))
+
+            matches = []
+            for contact_id in sorted(candidates)[:MATCH_CANDIDATES_MAX]:
+                contact = self._contacts[contact_id]
+                match = duplicate_match(first_name, last_name, new_phone_key, new_email_key, contact,
+                                        phone_key(contact.phone_number), email_key(contact.email))
+                if match is not None:
+                    matches.append(match)
+        return rank_matches(matches, limit)
+
+    def _name_candidates(self, name, other_name, field):
+        """
+        Ids of contacts whose name part `field` (0 first, 1 last) contains
+        the first word of name, and whose other part starts with the initial
+        of other_name
+        """
+        tokens = name.split()
+        initial = normalize_name(other_name)[:1]
+        if not tokens or not initial:
+            return []
+        wanted = words(tokens[0])
+        if not wanted:
+            return []
+        ids = set.intersection(*(self._words.get(word, set()) for word in wanted))
+        found = []
+        for contact_id in ids:
+            contact = self._contacts[contact_id]
+            parts = (contact.first_name, contact.last_name)
+            if set(wanted) <= set(words(parts[field])) and normalize_name(parts[1 - field]).startswith(initial):
+                found.append(contact_id)
+        return found
+
+    # Search
+
+    def search_contacts(self, search_term, limit=None):
+        """
+        Search all fields, like the SQLite full-text search. Each term must
+        match the start of a word (a term with punctuation, such as
+        "o'brien", must match its words in sequence); contacts where a term
+        of 3 characters or more only matches inside a word come next.
+        Starred contacts always come first, then by name.
+
+        Args:
+            search_term (str): Terms separated by whitespace, all must match
+            limit (int): Maximum number of results, None for all
+
+        Returns:
+            list: ContactRecords
+        """
+        terms = search_term.split()
+        if not terms:
+            return []
+
+        with self._lock:
+            prefix_hits = self._match_terms(terms, self._prefix_ids)
+            substring_hits = set()
+            if all(len(term) >= SUBSTRING_MIN_LENGTH for term in terms):
+                substring_hits = self._match_terms(terms, self._substring_ids) - prefix_hits
+
+            ranked = []
+            for tier, ids in ((0, prefix_hits), (1, substring_hits)):
+                for contact_id in ids:
+                    contact = self._contacts[contact_id]
+                    ranked.append((0 if contact.is_starred else 1, tier, contact.first_name, contact.last_name, contact))
+        ranked.sort(key=lambda item: item[:4])
+        results = [item[-1] for item in ranked]
+        return results if limit is None else results[:int(limit)]
+
+    @staticmethod
+    def _match_terms(terms, lookup):
+        """
+        Ids of the contacts that lookup() finds for every term
+        """
+        matched = None
+        for term in terms:
+            ids = lookup(term)
+            matched = ids if matched is None else matched & ids
+            if not matched:
+                return set()
+        return matched
+
+    def _prefix_ids(self, term):
+        """
+        Contacts with a word starting with the term, or for a term of several
+        words, with those words in sequence and the last one as a prefix
+        """
+        parts = words(term)
+        if not parts:
+            return set()
+        ids = self._word_prefix_ids(parts[-1])
+        for part in parts[:-1]:
+            ids = ids & self._words.get(part, set())
+        if len(parts) == 1:
+            return ids
+        return {contact_id for contact_id in ids if self._has_phrase(self._contacts[contact_id], parts)}
+
+    def _word_prefix_ids(self, prefix):
+        ids = set()
+        index = bisect_left(self._vocabulary, prefix)
+        while index < len(self._vocabulary) and self._vocabulary[index].startswith(prefix):
+            ids |= self._words[self._vocabulary[index]]
+            index += 1
+        return ids
+
+    @staticmethod
+    def _has_phrase(contact, parts):
+        for value in contact[1:len(SEARCH_FIELDS) + 1]:
+            found = words(value)
+            for start in range(len(found) - len(parts) + 1):
+                if found[start:start + len(parts) - 1] == parts[:-1] and found[start + len(parts) - 1].startswith(parts[-1]):
+                    return True
+        return False
+
+    def _substring_ids(self, term):
+        """
+        Contacts with the term anywhere in a field. A term that is a single
+        word is looked up in the vocabulary; others need a scan of all
+        contacts.
+        """
+        text = term.casefold()
+        if words(text) == [text]:
+            ids = set()
+            for word in self._vocabulary:
+                if text in word:
+                    ids |= self._words[word]
+            return ids
+        return {contact.id for contact in self._contacts.values()
+                if any(value and text in str(value).casefold() for value in contact[1:len(SEARCH_FIELDS) + 1])}
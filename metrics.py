@@ -0,0 +1,284 @@
+"""
+Metrics in the Prometheus text exposition format.
+
+Counters and histograms are updated in place by the code they measure.
+Values that already live elsewhere, such as cache and connection pool
+statistics, are registered as callbacks and read only when /metrics is
+scraped. Each metric keeps one series per distinct tuple of label values,
+so labels must come from a small fixed set (routes, method names, tables),
+never from user input.
+"""
+
+import bisect
+import re
+import threading
+import time
+
+from executor import WRITE_METHODS
+
+
+# Histogram buckets in seconds, from sub-millisecond queries to slow imports
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+    """
+    Monotonically increasing value per label tuple.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, self.labelnames, labels, value
+
+
+class Histogram:
+    """
+    Distribution of observed values per label tuple.
+
+    Args:
+        buckets (tuple): Sorted upper bounds; +Inf is added automatically
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label tuple -> [count per bucket (+Inf last), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        names = self.labelnames + ('le',)
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield self.name + '_bucket', names, labels + (_format_value(bound),), cumulative
+            yield self.name + '_sum', self.labelnames, labels, total
+            yield self.name + '_count', self.labelnames, labels, cumulative
+
+
+class CallbackMetric:
+    """
+    Gauge or counter whose samples are read from a callback at scrape time.
+
+    Args:
+        collect (callable): Returns an iterable of (label values, value)
+    """
+
+    def __init__(self, name, documentation, labelnames, collect, type='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self.type = type
+
+    def samples(self):
+        for labels, value in self.collect():
+            yield self.name, self.labelnames, tuple(labels), value
+
+
+class MetricsRegistry:
+    """
+    Set of metrics rendered together by /metrics.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, labelnames, collect, type='gauge'):
+        return self.register(CallbackMetric(name, documentation, labelnames, collect, type))
+
+    def render(self):
+        """
+        Returns:
+            str: All metrics in the Prometheus text format, version 0.0.4
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labelnames, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    'contacts_http_request_duration_seconds', 'Time until the response headers are ready, by route',
+    ('method', 'route', 'status'))
+DB_CALL_DURATION = REGISTRY.histogram(
+    'contacts_db_call_duration_seconds', 'Execution time of Database methods', ('method',))
+DB_QUEUE_WAIT = REGISTRY.histogram(
+    'contacts_db_queue_wait_seconds', 'Time Database calls waited for a writer or reader thread', ('method',))
+DB_ROWS = REGISTRY.counter(
+    'contacts_db_rows_total', 'Rows returned or written by Database methods', ('method',))
+DB_ERRORS = REGISTRY.counter(
+    'contacts_db_errors_total', 'Database method calls that raised an exception', ('method',))
+SQL_STATEMENT_DURATION = REGISTRY.histogram(
+    'contacts_sql_statement_duration_seconds',
+    'Approximate SQLite statement time, from its start to the next statement or the connection release',
+    ('operation', 'table'))
+
+
+def result_rows(result, write=False):
+    """
+    Number of rows in the result of a Database method: the length of a list
+    of records, the first list or count of a tuple such as (records, cursor)
+    or (added, duplicates), and one row for a single record. Single-row
+    writes return an id or a flag, which counts as one row when truthy.
+    Returns None when the result carries no row count.
+    """
+    if isinstance(result, (bool, int)) or result is None:
+        return 1 if write and result else None
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple):
+        if hasattr(result, '_fields'):
+            return 1
+        if result and isinstance(result[0], (list, int)) and not isinstance(result[0], bool):
+            return result[0] if isinstance(result[0], int) else len(result[0])
+    return None
+
+
+def observe_database_call(method, queued, elapsed, result, error=None):
+    """
+    Record one Database call; used as the DatabaseExecutor observer.
+    """
+    labels = (method,)
+    DB_QUEUE_WAIT.observe(queued, labels)
+    DB_CALL_DURATION.observe(elapsed, labels)
+    if error is not None:
+        DB_ERRORS.inc(labels)
+        return
+    rows = result_rows(result, method in WRITE_METHODS)
+    if rows:
+        DB_ROWS.inc(labels, rows)
+
+
+_STATEMENT_TABLE = re.compile(
+    r"\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(?!OF\b|ON\b)(\w+)", re.IGNORECASE)
+
+
+def statement_labels(sql):
+    """
+    (operation, table) labels of a statement, e.g. ('SELECT', 'contacts').
+    """
+    operation = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+    match = _STATEMENT_TABLE.search(sql, 0, 500)
+    return operation, match.group(1) if match else ''
+
+
+class StatementTimer:
+    """
+    Times SQLite statements through sqlite3's trace callback.
+
+    SQLite reports when a statement starts but not when it ends, so a
+    statement is timed until the next statement on the same connection or
+    until the connection goes back to the pool. That includes fetching its
+    rows, which is usually what the caller waits for anyway.
+
+    Tracing costs a Python call per executed statement (per row for
+    executemany), so it is opt-in.
+
+    Args:
+        histogram (Histogram): Receives the timings, labelled (operation, table)
+    """
+
+    def __init__(self, histogram=SQL_STATEMENT_DURATION):
+        self.histogram = histogram
+        self._open = {}
+
+    def attach(self, conn):
+        # labels, start time and text of the statement currently running
+        state = [None, 0.0, None]
+        self._open[id(conn)] = state
+
+        def trace(sql):
+            # Trigger programs are reported again with the text of the
+            # statement that fired them; they are part of that statement
+            if sql == state[2] or sql.startswith('--'):
+                return
+            now = time.perf_counter()
+            if state[0] is not None:
+                self.histogram.observe(now - state[1], state[0])
+            state[0] = statement_labels(sql)
+            state[1] = now
+            state[2] = sql
+
+        conn.set_trace_callback(trace)
+
+    def finish(self, conn):
+        state = self._open.get(id(conn))
+        if state is not None and state[0] is not None:
+            self.histogram.observe(time.perf_counter() - state[1], state[0])
+            state[0] = state[2] = None
+
+    def detach(self, conn):
+        self.finish(conn)
+        self._open.pop(id(conn), None)
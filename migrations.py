@@ -0,0 +1,397 @@
+"""
+contacts数据库的版本化迁移
+
+已应用的版本记录在PRAGMA user_version中，启动时只执行尚未应用的迁移，
+每个迁移在一个事务中完成并统计耗时。数据迁移使用INSERT ... SELECT
+整体完成，不在Python中逐行处理。
+"""
+
+import sqlite3
+import string
+import time
+
+from dedup import name_key
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+
+# 参与全文搜索的字段
+SEARCH_COLUMNS = ('first_name', 'last_name', 'category', 'phone_number', 'email', 'address', 'institution')
+
+# 比较电话号码时忽略的分隔符，以及参与比较的末尾位数。只比较末尾的数字，
+# 这样国家代码和国内长途前缀不影响匹配（+353 1 234 5678 与 01 234 5678）
+PHONE_SEPARATORS = " -().+/"
+PHONE_KEY_DIGITS = 8
+
+# SQLite内置的lower()只转换ASCII字母
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+CONTACTS_TABLE = """
+    CREATE TABLE {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        first_name TEXT NOT NULL,
+        last_name TEXT NOT NULL,
+        category TEXT,
+        phone_number TEXT,
+        email TEXT,
+        address TEXT,
+        institution TEXT,
+        is_starred INTEGER DEFAULT 0,
+        UNIQUE(first_name, last_name)
+    )
+"""
+
+
+def phone_key_sql(value):
+    """
+    电话号码归一化键的SQL表达式：去掉分隔符后的末尾PHONE_KEY_DIGITS位。
+    查询中必须使用与索引完全相同的表达式，SQLite才会使用表达式索引
+
+    Args:
+        value (str): 字段名或参数，例如phone_number、c.phone_number或:phone_number
+    """
+    expression = f"IFNULL({value}, '')"
+    for separator in PHONE_SEPARATORS:
+        expression = f"REPLACE({expression}, '{separator}', '')"
+    return f"substr({expression}, -{PHONE_KEY_DIGITS})"
+
+
+def email_key_sql(value):
+    """
+    邮箱归一化键的SQL表达式：去掉首尾空格并转为小写，忽略@前面的+标签
+    （john+work@example.org 与 John@Example.org 相同）
+    """
+    email = f"lower(trim(IFNULL({value}, '')))"
+    return (f"CASE WHEN instr({email}, '+') BETWEEN 1 AND instr({email}, '@') "
+            f"THEN substr({email}, 1, instr({email}, '+') - 1) || substr({email}, instr({email}, '@')) "
+            f"ELSE {email} END")
+
+
+def phone_key(value):
+    """
+    Python版的phone_key_sql，用于不经过SQLite计算同样的键
+    """
+    key = '' if value is None else str(value)
+    for separator in PHONE_SEPARATORS:
+        key = key.replace(separator, '')
+    return key[-PHONE_KEY_DIGITS:]
+
+
+def email_key(value):
+    """
+    Python版的email_key_sql。与SQLite的trim和lower一样，只去掉空格、只转换ASCII字母
+    """
+    email = ('' if value is None else str(value)).strip(' ').translate(_ASCII_LOWER)
+    plus, at = email.find('+'), email.find('@')
+    if 0 <= plus <= at:
+        return email[:plus] + email[at:]
+    return email
+
+
+def _table_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [column[1] for column in cursor.fetchall()]
+
+
+def create_contacts_table(cursor):
+    """
+    创建contacts表，或者升级引入版本号之前的旧表结构
+    """
+    columns = _table_columns(cursor, 'contacts')
+
+    if not columns:
+        # 创建全新的表
+        cursor.execute(CONTACTS_TABLE.format(name='contacts'))
+        return
+
+    if 'first_name' not in columns or 'last_name' not in columns:
+        # 需要从name字段拆分first_name和last_name，在SQL中整体完成，并保留原来的id
+        cursor.execute(CONTACTS_TABLE.format(name='contacts_temp'))
+        cursor.execute("""
+            INSERT INTO contacts_temp (id, first_name, last_name, category, phone_number, email, address, institution, is_starred)
+            SELECT rowid,
+                   CASE WHEN instr(full_name, ' ') > 0 THEN substr(full_name, 1, instr(full_name, ' ') - 1) ELSE full_name END,
+                   CASE WHEN instr(full_name, ' ') > 0 THEN substr(full_name, instr(full_name, ' ') + 1) ELSE '' END,
+                   '', phone_number, email, address, '', 0
+            FROM (SELECT rowid, IFNULL(name, '') AS full_name, phone_number, email, address FROM contacts)
+        """)
+
+        # 删除原表并重命名临时表
+        cursor.execute("DROP TABLE contacts")
+        cursor.execute("ALTER TABLE contacts_temp RENAME TO contacts")
+        columns = _table_columns(cursor, 'contacts')
+
+    # 添加缺失的字段
+    for column, definition in (('category', 'TEXT'), ('institution', 'TEXT'), ('is_starred', 'INTEGER DEFAULT 0')):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE contacts ADD COLUMN {column} {definition}")
+
+
+def create_page_indexes(cursor):
+    """
+    分页排序使用的索引，姓名排序直接使用UNIQUE(first_name, last_name)的索引
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_contacts_starred_name ON contacts(is_starred DESC, first_name, last_name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_contacts_category_name ON contacts(IFNULL(category, ''), first_name, last_name)")
+
+
+# 全文搜索使用的两张FTS5表
+SEARCH_TABLES = ('contacts_fts', 'contacts_trigram')
+
+
+def search_indexes_exist(cursor):
+    """
+    两张FTS5表是否都已存在
+    """
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (?, ?)", SEARCH_TABLES)
+    return cursor.fetchone()[0] == len(SEARCH_TABLES)
+
+
+def create_search_indexes(cursor):
+    """
+    创建与contacts同步的FTS5全文索引
+
+    contacts_fts使用unicode61分词并建立前缀索引，用于按词前缀搜索；
+    contacts_trigram使用trigram分词，用于电话号码、邮箱等任意子串匹配。
+    两者都是外部内容表，由触发器保持与contacts同步。
+    两张表及其触发器在一个SAVEPOINT中创建，任何一步失败（SQLite不支持FTS5
+    或trigram分词）都整体回滚，搜索退回到LIKE查询，不会留下只建了一半的索引。
+
+    Returns:
+        bool: 索引是否创建成功，跳过时为False
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN (?, ?)", SEARCH_TABLES)
+    existing = {row[0] for row in cursor.fetchall()}
+    columns = ", ".join(SEARCH_COLUMNS)
+    new_values = ", ".join(f"new.{column}" for column in SEARCH_COLUMNS)
+    old_values = ", ".join(f"old.{column}" for column in SEARCH_COLUMNS)
+
+    cursor.execute("SAVEPOINT search_indexes")
+    try:
+        for table, options in zip(SEARCH_TABLES, ("tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'",
+                                                  "tokenize='trigram'")):
+            cursor.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+                    {columns},
+                    content='contacts', content_rowid='id',
+                    {options}
+                )
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON contacts BEGIN
+                    INSERT INTO {table}(rowid, {columns}) VALUES (new.id, {new_values});
+                END
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON contacts BEGIN
+                    INSERT INTO {table}({table}, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+                END
+            """)
+            # 只有文本字段变化时才重建索引，切换星标不会触发
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {columns} ON contacts BEGIN
+                    INSERT INTO {table}({table}, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+                    INSERT INTO {table}(rowid, {columns}) VALUES (new.id, {new_values});
+                END
+            """)
+    except sqlite3.OperationalError as e:
+        cursor.execute("ROLLBACK TO search_indexes")
+        cursor.execute("RELEASE search_indexes")
+        logger.warning("FTS5 is not available, falling back to LIKE search: %s", e)
+        return False
+    cursor.execute("RELEASE search_indexes")
+
+    # 首次创建时为已有数据建立索引。写入过的FTS5表被ROLLBACK TO删除后提交会
+    # 失败，所以等两张表都建好后才写入
+    for table in SEARCH_TABLES:
+        if table not in existing:
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+    return True
+
+
+def create_change_log(cursor):
+    """
+    创建只追加的变更日志contact_changes，由contacts上的触发器写入
+
+    seq单调递增（AUTOINCREMENT保证不会复用），客户端记住最后看到的seq，
+    之后只拉取新的插入、修改和删除（墓碑）。已有的联系人各记一条insert，
+    因此从seq 0开始同步可以得到完整的通讯录。
+    """
+    cursor.execute("""
+        CREATE TABLE contact_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            contact_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # 按联系人查找更晚的变更，用于每个联系人只返回最新的一条
+    cursor.execute("CREATE INDEX idx_contact_changes_contact ON contact_changes(contact_id, seq)")
+    cursor.execute("INSERT INTO contact_changes (contact_id, op) SELECT id, 'insert' FROM contacts ORDER BY id")
+
+    for event, op, row in (('INSERT', 'insert', 'new'), ('UPDATE', 'update', 'new'), ('DELETE', 'delete', 'old')):
+        cursor.execute(f"""
+            CREATE TRIGGER contact_changes_{op} AFTER {event} ON contacts BEGIN
+                INSERT INTO contact_changes (contact_id, op) VALUES ({row}.id, '{op}');
+            END
+        """)
+
+
+def create_match_indexes(cursor):
+    """
+    重复检测使用的电话号码和邮箱归一化键的表达式索引，由SQLite随写入自动维护
+    """
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_contacts_phone_key ON contacts({phone_key_sql('phone_number')})")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_contacts_email_key ON contacts({email_key_sql('email')})")
+
+
+def create_facet_counts(cursor):
+    """
+    创建按分组和星标统计联系人数量的汇总表contact_facets，由触发器增量维护
+
+    初始数据使用idx_contacts_category_name索引上的GROUP BY统计；之后每次写入
+    只更新一两行计数，读取统计结果与联系人总数无关。计数为0的行会被删除。
+    """
+    cursor.execute("""
+        CREATE TABLE contact_facets (
+            category TEXT NOT NULL,
+            is_starred INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (category, is_starred)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        INSERT INTO contact_facets (category, is_starred, count)
+        SELECT IFNULL(category, ''), IFNULL(is_starred, 0) != 0, COUNT(*)
+        FROM contacts GROUP BY IFNULL(category, ''), IFNULL(is_starred, 0) != 0
+    """)
+
+    add = """
+        INSERT INTO contact_facets (category, is_starred, count)
+        VALUES (IFNULL(new.category, ''), IFNULL(new.is_starred, 0) != 0, 1)
+        ON CONFLICT (category, is_starred) DO UPDATE SET count = count + 1;
+    """
+    remove = """
+        UPDATE contact_facets SET count = count - 1
+        WHERE category = IFNULL(old.category, '') AND is_starred = (IFNULL(old.is_starred, 0) != 0);
+        DELETE FROM contact_facets
+        WHERE category = IFNULL(old.category, '') AND is_starred = (IFNULL(old.is_starred, 0) != 0) AND count <= 0;
+    """
+    cursor.execute(f"CREATE TRIGGER contact_facets_insert AFTER INSERT ON contacts BEGIN {add} END")
+    cursor.execute(f"CREATE TRIGGER contact_facets_delete AFTER DELETE ON contacts BEGIN {remove} END")
+    # 只有分组或星标变化时才调整计数
+    cursor.execute(f"""
+        CREATE TRIGGER contact_facets_update AFTER UPDATE OF category, is_starred ON contacts
+        WHEN IFNULL(old.category, '') != IFNULL(new.category, '')
+          OR (IFNULL(old.is_starred, 0) != 0) != (IFNULL(new.is_starred, 0) != 0)
+        BEGIN {remove} {add} END
+    """)
+
+
+def normalize_starred(cursor):
+    """
+    把is_starred统一为0或1。旧版本会原样写入请求中的null，星标排序按
+    is_starred比较游标，NULL行在第一页之后就再也读不到
+    """
+    cursor.execute("""
+        UPDATE contacts SET is_starred = CASE WHEN is_starred THEN 1 ELSE 0 END
+        WHERE is_starred IS NULL OR is_starred NOT IN (0, 1)
+    """)
+
+
+def fill_name_keys(cursor):
+    """
+    为name_key为空的联系人计算姓名分块键。应用写入时会一并写入name_key，
+    为空的只有迁移前的行，以及由其他工具插入的行
+
+    Returns:
+        int: 填写的行数
+    """
+    cursor.connection.create_function('contact_name_key', 2, name_key, deterministic=True)
+    cursor.execute("UPDATE contacts SET name_key = contact_name_key(first_name, last_name) WHERE name_key IS NULL")
+    return cursor.rowcount
+
+
+def create_name_key_index(cursor):
+    """
+    保存重复检测使用的姓名分块键（语音键）并建立索引
+
+    分块键由Python计算（dedup.name_key），由应用在每次写入姓名时一并写入，
+    查找重复时直接按索引读取同一块中的联系人，不再每次为所有行重新计算和排序。
+    索引包含姓名，读取分块时不需要回表。name_key不是联系人的内容，
+    变更日志的修改触发器改为只在联系人字段变化时记录，填写name_key不会产生变更
+    """
+    cursor.execute("ALTER TABLE contacts ADD COLUMN name_key TEXT")
+    cursor.execute("DROP TRIGGER contact_changes_update")
+    cursor.execute("""
+        CREATE TRIGGER contact_changes_update AFTER UPDATE OF
+            first_name, last_name, category, phone_number, email, address, institution, is_starred
+        ON contacts BEGIN
+            INSERT INTO contact_changes (contact_id, op) VALUES (new.id, 'update');
+        END
+    """)
+    fill_name_keys(cursor)
+    cursor.execute("CREATE INDEX idx_contacts_name_key ON contacts(name_key, first_name, last_name)")
+
+
+# 按版本号排列的迁移：(版本号, 说明, 迁移函数)。只能在末尾追加，不能修改已发布的迁移
+MIGRATIONS = [
+    (1, 'create or upgrade the contacts table', create_contacts_table),
+    (2, 'add listing and pagination indexes', create_page_indexes),
+    (3, 'add FTS5 search indexes', create_search_indexes),
+    (4, 'add the contact change log', create_change_log),
+    (5, 'add phone and email match indexes', create_match_indexes),
+    (6, 'add the category and starred facet counts', create_facet_counts),
+    (7, 'store is_starred as 0 or 1', normalize_starred),
+    (8, 'add the indexed name blocking key', create_name_key_index),
+]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """
+    执行所有尚未应用的迁移
+
+    每个迁移在一个BEGIN IMMEDIATE事务中执行，并在同一事务中更新user_version，
+    失败时整体回滚。多个进程同时启动时，拿到写锁后会重新检查版本号。
+    数据库已是最新版本时只需读取一次user_version。
+    迁移函数返回False表示因SQLite缺少可选功能而跳过（例如FTS5）：版本号照常
+    前进，以便执行后续迁移，但该迁移不计入返回结果，由调用方在之后重试。
+
+    Args:
+        conn (sqlite3.Connection): 数据库连接
+        migrations (list): (版本号, 说明, 迁移函数)列表
+
+    Returns:
+        list: 本次应用的迁移，每项包含version、description和seconds，不含跳过的迁移
+    """
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    applied = []
+
+    for version, description, migration in migrations:
+        if version <= current:
+            continue
+
+        start = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version <= current:
+                conn.rollback()
+                continue
+            skipped = migration(conn.cursor()) is False
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        current = version
+
+        elapsed = time.perf_counter() - start
+        if skipped:
+            logger.info("Migration %d (%s) skipped", version, description)
+            continue
+        logger.info("Migration %d (%s) applied in %.1f ms", version, description, elapsed * 1000)
+        applied.append({"version": version, "description": description, "seconds": elapsed})
+
+    return applied
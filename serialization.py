@@ -0,0 +1,175 @@
+"""
+JSON serialisation of ContactRecord tuples.
+
+Records are written straight into a JSON object template instead of being
+copied into a dict per row first. The keys appear in sorted order, the same
+order Flask's jsonify uses, so clients see an identical object layout.
+
+The listing and search responses are built by encode_contacts(), which uses
+orjson when it is installed and can also write the columnar layout: the
+field names once, then one array per contact.
+"""
+
+import json
+from json.encoder import encode_basestring_ascii
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from database import RECORD_FIELDS
+
+
+# Layouts of contact lists: one object per contact, or field names and rows
+CONTACT_LAYOUTS = ('objects', 'columns')
+
+
+_CONTACT_TEMPLATE = ('{"address":%s,"category":%s,"email":%s,"first_name":%s,"id":%d,'
+                     '"institution":%s,"is_starred":%s,"last_name":%s,"phone_number":%s}')
+
+
+def _encode_value(value):
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    return json.dumps(value)
+
+
+def contact_json(record):
+    """
+    Serialise one contact.
+
+    Args:
+        record (ContactRecord): Contact fields in database.RECORD_FIELDS order
+
+    Returns:
+        str: JSON object text
+    """
+    contact_id, first_name, last_name, category, phone_number, email, address, institution, is_starred = record
+    starred = 'true' if is_starred else 'false'
+    try:
+        return _CONTACT_TEMPLATE % (
+            encode_basestring_ascii(address), encode_basestring_ascii(category),
+            encode_basestring_ascii(email), encode_basestring_ascii(first_name), contact_id,
+            encode_basestring_ascii(institution), starred,
+            encode_basestring_ascii(last_name), encode_basestring_ascii(phone_number))
+    except TypeError:
+        # NULL columns from legacy rows, or non-text values
+        return _CONTACT_TEMPLATE % (
+            _encode_value(address), _encode_value(category),
+            _encode_value(email), _encode_value(first_name), contact_id,
+            _encode_value(institution), starred,
+            _encode_value(last_name), _encode_value(phone_number))
+
+
+def contacts_json(records):
+    """
+    Serialise a list of contacts as a JSON array.
+
+    Returns:
+        str: JSON array text
+    """
+    return '[' + ','.join(map(contact_json, records)) + ']'
+
+
+def _contact_object(record):
+    contact_id, first_name, last_name, category, phone_number, email, address, institution, is_starred = record
+    return {"address": address, "category": category, "email": email, "first_name": first_name, "id": contact_id,
+            "institution": institution, "is_starred": bool(is_starred), "last_name": last_name,
+            "phone_number": phone_number}
+
+
+def encode_contacts(records, layout='objects', **extra):
+    """
+    Serialise a list of contacts as UTF-8 JSON.
+
+    In the objects layout the result is a JSON array of contact objects, or
+    {"contacts": [...]} when extra members are given. In the columns layout
+    it is {"fields": RECORD_FIELDS, "rows": [[...], ...]}, about half the
+    size, with is_starred as a boolean in both.
+
+    Args:
+        records (list): ContactRecord tuples
+        layout (str): One of CONTACT_LAYOUTS
+        **extra: Further members of the response object, e.g. next_cursor
+
+    Returns:
+        bytes: JSON text with object keys in sorted order
+    """
+    if layout == 'columns':
+        rows = [(*record[:-1], bool(record[-1])) for record in records]
+        value = dict(sorted(dict(extra, fields=RECORD_FIELDS, rows=rows).items()))
+    elif orjson is None:
+        # The template encoder is faster than json.dumps on dicts
+        contacts = contacts_json(records)
+        if extra:
+            members = ''.join(',%s:%s' % (json.dumps(key), json.dumps(value)) for key, value in sorted(extra.items()))
+            contacts = '{"contacts":%s%s}' % (contacts, members)
+        return contacts.encode('utf-8')
+    else:
+        contacts = list(map(_contact_object, records))
+        value = dict(sorted(dict(extra, contacts=contacts).items())) if extra else contacts
+
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def change_json(change):
+    """
+    Serialise one change feed entry: the current contact for inserts and
+    updates, or a tombstone carrying only the id for deletes.
+
+    Args:
+        change (ContactChange): Entry returned by Database.get_changes
+
+    Returns:
+        str: JSON object text
+    """
+    if change.contact is None:
+        return '{"id":%d,"op":"delete","seq":%d}' % (change.id, change.seq)
+    return '{"contact":%s,"id":%d,"op":"%s","seq":%d}' % (contact_json(change.contact), change.id, change.op, change.seq)
+
+
+def duplicate_group_json(group):
+    """
+    Serialise one group of suspected duplicates.
+
+    Args:
+        group (DuplicateGroup): Group returned by Database.find_duplicates
+
+    Returns:
+        str: JSON object text
+    """
+    return '{"contacts":%s,"ids":%s,"reasons":%s}' % (
+        contacts_json(group.contacts), json.dumps(group.ids), json.dumps(group.reasons))
+
+
+def duplicate_match_json(match):
+    """
+    Serialise one existing contact matching a prospective one.
+
+    Args:
+        match (DuplicateMatch): Match returned by Database.find_matches
+
+    Returns:
+        str: JSON object text
+    """
+    return '{"contact":%s,"reasons":%s,"score":%s}' % (
+        contact_json(match.contact), json.dumps(match.reasons), json.dumps(match.score))
+
+
+def facets_json(facets):
+    """
+    Serialise the category and starred counts, with totals.
+
+    Args:
+        facets (list): FacetCount tuples returned by Database.get_facets
+
+    Returns:
+        str: JSON object text
+    """
+    categories = ','.join('{"category":%s,"count":%d,"starred":%d}' % (_encode_value(facet.category), facet.count, facet.starred)
+                          for facet in facets)
+    return '{"categories":[%s],"starred":%d,"total":%d}' % (
+        categories, sum(facet.starred for facet in facets), sum(facet.count for facet in facets))
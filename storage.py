@@ -0,0 +1,132 @@
+"""
+Storage backends for the address book.
+
+StorageBackend describes what AddressBook, the importer and the import jobs
+need from a backend. Two backends implement it:
+
+- sqlite: database.Database, the SQLite database file (the default)
+- memory: memory_storage.MemoryDatabase, Python data structures with hash
+  and sorted indexes, starting from a copy of the database file if one
+  exists and never writing to it
+
+open_storage() picks one by name, e.g. from CONTACTS_STORAGE.
+"""
+
+from typing import Protocol, runtime_checkable
+
+from database import Database
+from memory_storage import MemoryDatabase
+
+
+STORAGE_BACKENDS = ('sqlite', 'memory')
+
+
+@runtime_checkable
+class StorageBackend(Protocol):
+    """
+    Operations every storage backend provides. Contacts are returned as
+    database.ContactRecord tuples. Writes take dicts with the fields of
+    database.CONTACT_FIELDS, or tuples in that order for the bulk methods.
+    """
+
+    @property
+    def generation(self):
+        """Number incremented after every write, for cache invalidation"""
+
+    # Listing and reading
+
+    def get_all_contacts(self):
+        """All contacts, starred first, then by name"""
+
+    def get_contacts_page(self, limit, cursor=None, sort='starred', order='asc', category=None):
+        """(contacts, next_cursor) for one page; ValueError on bad arguments"""
+
+    def iter_contact_batches(self, batch_size=1000, sort='starred', order='asc'):
+        """Yield all contacts in lists of at most batch_size"""
+
+    def get_contact(self, contact_id):
+        """The contact with this id, or None"""
+
+    def get_facets(self):
+        """FacetCount per category, sorted by category"""
+
+    def get_change_seq(self):
+        """Sequence number of the latest change, 0 if there are none"""
+
+    def get_changes(self, since=0, limit=500):
+        """(changes, last_seq, has_more) after since, latest per contact"""
+
+    # Single contact writes
+
+    def add_contact(self, contact_data):
+        """Id of the new contact, or False if the name already exists"""
+
+    def update_contact(self, old_first_name, old_last_name, contact_data):
+        """Whether the contact was found; sqlite3.IntegrityError on a name conflict"""
+
+    def update_contact_by_id(self, contact_id, contact_data):
+        """Whether the contact was found; sqlite3.IntegrityError on a name conflict"""
+
+    def delete_contact(self, first_name, last_name):
+        """Whether the contact existed"""
+
+    def delete_contact_by_id(self, contact_id):
+        """Whether the contact existed"""
+
+    def toggle_starred(self, first_name, last_name):
+        """Whether the contact was found"""
+
+    def toggle_starred_by_id(self, contact_id):
+        """The new starred status, or None if the contact was not found"""
+
+    # Bulk writes
+
+    def apply_batch(self, operations):
+        """One result dict per add, update, delete or star operation"""
+
+    def bulk_add_contacts(self, contacts_data):
+        """(number added, duplicate names) for contact dicts"""
+
+    def bulk_add_rows(self, rows):
+        """(number added, duplicate names) for CONTACT_FIELDS tuples"""
+
+    def bulk_merge_rows(self, rows):
+        """(number added, number merged, duplicate names) for CONTACT_FIELDS tuples"""
+
+    # Search and duplicates
+
+    def search_contacts(self, search_term, limit=None):
+        """Contacts matching every term, starred first"""
+
+    def find_duplicates(self, limit=100):
+        """(DuplicateGroup list, total number of groups)"""
+
+    def find_matches(self, contact_data, limit=10):
+        """DuplicateMatch list of contacts a new contact would duplicate"""
+
+    def close(self):
+        """Release connections or other resources"""
+
+
+def open_storage(backend, db_file, pool_size=5, statement_timer=None):
+    """
+    Open a storage backend by name.
+
+    Args:
+        backend (str): One of STORAGE_BACKENDS
+        db_file (str): SQLite database file; the memory backend only reads
+            it once to start from a copy of its contacts
+        pool_size (int): Connections in the SQLite connection pool
+        statement_timer (StatementTimer): Times SQLite statements, if set
+
+    Returns:
+        StorageBackend: The opened backend
+
+    Raises:
+        ValueError: Unknown backend name
+    """
+    if backend == 'sqlite':
+        return Database(db_file, pool_size=pool_size, statement_timer=statement_timer)
+    if backend == 'memory':
+        return MemoryDatabase.from_sqlite(db_file)
+    raise ValueError(f"Unknown storage backend '{backend}', expected one of {', '.join(STORAGE_BACKENDS)}")
@@ -0,0 +1,41 @@
+"""
+Tests of the contacts API.
+
+app.py opens CONTACTS_DB when it is imported, so the tests point it at a
+fresh database in a temporary directory before importing it. Run them from
+the project root with:
+
+    python -m unittest discover -s tests -t .
+"""
+
+import os
+import tempfile
+import unittest
+
+_directory = tempfile.mkdtemp(prefix='contacts-tests-')
+os.environ['CONTACTS_DB'] = os.path.join(_directory, 'contacts.db')
+os.environ['CONTACTS_STORAGE'] = 'sqlite'
+os.environ['CONTACTS_REPLICA'] = 'off'
+os.environ.setdefault('CONTACTS_LOG_LEVEL', 'WARNING')
+
+from app import address_book, app  # noqa: E402
+
+
+class ContactAPITestCase(unittest.TestCase):
+    """
+    Starts every test with an empty address book and a test client.
+    """
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app.testing = True
+        for contact in address_book.db.get_all_contacts():
+            address_book.db.delete_contact_by_id(contact.id)
+
+    def add_contact(self, first_name, last_name, **fields):
+        """
+        Add a contact through the API and return its id.
+        """
+        response = self.app.post('/contacts', json=dict(fields, first_name=first_name, last_name=last_name))
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()['id']
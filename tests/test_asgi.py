@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+import asgi
+from tests import ContactAPITestCase
+
+
+def http_scope(method, path, query_string=b'', headers=()):
+    return {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+            'path': path, 'root_path': '', 'query_string': query_string, 'headers': list(headers),
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80)}
+
+
+async def call(scope, body_chunks=(b'',), complete=True):
+    """
+    Run one request through the ASGI application and return the messages it
+    sent. Without complete the client disconnects before the last chunk.
+    """
+    received = [{'type': 'http.request', 'body': chunk, 'more_body': not complete or i < len(body_chunks) - 1}
+                for i, chunk in enumerate(body_chunks)]
+    sent = []
+
+    async def receive():
+        if received:
+            return received.pop(0)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi.application(scope, receive, send)
+    return sent
+
+
+class TestASGIApplication(ContactAPITestCase):
+    def request(self, scope, body_chunks=(b'',)):
+        """
+        Status, headers and full body of a response, checking that it was
+        sent as one start message followed by body messages.
+        """
+        start, *bodies = asyncio.run(call(scope, body_chunks))
+        self.assertEqual(start['type'], 'http.response.start')
+        self.assertEqual({message['type'] for message in bodies}, {'http.response.body'})
+        self.assertFalse(bodies[-1].get('more_body'))
+        return start['status'], dict(start['headers']), b''.join(message.get('body', b'') for message in bodies)
+
+    def test_get_request(self):
+        self.add_contact('Ada', 'Lovelace')
+        status, headers, body = self.request(http_scope('GET', '/contacts'))
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'content-type'], b'application/json')
+        self.assertIn(b'"first_name":"Ada"', body)
+
+    def test_request_body_in_several_messages(self):
+        body = b'{"first_name": "Ada", "last_name": "Lovelace", "email": "ada@example.com"}'
+        scope = http_scope('POST', '/contacts', headers=[(b'content-type', b'application/json')])
+        self.assertEqual(self.request(scope, [body[:10], body[10:30], body[30:]])[0], 201)
+        self.assertEqual(self.app.get('/contacts').get_json()[0]['email'], 'ada@example.com')
+
+    def test_query_string_and_repeated_headers(self):
+        self.add_contact('Ada', 'Lovelace')
+        scope = http_scope('GET', '/contacts/search', b'q=Ada')
+        status, headers, body = self.request(scope)
+        self.assertEqual(status, 200)
+        self.assertIn(b'Lovelace', body)
+
+        scope['headers'] = [(b'if-none-match', b'"other"'), (b'if-none-match', headers[b'etag'])]
+        self.assertEqual(self.request(scope)[0], 304)
+
+    def test_streamed_export(self):
+        for i in range(3):
+            self.add_contact(f'Name{i}', 'Test')
+        status, headers, body = self.request(http_scope('GET', '/contacts/export', b'format=csv'))
+        self.assertEqual(status, 200)
+        self.assertEqual(body.decode('utf-8-sig').count('Test'), 3)
+
+    def test_requests_run_concurrently_on_the_request_pool(self):
+        # Both requests must be inside the app at the same time to pass the
+        # barrier, which fails if requests are served one at a time
+        flask_app = asgi.app
+        barrier = threading.Barrier(2, timeout=5)
+        threads = []
+
+        def wsgi_app(environ, start_response):
+            threads.append(threading.current_thread().name)
+            barrier.wait()
+            return flask_app(environ, start_response)
+
+        async def both():
+            return await asyncio.gather(call(http_scope('GET', '/contacts')), call(http_scope('GET', '/contacts')))
+
+        with mock.patch.object(asgi, 'app', wsgi_app):
+            results = asyncio.run(both())
+        self.assertEqual([messages[0]['status'] for messages in results], [200, 200])
+        self.assertTrue(all(name.startswith('asgi-request') for name in threads), threads)
+
+    def test_client_disconnecting_before_the_body_is_read(self):
+        scope = http_scope('POST', '/contacts', headers=[(b'content-type', b'application/json')])
+        self.assertEqual(asyncio.run(call(scope, [b'{"first_name": '], complete=False)), [])
+        self.assertEqual(self.app.get('/contacts').get_json(), [])
+
+    def test_event_stream_is_served_natively(self):
+        start, first, *_ = asyncio.run(call(http_scope('GET', '/contacts/events')))
+        self.assertEqual(start['status'], 200)
+        self.assertEqual(dict(start['headers'])[b'content-type'], b'text/event-stream; charset=utf-8')
+        self.assertEqual(first['body'], b'retry: 3000\n\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+
+from app import BATCH_MAX_OPERATIONS
+from tests import ContactAPITestCase
+
+
+def contact(first_name, last_name, **fields):
+    return dict(fields, first_name=first_name, last_name=last_name)
+
+
+class TestContactBatch(ContactAPITestCase):
+    def batch(self, operations, status_code=200):
+        response = self.app.post('/contacts/batch', json={'operations': operations})
+        self.assertEqual(response.status_code, status_code)
+        return response.get_json()
+
+    def contacts(self):
+        return {(c['first_name'], c['last_name']): c for c in self.app.get('/contacts').get_json()}
+
+    def test_mixed_operations_run_in_order(self):
+        ada = self.add_contact('Ada', 'Lovelace')
+        alan = self.add_contact('Alan', 'Turing')
+        data = self.batch([
+            {'op': 'add', 'contact': contact('Grace', 'Hopper', category='Family')},
+            {'op': 'update', 'id': ada, 'contact': contact('Ada', 'King', email='ada@example.com')},
+            {'op': 'star', 'id': alan},
+            {'op': 'star', 'id': alan},
+            {'op': 'star', 'first_name': 'Grace', 'last_name': 'Hopper', 'is_starred': True},
+            {'op': 'delete', 'first_name': 'Alan', 'last_name': 'Turing'},
+        ])
+        self.assertEqual([result['status'] for result in data['results']], ['ok'] * 6)
+        self.assertEqual([result['index'] for result in data['results']], list(range(6)))
+        self.assertEqual(data['summary'], {'ok': 6, 'not_found': 0, 'conflict': 0, 'invalid': 0})
+
+        # A toggle sees the state left by the operations before it
+        self.assertEqual([data['results'][i]['is_starred'] for i in (2, 3, 4)], [True, False, True])
+        grace = data['results'][0]['id']
+        self.assertEqual(data['results'][4]['id'], grace)
+        self.assertEqual(data['results'][5]['id'], alan)
+
+        contacts = self.contacts()
+        self.assertEqual(sorted(contacts), [('Ada', 'King'), ('Grace', 'Hopper')])
+        self.assertEqual(contacts['Ada', 'King']['id'], ada)
+        self.assertEqual(contacts['Ada', 'King']['email'], 'ada@example.com')
+        self.assertTrue(contacts['Grace', 'Hopper']['is_starred'])
+        self.assertEqual(contacts['Grace', 'Hopper']['category'], 'Family')
+
+    def test_failed_items_get_their_own_result(self):
+        ada = self.add_contact('Ada', 'Lovelace')
+        alan = self.add_contact('Alan', 'Turing')
+        data = self.batch([
+            {'op': 'add', 'contact': contact('Ada', 'Lovelace')},
+            {'op': 'add', 'contact': contact('Grace', 'Hopper')},
+            {'op': 'add', 'contact': contact('Grace', 'Hopper')},
+            {'op': 'update', 'id': alan, 'contact': contact('Ada', 'Lovelace')},
+            {'op': 'update', 'id': 999999, 'contact': contact('Nobody', 'Known')},
+            {'op': 'delete', 'first_name': 'Nobody', 'last_name': 'Known'},
+            {'op': 'delete', 'id': ada},
+            {'op': 'delete', 'id': ada},
+            {'op': 'rename'},
+            {'op': 'add', 'contact': {'first_name': 'Grace'}},
+            {'op': 'star', 'id': '1'},
+            {'op': 'delete'},
+            'delete',
+        ])
+        self.assertEqual([result['status'] for result in data['results']], [
+            'conflict', 'ok', 'conflict', 'conflict', 'not_found', 'not_found', 'ok', 'not_found',
+            'invalid', 'invalid', 'invalid', 'invalid', 'invalid'])
+        self.assertEqual(data['summary'], {'ok': 2, 'not_found': 3, 'conflict': 3, 'invalid': 5})
+        self.assertEqual(data['results'][3]['id'], alan)
+        self.assertIn('already exists', data['results'][0]['error'])
+        self.assertIn('op must be one of', data['results'][8]['error'])
+        self.assertEqual(data['results'][10]['error'], 'id must be an integer')
+
+        # The failures left the other items applied and committed
+        self.assertEqual(sorted(self.contacts()), [('Alan', 'Turing'), ('Grace', 'Hopper')])
+
+    def test_bare_list_is_accepted(self):
+        response = self.app.post('/contacts/batch', json=[{'op': 'add', 'contact': contact('Ada', 'Lovelace')}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['summary']['ok'], 1)
+
+    def test_malformed_requests_are_rejected(self):
+        for body in ({'operations': 'add'}, {'ops': []}, 'add'):
+            response = self.app.post('/contacts/batch', json=body)
+            self.assertEqual(response.status_code, 400, body)
+        response = self.app.post('/contacts/batch', data='not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_size_is_limited(self):
+        data = self.batch([{'op': 'delete', 'id': 1}] * (BATCH_MAX_OPERATIONS + 1), status_code=400)
+        self.assertIn(str(BATCH_MAX_OPERATIONS), data['error'])
+
+    def test_writes_are_visible_to_cached_reads_and_the_change_log(self):
+        seq = self.app.get('/contacts/changes').get_json()['last_seq']
+        self.assertEqual(self.app.get('/contacts').get_json(), [])
+        self.batch([{'op': 'add', 'contact': contact('Ada', 'Lovelace')},
+                    {'op': 'add', 'contact': contact('Alan', 'Turing')}])
+        self.assertEqual(len(self.app.get('/contacts').get_json()), 2)
+        changes = self.app.get('/contacts/changes', query_string={'since': seq}).get_json()['changes']
+        self.assertEqual([change['op'] for change in changes], ['insert', 'insert'])
+
+
+if __name__ == '__main__':
+    unittest.main()
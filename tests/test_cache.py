@@ -0,0 +1,152 @@
+import io
+import time
+import unittest
+from unittest import mock
+
+from app import response_cache
+from cache import ResponseCache
+from tests import ContactAPITestCase
+from tests.test_import import sheet_row, workbook_bytes
+
+
+class TestCachedResponses(ContactAPITestCase):
+    def get(self, url, etag=None, **args):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.app.get(url, query_string=args, headers=headers)
+
+    def assertNotModified(self, url, etag, **args):
+        response = self.get(url, etag, **args)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+    def assertModified(self, url, etag, **args):
+        response = self.get(url, etag, **args)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        return response
+
+    def test_listing_is_revalidated_until_a_write(self):
+        ada = self.add_contact('Ada', 'Lovelace')
+        response = self.get('/contacts')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        etag = response.headers['ETag']
+        self.assertNotModified('/contacts', etag)
+
+        # Every kind of write invalidates the cached listing
+        writes = [
+            lambda: self.add_contact('Alan', 'Turing'),
+            lambda: self.app.put(f'/contacts/{ada}', json={'first_name': 'Ada', 'last_name': 'King'}),
+            lambda: self.app.put(f'/contacts/{ada}/star'),
+            lambda: self.app.post('/contacts/batch', json=[{'op': 'add', 'contact': {'first_name': 'Grace',
+                                                                                   'last_name': 'Hopper'}}]),
+            lambda: self.app.post('/contacts/import', content_type='multipart/form-data', data={
+                'file': (io.BytesIO(workbook_bytes([sheet_row('Linus', 'Torvalds')])), 'contacts.xlsx')}),
+            lambda: self.app.delete(f'/contacts/{ada}'),
+        ]
+        for write in writes:
+            write()
+            response = self.assertModified('/contacts', etag)
+            etag = response.headers['ETag']
+            self.assertNotModified('/contacts', etag)
+        self.assertEqual(sorted(c['first_name'] for c in response.get_json()), ['Alan', 'Grace', 'Linus'])
+
+    def test_writes_that_change_nothing_keep_the_etag(self):
+        self.add_contact('Ada', 'Lovelace')
+        etag = self.get('/contacts').headers['ETag']
+        misses = response_cache.stats()['misses']
+        self.assertEqual(self.app.put('/contacts/999999', json={'first_name': 'No', 'last_name': 'One'}).status_code,
+                         404)
+        self.assertEqual(self.app.post('/contacts', json={'first_name': 'Ada', 'last_name': 'Lovelace'}).status_code,
+                         400)
+        self.app.post('/contacts/import', content_type='multipart/form-data', data={
+            'file': (io.BytesIO(workbook_bytes([sheet_row('Ada', 'Lovelace')])), 'contacts.xlsx')})
+        # The cached listing is still current, so it is not built again
+        self.assertNotModified('/contacts', etag)
+        self.assertEqual(response_cache.stats()['misses'], misses)
+
+    def test_etag_follows_the_content(self):
+        self.add_contact('Ada', 'Lovelace')
+        etag = self.get('/contacts').headers['ETag']
+        alan = self.add_contact('Alan', 'Turing')
+        self.app.delete(f'/contacts/{alan}')
+        # The listing is built again after the writes, to the same body and ETag
+        self.assertNotModified('/contacts', etag)
+
+    def test_pages_are_cached_per_query(self):
+        for i in range(5):
+            self.add_contact(f'Name{i}', 'Test')
+        first = self.get('/contacts', limit=2)
+        second = self.get('/contacts', limit=2, cursor=first.get_json()['next_cursor'])
+        self.assertNotEqual(first.headers['ETag'], second.headers['ETag'])
+        self.assertNotModified('/contacts', first.headers['ETag'], limit=2)
+        self.assertEqual(self.get('/contacts', first.headers['ETag'], limit=3).status_code, 200)
+
+        # A write that leaves the first page as it was keeps its ETag valid
+        self.add_contact('Name5', 'Test')
+        self.assertNotModified('/contacts', first.headers['ETag'], limit=2)
+        self.add_contact('Aaron', 'Test')
+        response = self.assertModified('/contacts', first.headers['ETag'], limit=2)
+        self.assertEqual(response.get_json()['contacts'][0]['first_name'], 'Aaron')
+
+    def test_search_is_revalidated_until_a_write(self):
+        ada = self.add_contact('Ada', 'Lovelace')
+        response = self.get('/contacts/search', q='Lovelace')
+        self.assertEqual([c['id'] for c in response.get_json()], [ada])
+        etag = response.headers['ETag']
+        self.assertNotModified('/contacts/search', etag, q='Lovelace')
+        self.assertEqual(self.get('/contacts/search', etag, q='Grace').status_code, 200)
+
+        self.add_contact('Byron', 'Lovelace')
+        response = self.assertModified('/contacts/search', etag, q='Lovelace')
+        self.assertEqual(len(response.get_json()), 2)
+
+    def test_cache_hits_are_counted(self):
+        self.add_contact('Ada', 'Lovelace')
+        self.get('/contacts')
+        hits = response_cache.stats()['hits']
+        self.get('/contacts')
+        self.get('/contacts')
+        self.assertEqual(response_cache.stats()['hits'], hits + 2)
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_entries_are_tied_to_a_generation(self):
+        cache = ResponseCache()
+        entry = cache.put('key', 1, b'[]')
+        self.assertIs(cache.get('key', 1), entry)
+        self.assertIsNone(cache.get('key', 2))
+        self.assertIsNone(cache.get('key', 1))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResponseCache(max_entries=2)
+        cache.put('a', 1, b'a')
+        cache.put('b', 1, b'b')
+        cache.get('a', 1)
+        cache.put('c', 1, b'c')
+        self.assertIsNotNone(cache.get('a', 1))
+        self.assertIsNone(cache.get('b', 1))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_size_is_bounded_in_bytes(self):
+        cache = ResponseCache(max_bytes=10)
+        cache.put('a', 1, b'x' * 6)
+        cache.put('b', 1, b'x' * 6)
+        self.assertIsNone(cache.get('a', 1))
+        self.assertEqual(cache.stats()['bytes'], 6)
+
+        # A body larger than the bound is returned but not kept
+        entry = cache.put('c', 1, b'x' * 11)
+        self.assertEqual(entry.body, b'x' * 11)
+        self.assertIsNone(cache.get('c', 1))
+
+    def test_entries_expire(self):
+        cache = ResponseCache(ttl=60)
+        cache.put('a', 1, b'a')
+        with mock.patch('cache.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get('a', 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
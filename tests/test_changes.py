@@ -0,0 +1,85 @@
+import unittest
+
+from tests import ContactAPITestCase
+
+
+class TestContactChanges(ContactAPITestCase):
+    def current_seq(self):
+        response = self.app.get('/contacts/changes')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual((data['changes'], data['has_more']), ([], False))
+        return data['last_seq']
+
+    def changes_since(self, since, **args):
+        query = ''.join(f'&{key}={value}' for key, value in args.items())
+        response = self.app.get(f'/contacts/changes?since={since}{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_inserts_updates_and_tombstones(self):
+        since = self.current_seq()
+        ada = self.add_contact('Ada', 'Lovelace')
+        alan = self.add_contact('Alan', 'Turing')
+        self.app.put(f'/contacts/{ada}', json={'first_name': 'Ada', 'last_name': 'Lovelace', 'email': 'ada@example.com'})
+        self.app.delete(f'/contacts/{alan}')
+
+        data = self.changes_since(since)
+        self.assertFalse(data['has_more'])
+        self.assertEqual([(change['id'], change['op']) for change in data['changes']],
+                         [(ada, 'update'), (alan, 'delete')])
+        self.assertEqual(data['changes'][0]['contact']['email'], 'ada@example.com')
+        self.assertNotIn('contact', data['changes'][1])
+        self.assertEqual(data['last_seq'], self.current_seq())
+        self.assertEqual(data['last_seq'], data['changes'][-1]['seq'])
+
+    def test_nothing_new_after_last_seq(self):
+        self.add_contact('Ada', 'Lovelace')
+        last_seq = self.current_seq()
+        self.assertEqual(self.changes_since(last_seq), {'changes': [], 'has_more': False, 'last_seq': last_seq})
+
+    def test_star_toggle_is_an_update(self):
+        contact_id = self.add_contact('Ada', 'Lovelace')
+        since = self.current_seq()
+        self.app.put(f'/contacts/{contact_id}/star')
+        changes = self.changes_since(since)['changes']
+        self.assertEqual([(change['op'], change['contact']['is_starred']) for change in changes], [('update', True)])
+
+    def test_limit_pages_through_changes(self):
+        since = self.current_seq()
+        ids = [self.add_contact(f'Name{i}', 'Test') for i in range(5)]
+
+        seen, cursor = [], since
+        while True:
+            data = self.changes_since(cursor, limit=2)
+            self.assertLessEqual(len(data['changes']), 2)
+            seen.extend(change['id'] for change in data['changes'])
+            cursor = data['last_seq']
+            if not data['has_more']:
+                break
+        self.assertEqual(seen, ids)
+        self.assertEqual(cursor, self.current_seq())
+
+    def test_changes_from_zero_rebuild_the_address_book(self):
+        self.add_contact('Ada', 'Lovelace')
+        contact_id = self.add_contact('Alan', 'Turing')
+        self.app.delete(f'/contacts/{contact_id}')
+
+        contacts, cursor, has_more = {}, 0, True
+        while has_more:
+            data = self.changes_since(cursor, limit=5000)
+            for change in data['changes']:
+                if change['op'] == 'delete':
+                    contacts.pop(change['id'], None)
+                else:
+                    contacts[change['id']] = change['contact']
+            cursor, has_more = data['last_seq'], data['has_more']
+        self.assertEqual(sorted(contacts.values(), key=lambda contact: contact['id']),
+                         sorted(self.app.get('/contacts').get_json(), key=lambda contact: contact['id']))
+
+    def test_invalid_since_is_rejected(self):
+        self.assertEqual(self.app.get('/contacts/changes?since=abc').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
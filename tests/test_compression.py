@@ -0,0 +1,87 @@
+import gzip
+import unittest
+
+from compression import COMPRESS_MIN_BYTES, ENCODINGS, brotli, compress
+from database import RECORD_FIELDS
+from tests import ContactAPITestCase
+
+
+class TestCompressedResponses(ContactAPITestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(20):
+            self.add_contact(f'Name{i}', 'Test', email=f'name{i}@example.com', address=f'{i} Main Street')
+
+    def get(self, accept_encoding=None, url='/contacts', **headers):
+        if accept_encoding is not None:
+            headers['Accept-Encoding'] = accept_encoding
+        return self.app.get(url, headers=headers)
+
+    def test_gzip_is_negotiated(self):
+        plain = self.get()
+        self.assertIsNone(plain.headers.get('Content-Encoding'))
+        self.assertGreater(len(plain.data), COMPRESS_MIN_BYTES)
+
+        response = self.get('gzip, deflate')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertLess(len(response.data), len(plain.data))
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+
+        # Each encoding has its own validator
+        self.assertEqual(response.headers['ETag'], plain.headers['ETag'][:-1] + '-gzip"')
+        self.assertEqual(self.get('gzip', **{'If-None-Match': response.headers['ETag']}).status_code, 304)
+        self.assertEqual(self.get('gzip', **{'If-None-Match': plain.headers['ETag']}).status_code, 200)
+
+    def test_encodings_the_client_refuses_are_not_used(self):
+        for accept_encoding in ('identity', 'gzip;q=0', 'deflate', ''):
+            response = self.get(accept_encoding)
+            self.assertIsNone(response.headers.get('Content-Encoding'), accept_encoding)
+
+    def test_small_bodies_are_sent_as_they_are(self):
+        response = self.get('gzip', url='/contacts/search?q=Name1&limit=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.headers.get('Content-Encoding'))
+        self.assertEqual(len(response.get_json()), 1)
+
+    def test_compressed_body_follows_writes(self):
+        before = gzip.decompress(self.get('gzip').data)
+        self.add_contact('Ada', 'Lovelace')
+        after = gzip.decompress(self.get('gzip').data)
+        self.assertNotEqual(before, after)
+        self.assertEqual(after, self.get().data)
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli_is_preferred_when_installed(self):
+        response = self.get('gzip, br')
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.data), self.get().data)
+        self.assertEqual(self.get('br;q=0.5, gzip').headers['Content-Encoding'], 'gzip')
+
+    @unittest.skipIf(brotli is not None, 'brotli is installed')
+    def test_brotli_is_not_offered_without_the_package(self):
+        self.assertEqual(ENCODINGS, ('gzip',))
+        self.assertIsNone(self.get('br').headers.get('Content-Encoding'))
+        self.assertEqual(self.get('br, gzip').headers['Content-Encoding'], 'gzip')
+
+    def test_columns_layout_has_the_same_contacts(self):
+        objects = self.get().get_json()
+        columns = self.get(url='/contacts?format=columns').get_json()
+        self.assertEqual(columns['fields'], list(RECORD_FIELDS))
+        self.assertEqual([dict(zip(columns['fields'], row)) for row in columns['rows']], objects)
+        self.assertEqual(self.get(url='/contacts?format=xml').status_code, 400)
+
+
+class TestCompress(unittest.TestCase):
+    def test_gzip_output_is_reproducible(self):
+        body = b'{"contacts":[]}' * 100
+        self.assertEqual(compress(body, 'gzip'), compress(body, 'gzip'))
+        self.assertEqual(gzip.decompress(compress(body, 'gzip')), body)
+
+    def test_unsupported_encoding(self):
+        with self.assertRaises(ValueError):
+            compress(b'{}', 'deflate')
+
+
+if __name__ == '__main__':
+    unittest.main()
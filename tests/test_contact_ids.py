@@ -0,0 +1,89 @@
+import os
+import threading
+import unittest
+
+from database import Database
+from tests import ContactAPITestCase
+
+
+class TestContactIdRoutes(ContactAPITestCase):
+    def test_get_by_id(self):
+        contact_id = self.add_contact('Ada', 'Lovelace', email='ada@example.com')
+        response = self.app.get(f'/contacts/{contact_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['email'], 'ada@example.com')
+        self.assertEqual(self.app.get(f'/contacts/{contact_id + 1000}').status_code, 404)
+
+    def test_update_by_id_can_rename(self):
+        contact_id = self.add_contact('Ada', 'Lovelace')
+        response = self.app.put(f'/contacts/{contact_id}', json={'first_name': 'Augusta', 'last_name': 'King',
+                                                                 'phone_number': '555'})
+        self.assertEqual(response.status_code, 200)
+        contact = self.app.get(f'/contacts/{contact_id}').get_json()
+        self.assertEqual((contact['first_name'], contact['last_name'], contact['phone_number']),
+                         ('Augusta', 'King', '555'))
+
+    def test_update_by_id_to_an_existing_name_conflicts(self):
+        contact_id = self.add_contact('Ada', 'Lovelace')
+        self.add_contact('Alan', 'Turing')
+        response = self.app.put(f'/contacts/{contact_id}', json={'first_name': 'Alan', 'last_name': 'Turing'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.app.get(f'/contacts/{contact_id}').get_json()['first_name'], 'Ada')
+
+    def test_update_missing_id(self):
+        response = self.app.put('/contacts/999999', json={'first_name': 'No', 'last_name': 'One'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_delete_by_id(self):
+        contact_id = self.add_contact('Ada', 'Lovelace')
+        self.assertEqual(self.app.delete(f'/contacts/{contact_id}').status_code, 200)
+        self.assertEqual(self.app.get(f'/contacts/{contact_id}').status_code, 404)
+        self.assertEqual(self.app.delete(f'/contacts/{contact_id}').status_code, 404)
+
+    def test_name_routes_still_work(self):
+        self.add_contact('Ada', 'Lovelace')
+        self.assertEqual(self.app.put('/contacts/Ada/Lovelace/star').status_code, 200)
+        self.assertTrue(self.app.get('/contacts').get_json()[0]['is_starred'])
+        self.assertEqual(self.app.delete('/contacts/Ada/Lovelace').status_code, 200)
+        self.assertEqual(self.app.put('/contacts/Ada/Lovelace/star').status_code, 404)
+
+
+class TestStarToggle(ContactAPITestCase):
+    def test_toggle_returns_the_new_state(self):
+        contact_id = self.add_contact('Ada', 'Lovelace')
+        states = [self.app.put(f'/contacts/{contact_id}/star').get_json() for _ in range(3)]
+        self.assertEqual(states, [{'id': contact_id, 'is_starred': value} for value in (True, False, True)])
+        self.assertTrue(self.app.get(f'/contacts/{contact_id}').get_json()['is_starred'])
+
+    def test_toggle_missing_contact(self):
+        self.assertEqual(self.app.put('/contacts/999999/star').status_code, 404)
+
+    def test_concurrent_toggles_are_not_lost(self):
+        # A second Database has its own connections, so the toggles race in
+        # SQLite rather than queueing on the app's writer thread
+        contact_id = self.add_contact('Ada', 'Lovelace')
+        db = Database(os.environ['CONTACTS_DB'], pool_size=4)
+        self.addCleanup(db.close)
+        errors = []
+
+        def toggle():
+            try:
+                for _ in range(25):
+                    db.toggle_starred_by_id(contact_id)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=toggle) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 100 toggles in total leave the star where it started
+        self.assertEqual(errors, [])
+        self.assertFalse(self.app.get(f'/contacts/{contact_id}').get_json()['is_starred'])
+        self.assertEqual(self.app.put(f'/contacts/{contact_id}/star').get_json()['is_starred'], True)
+
+
+if __name__ == '__main__':
+    unittest.main()
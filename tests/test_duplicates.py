@@ -0,0 +1,140 @@
+import io
+import os
+import sqlite3
+import unittest
+
+from database import Database
+from dedup import KEY_GROUP_MAX, name_key
+from tests import ContactAPITestCase, address_book
+from tests.test_import import sheet_row, workbook_bytes
+
+
+class TestDuplicateGroups(ContactAPITestCase):
+    def groups(self, query=''):
+        response = self.app.get(f'/contacts/duplicates{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_phone_numbers_match_ignoring_separators(self):
+        ada = self.add_contact('Ada', 'Lovelace', phone_number='+44 20-7946 0001')
+        augusta = self.add_contact('Augusta', 'King', phone_number='(20) 7946 0001')
+        self.add_contact('Alan', 'Turing', phone_number='20 7946 0002')
+        data = self.groups()
+        self.assertEqual(data['total'], 1)
+        self.assertEqual((data['groups'][0]['ids'], data['groups'][0]['reasons']), ([ada, augusta], ['phone']))
+        self.assertEqual([contact['id'] for contact in data['groups'][0]['contacts']], [ada, augusta])
+
+    def test_emails_match_ignoring_case_and_plus_tags(self):
+        alan = self.add_contact('Alan', 'Turing', email='alan@example.com')
+        other = self.add_contact('A.', 'Turing', email=' ALAN+work@Example.com')
+        self.add_contact('Alan', 'Smith', email='alan@example.org')
+        groups = self.groups()['groups']
+        self.assertEqual([(group['ids'], group['reasons']) for group in groups], [([alan, other], ['email'])])
+
+    def test_similar_names_are_grouped(self):
+        jon = self.add_contact('Jon', 'Smith')
+        john = self.add_contact('John', 'Smith')
+        swapped = self.add_contact('Smith', 'John')
+        self.add_contact('Jane', 'Smith')
+        groups = self.groups()['groups']
+        self.assertEqual([(group['ids'], group['reasons']) for group in groups], [([jon, john, swapped], ['name'])])
+
+    def test_shared_switchboard_number_is_not_a_duplicate(self):
+        for i in range(KEY_GROUP_MAX + 1):
+            self.add_contact(f'Name{i}', f'Office{i}', phone_number='020 7946 0000')
+        self.assertEqual(self.groups(), {'groups': [], 'total': 0})
+
+    def test_limit_returns_the_largest_groups_with_the_total(self):
+        for i in range(3):
+            self.add_contact(f'Name{i}', 'Phone', phone_number='555 0101 0101')
+        for i in range(2):
+            self.add_contact(f'Other{i}', 'Mail', email='shared@example.com')
+        data = self.groups('?limit=1')
+        self.assertEqual(data['total'], 2)
+        self.assertEqual([len(group['ids']) for group in data['groups']], [3])
+        self.assertEqual(len(self.groups('?limit=0')['groups']), 1)
+
+    def test_groups_follow_writes(self):
+        self.add_contact('Jon', 'Smith')
+        john = self.add_contact('John', 'Smith')
+        self.assertEqual(self.groups()['total'], 1)
+        self.app.delete(f'/contacts/{john}')
+        self.assertEqual(self.groups()['total'], 0)
+
+
+class TestDuplicateMatches(ContactAPITestCase):
+    def matches(self, **args):
+        response = self.app.get('/contacts/duplicates', query_string=args)
+        self.assertEqual(response.status_code, 200)
+        return [(match['contact']['id'], match['reasons']) for match in response.get_json()['matches']]
+
+    def test_similar_names_match_best_first(self):
+        jon = self.add_contact('Jon', 'Smith')
+        john = self.add_contact('John', 'Smith')
+        self.add_contact('Jane', 'Doe')
+        self.assertEqual(self.matches(first_name='Jonn', last_name='Smith'), [(jon, ['name']), (john, ['name'])])
+
+    def test_phone_and_email_match_whatever_the_name(self):
+        ada = self.add_contact('Ada', 'Lovelace', phone_number='+44 20-7946 0001', email='ada@example.com')
+        self.assertEqual(self.matches(first_name='Augusta', last_name='King', phone_number='7946-0001'),
+                         [(ada, ['phone'])])
+        self.assertEqual(self.matches(first_name='Augusta', last_name='King', email='ADA+home@example.com'),
+                         [(ada, ['email'])])
+        self.assertEqual(self.matches(first_name='Ada', last_name='Lovelace', phone_number='2079460001',
+                                      email='ada@example.com'), [(ada, ['name', 'phone', 'email'])])
+
+    def test_unrelated_contact_has_no_matches(self):
+        self.add_contact('Ada', 'Lovelace', phone_number='2079460001')
+        self.assertEqual(self.matches(first_name='Alan', last_name='Turing', phone_number='555'), [])
+
+    def test_limit(self):
+        for first_name in ('Jon', 'John', 'Jonn'):
+            self.add_contact(first_name, 'Smith')
+        self.assertEqual(len(self.matches(first_name='Jon', last_name='Smith', limit=2)), 2)
+
+
+class TestNameKeys(ContactAPITestCase):
+    def stored_keys(self):
+        with address_book.db.pool.connection() as conn:
+            return dict(conn.execute("SELECT first_name || ' ' || last_name, name_key FROM contacts"))
+
+    def test_every_write_path_stores_the_name_key(self):
+        contact_id = self.add_contact('Ada', 'Lovelace')
+        self.app.put(f'/contacts/{contact_id}', json={'first_name': 'Augusta', 'last_name': 'King'})
+        self.app.post('/contacts/batch', json={'operations': [
+            {'op': 'add', 'contact': {'first_name': 'Alan', 'last_name': 'Turing'}},
+            {'op': 'update', 'first_name': 'Alan', 'last_name': 'Turing',
+             'contact': {'first_name': 'Alan', 'last_name': 'Mathison'}}]})
+        self.app.post('/contacts/import', content_type='multipart/form-data', data={
+            'file': (io.BytesIO(workbook_bytes([sheet_row('Grace', 'Hopper')])), 'contacts.xlsx')})
+        self.app.post('/contacts/import', content_type='multipart/form-data', data={
+            'merge': 'true', 'file': (io.BytesIO(workbook_bytes([sheet_row('Linus', 'Torvalds')])), 'contacts.xlsx')})
+
+        keys = self.stored_keys()
+        self.assertEqual(sorted(keys), ['Alan Mathison', 'Augusta King', 'Grace Hopper', 'Linus Torvalds'])
+        for name, key in keys.items():
+            self.assertEqual(key, name_key(*name.split()), name)
+
+    def test_rows_written_by_other_tools_get_keys_at_startup(self):
+        self.add_contact('Jon', 'Smith')
+        with sqlite3.connect(os.environ['CONTACTS_DB']) as conn:
+            conn.execute("INSERT INTO contacts (first_name, last_name) VALUES ('John', 'Smith')")
+        conn.close()
+        self.assertEqual(self.app.get('/contacts/duplicates').get_json()['total'], 0)
+        seq = address_book.db.get_change_seq()
+
+        db = Database(os.environ['CONTACTS_DB'])
+        self.addCleanup(db.close)
+        self.assertEqual(self.stored_keys()['John Smith'], name_key('John', 'Smith'))
+        self.assertEqual(db.find_duplicates()[1], 1)
+        # Filling in a derived key is not a change clients need to sync
+        self.assertEqual(db.get_change_seq(), seq)
+
+    def test_swapped_names_are_match_candidates(self):
+        contact_id = self.add_contact('Smith', 'John')
+        matches = self.app.get('/contacts/duplicates', query_string={'first_name': 'John', 'last_name': 'Smith'})
+        self.assertEqual([match['contact']['id'] for match in matches.get_json()['matches']], [contact_id])
+
+
+if __name__ == '__main__':
+    unittest.main()
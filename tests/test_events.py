@@ -0,0 +1,122 @@
+import json
+import unittest
+from unittest import mock
+
+from events import RESYNC, Event, EventBroker, Subscription
+from tests import ContactAPITestCase, address_book
+
+
+def parse_event(chunk):
+    """
+    Fields of one text/event-stream chunk, with data decoded as JSON.
+    """
+    fields = dict(line.split(': ', 1) for line in chunk.decode('utf-8').strip().split('\n'))
+    fields['data'] = json.loads(fields['data'])
+    return fields
+
+
+class TestEventStream(ContactAPITestCase):
+    def setUp(self):
+        super().setUp()
+        # setUp deleted contacts without publishing; mark those changes as sent
+        address_book.publish_changes()
+
+    def open_stream(self, **headers):
+        response = self.app.get('/contacts/events', headers=headers, buffered=False)
+        self.addCleanup(response.close)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+        chunks = iter(response.response)
+        self.assertEqual(next(chunks), b'retry: 3000\n\n')
+        return chunks
+
+    def current_seq(self):
+        return self.app.get('/contacts/changes').get_json()['last_seq']
+
+    def test_writes_are_pushed_in_order(self):
+        chunks = self.open_stream()
+        seq = self.current_seq()
+        ada = self.add_contact('Ada', 'Lovelace')
+        self.app.put(f'/contacts/{ada}/star')
+        self.app.delete(f'/contacts/{ada}')
+
+        events = [parse_event(next(chunks)) for _ in range(3)]
+        self.assertEqual([event['event'] for event in events], ['contact'] * 3)
+        self.assertEqual([int(event['id']) for event in events], [seq + 1, seq + 2, seq + 3])
+        self.assertEqual([event['data']['op'] for event in events], ['insert', 'update', 'delete'])
+        self.assertEqual(events[0]['data']['contact']['first_name'], 'Ada')
+        self.assertTrue(events[1]['data']['contact']['is_starred'])
+        self.assertEqual(events[2]['data'], {'id': ada, 'op': 'delete', 'seq': seq + 3})
+
+    def test_batch_writes_are_pushed(self):
+        chunks = self.open_stream()
+        operations = [{'op': 'add', 'contact': {'first_name': f'Name{i}', 'last_name': 'Test'}} for i in range(3)]
+        self.app.post('/contacts/batch', json=operations)
+        self.assertEqual([parse_event(next(chunks))['data']['contact']['first_name'] for _ in range(3)],
+                         ['Name0', 'Name1', 'Name2'])
+
+    def test_reconnecting_client_gets_what_it_missed_once(self):
+        seq = self.current_seq()
+        self.add_contact('Ada', 'Lovelace')
+        self.add_contact('Alan', 'Turing')
+        chunks = self.open_stream(**{'Last-Event-ID': str(seq)})
+        self.add_contact('Grace', 'Hopper')
+
+        events = [parse_event(next(chunks)) for _ in range(3)]
+        self.assertEqual([event['data']['contact']['first_name'] for event in events], ['Ada', 'Alan', 'Grace'])
+        self.assertEqual([int(event['id']) for event in events], [seq + 1, seq + 2, seq + 3])
+
+    def test_client_too_far_behind_is_asked_to_resync(self):
+        seq = self.current_seq()
+        for i in range(3):
+            self.add_contact(f'Name{i}', 'Test')
+        with mock.patch('app.EVENT_PUBLISH_LIMIT', 2):
+            chunks = self.open_stream(**{'Last-Event-ID': str(seq)})
+            self.assertEqual(next(chunks), RESYNC.encode().encode('utf-8'))
+
+    def test_idle_stream_sends_keep_alive_comments(self):
+        with mock.patch.object(Subscription.get, '__defaults__', (0.01,)):
+            chunks = self.open_stream()
+            self.assertEqual(next(chunks), b': keep-alive\n\n')
+
+    def test_closed_stream_unsubscribes(self):
+        subscribers = address_book.events.stats()['subscribers']
+        response = self.app.get('/contacts/events', buffered=False)
+        next(iter(response.response))
+        self.assertEqual(address_book.events.stats()['subscribers'], subscribers + 1)
+        response.close()
+        self.assertEqual(address_book.events.stats()['subscribers'], subscribers)
+
+
+class TestEventBroker(unittest.TestCase):
+    def test_event_encoding(self):
+        self.assertEqual(Event('contact', '{"id":1}', 7).encode(), 'id: 7\nevent: contact\ndata: {"id":1}\n\n')
+        self.assertEqual(RESYNC.encode(), 'event: resync\ndata: {}\n\n')
+
+    def test_events_reach_every_subscriber(self):
+        broker = EventBroker()
+        first, second = broker.subscribe(), broker.subscribe()
+        broker.publish(Event('contact', '{}', 1))
+        broker.unsubscribe(second)
+        broker.publish(Event('contact', '{}', 2))
+        self.assertEqual([first.get_nowait().id, first.get_nowait().id, first.get_nowait()], [1, 2, None])
+        self.assertEqual([second.get_nowait().id, second.get_nowait()], [1, None])
+        self.assertEqual(broker.stats(), {'subscribers': 1, 'published': 2, 'dropped': 0})
+
+    def test_slow_subscriber_gets_a_resync_instead_of_a_backlog(self):
+        notified = []
+        subscription = Subscription(maxsize=3, notify=lambda: notified.append(True))
+        for seq in range(1, 6):
+            subscription.put(Event('contact', '{}', seq))
+        # Three events filled the queue; the fourth replaced them with a
+        # resync marker and the fifth was queued after it
+        self.assertIs(subscription.get_nowait(), RESYNC)
+        self.assertEqual(subscription.get_nowait().id, 5)
+        self.assertIsNone(subscription.get(timeout=0))
+        self.assertEqual(subscription.dropped, 4)
+        self.assertEqual(len(notified), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from tests import ContactAPITestCase
+
+
+class TestContactFacets(ContactAPITestCase):
+    def facets(self):
+        response = self.app.get('/contacts/facets')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        categories = {facet['category']: (facet['count'], facet['starred']) for facet in data['categories']}
+        return categories, data['total'], data['starred']
+
+    def test_counts_per_category_and_totals(self):
+        self.add_contact('Ada', 'Lovelace', category='Work', is_starred=True)
+        self.add_contact('Alan', 'Turing', category='Work')
+        self.add_contact('Grace', 'Hopper', category='Family', is_starred=True)
+        self.add_contact('Linus', 'Torvalds')
+        self.assertEqual(self.facets(), ({'': (1, 0), 'Family': (1, 1), 'Work': (2, 1)}, 4, 2))
+
+    def test_categories_are_sorted_by_name(self):
+        for i, category in enumerate(('Work', 'Family', 'Club')):
+            self.add_contact(f'Name{i}', 'Test', category=category)
+        categories = self.app.get('/contacts/facets').get_json()['categories']
+        self.assertEqual([facet['category'] for facet in categories], ['Club', 'Family', 'Work'])
+
+    def test_counts_follow_every_kind_of_write(self):
+        ada = self.add_contact('Ada', 'Lovelace', category='Work')
+        alan = self.add_contact('Alan', 'Turing', category='Work')
+        self.app.put(f'/contacts/{ada}/star')
+        self.assertEqual(self.facets(), ({'Work': (2, 1)}, 2, 1))
+
+        self.app.put(f'/contacts/{alan}', json={'first_name': 'Alan', 'last_name': 'Turing', 'category': 'Family'})
+        self.assertEqual(self.facets(), ({'Family': (1, 0), 'Work': (1, 1)}, 2, 1))
+
+        # A category whose last contact leaves is dropped rather than shown as 0
+        self.app.delete(f'/contacts/{ada}')
+        self.assertEqual(self.facets(), ({'Family': (1, 0)}, 1, 0))
+        self.app.delete(f'/contacts/{alan}')
+        self.assertEqual(self.facets(), ({}, 0, 0))
+
+    def test_etag_is_revalidated_until_the_next_write(self):
+        self.add_contact('Ada', 'Lovelace', category='Work')
+        etag = self.app.get('/contacts/facets').headers['ETag']
+        self.assertEqual(self.app.get('/contacts/facets', headers={'If-None-Match': etag}).status_code, 304)
+
+        self.add_contact('Alan', 'Turing', category='Work')
+        response = self.app.get('/contacts/facets', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.get_json()['total'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zipfile
+
+from openpyxl import Workbook
+
+from importer import ImportStats, expand_archives, import_excel_in_batches
+from tests import ContactAPITestCase, address_book
+
+
+def workbook_bytes(rows):
+    workbook = Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def sheet_row(first_name, last_name, starred='', category='Work', phone='', email=''):
+    return [starred, first_name, last_name, category, 'Uni', phone, email, 'Street 1']
+
+
+def zip_bytes(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def forge_sizes(data, size):
+    """
+    Record size as the uncompressed size of every member, in the local file
+    headers and the central directory, leaving the compressed data as it is.
+    """
+    data = bytearray(data)
+    for signature, offset in ((b'PK\x03\x04', 22), (b'PK\x01\x02', 24)):
+        start = data.find(signature)
+        while start != -1:
+            struct.pack_into('<I', data, start + offset, size)
+            start = data.find(signature, start + 4)
+    return bytes(data)
+
+
+class TestExcelImport(ContactAPITestCase):
+    def upload(self, rows, **form):
+        data = dict(form, file=(io.BytesIO(workbook_bytes(rows)), 'contacts.xlsx'))
+        return self.app.post('/contacts/import', data=data, content_type='multipart/form-data')
+
+    def test_import_counts_new_duplicate_and_invalid_rows(self):
+        self.add_contact('Ada', 'Lovelace')
+        response = self.upload([
+            sheet_row('Ada', 'Lovelace'),
+            sheet_row('Alan', 'Turing', starred='★', phone='555 0101'),
+            sheet_row('Alan', 'Turing'),
+            sheet_row('', ''),
+            [None] * 8,
+            sheet_row('Grace', ''),
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'success': True, 'imported': 2, 'merged': 0, 'duplicates': 2,
+                                               'invalid': 1})
+
+        contacts = {contact['first_name']: contact for contact in self.app.get('/contacts').get_json()}
+        self.assertEqual(sorted(contacts), ['Ada', 'Alan', 'Grace'])
+        self.assertTrue(contacts['Alan']['is_starred'])
+        self.assertEqual(contacts['Alan']['phone_number'], '555 0101')
+        self.assertEqual(contacts['Alan']['institution'], 'Uni')
+
+    def test_wrong_column_count_is_rejected_without_importing(self):
+        response = self.upload([['', 'Ada', 'Lovelace']])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('8 columns', response.get_json()['error'])
+        self.assertEqual(self.app.get('/contacts').get_json(), [])
+
+    def test_sheet_without_valid_rows_is_rejected(self):
+        response = self.upload([sheet_row('', '')])
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_excel_files_are_accepted(self):
+        data = {'file': (io.BytesIO(b'first,last'), 'contacts.csv')}
+        response = self.app.post('/contacts/import', data=data, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 400)
+
+    def test_duplicates_are_detected_across_chunks(self):
+        rows = [sheet_row(f'Name{i % 7}', 'Chunk') for i in range(20)]
+        stats = ImportStats()
+        completed = import_excel_in_batches(address_book.db, io.BytesIO(workbook_bytes(rows)), 'contacts.xlsx',
+                                            stats, chunk_size=3)
+        self.assertTrue(completed)
+        self.assertEqual((stats.parsed, stats.imported, stats.duplicates, stats.invalid), (20, 7, 13, 0))
+        self.assertEqual(len(self.app.get('/contacts').get_json()), 7)
+
+
+class TestMultiFileImport(ContactAPITestCase):
+    def upload(self, files, **form):
+        data = dict(form, file=[(io.BytesIO(content), filename) for filename, content in files])
+        return self.app.post('/contacts/import', data=data, content_type='multipart/form-data')
+
+    def test_files_and_archives_are_imported_together(self):
+        archive = zip_bytes({
+            'sheets/family.xlsx': workbook_bytes([sheet_row('Grace', 'Hopper', category='Family')]),
+            'sheets/~$family.xlsx': b'lock file',
+            'readme.txt': b'not a workbook',
+        })
+        response = self.upload([
+            ('work.xlsx', workbook_bytes([sheet_row('Ada', 'Lovelace'), sheet_row('Alan', 'Turing')])),
+            ('more.xlsx', workbook_bytes([sheet_row('Alan', 'Turing'), sheet_row('', '')])),
+            ('archive.zip', archive),
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual((data['imported'], data['duplicates'], data['invalid']), (3, 1, 1))
+        self.assertEqual([(f['filename'], f['imported'], f['duplicates']) for f in data['files']],
+                         [('work.xlsx', 2, 0), ('more.xlsx', 0, 1), ('archive.zip/sheets/family.xlsx', 1, 0)])
+
+        contacts = {contact['first_name']: contact for contact in self.app.get('/contacts').get_json()}
+        self.assertEqual(sorted(contacts), ['Ada', 'Alan', 'Grace'])
+        self.assertEqual(contacts['Grace']['category'], 'Family')
+
+    def test_invalid_archive_is_rejected(self):
+        response = self.upload([('work.xlsx', workbook_bytes([sheet_row('Ada', 'Lovelace')])),
+                                ('archive.zip', b'not a zip file')])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('archive.zip', response.get_json()['error'])
+        self.assertEqual(self.app.get('/contacts').get_json(), [])
+
+
+class TestArchiveLimits(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='contacts-archives-')
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def expand(self, data, max_bytes):
+        path = os.path.join(self.directory, 'upload.zip')
+        with open(path, 'wb') as output:
+            output.write(data)
+        extracted = os.path.join(self.directory, 'extracted')
+        os.mkdir(extracted)
+        try:
+            return expand_archives([('archive.zip', path)], extracted, max_bytes)
+        finally:
+            self.extracted_bytes = sum(os.path.getsize(os.path.join(extracted, name))
+                                       for name in os.listdir(extracted))
+
+    def test_members_within_the_limit_are_extracted(self):
+        data = zip_bytes({'a.xlsx': b'a' * 1000, 'b.xlsx': b'b' * 1000})
+        self.assertEqual([name for name, _ in self.expand(data, 2000)], ['archive.zip/a.xlsx', 'archive.zip/b.xlsx'])
+        self.assertEqual(self.extracted_bytes, 2000)
+
+    def test_extraction_stops_at_the_limit(self):
+        data = zip_bytes({f'{i}.xlsx': bytes(1024 * 1024) for i in range(4)})
+        with self.assertRaisesRegex(ValueError, 'expands to more than 2 MB'):
+            self.expand(data, 2 * 1024 * 1024)
+        self.assertLessEqual(self.extracted_bytes, 2 * 1024 * 1024)
+
+    def test_forged_member_sizes_do_not_bypass_the_limit(self):
+        # A bomb that claims its members are tiny: 20 MB of zeros compress to
+        # about 20 KB, while the archive says each member is 100 bytes
+        data = forge_sizes(zip_bytes({f'{i}.xlsx': bytes(10 * 1024 * 1024) for i in range(2)}), 100)
+        self.assertEqual([info.file_size for info in zipfile.ZipFile(io.BytesIO(data)).infolist()], [100, 100])
+        with self.assertRaises(ValueError):
+            self.expand(data, 1024 * 1024)
+        self.assertLessEqual(self.extracted_bytes, 1024 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
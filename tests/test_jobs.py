@@ -0,0 +1,157 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import importer
+from database import Database
+from importer import import_excel_in_batches
+from jobs import ImportJobManager
+from tests import ContactAPITestCase, address_book
+from tests.test_import import sheet_row, workbook_bytes
+
+
+def blocking_import(started, release):
+    """
+    Stand-in for import_excel_in_batches that runs until the job is
+    cancelled or release is set.
+    """
+    def run(db, file, filename, stats, cancelled=None, merge=False):
+        started.set()
+        while not release.wait(0.01):
+            if cancelled.is_set():
+                return False
+        return True
+    return run
+
+
+class TestImportJobAPI(ContactAPITestCase):
+    def submit(self, rows, **form):
+        data = dict(form, file=(io.BytesIO(workbook_bytes(rows)), 'contacts.xlsx'))
+        response = self.app.post('/contacts/import', data=dict(data, **{'async': '1'}),
+                                 content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 202)
+        body = response.get_json()
+        self.assertTrue(body['success'])
+        self.assertIn(body['status'], ('queued', 'running', 'completed'))
+        return body['job_id']
+
+    def wait(self, job_id):
+        address_book.import_jobs.get(job_id).future.result(timeout=30)
+        response = self.app.get(f'/contacts/import/jobs/{job_id}')
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_job_imports_in_the_background(self):
+        self.add_contact('Ada', 'Lovelace')
+        job_id = self.submit([sheet_row('Ada', 'Lovelace'), sheet_row('Alan', 'Turing'), sheet_row('', '')])
+
+        job = self.wait(job_id)
+        self.assertEqual(job['status'], 'completed')
+        self.assertEqual(job['filename'], 'contacts.xlsx')
+        self.assertEqual((job['parsed'], job['imported'], job['duplicates'], job['invalid']), (3, 1, 1, 1))
+        self.assertIsNone(job['error'])
+        self.assertLessEqual(job['created_at'], job['started_at'])
+        self.assertLessEqual(job['started_at'], job['finished_at'])
+        self.assertEqual(sorted(c['first_name'] for c in self.app.get('/contacts').get_json()), ['Ada', 'Alan'])
+        self.assertIn(job_id, [job['job_id'] for job in self.app.get('/contacts/import/jobs').get_json()])
+
+    def test_failed_job_reports_the_error(self):
+        job = self.wait(self.submit([['', 'Ada', 'Lovelace']]))
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('8 columns', job['error'])
+        self.assertEqual(self.app.get('/contacts').get_json(), [])
+
+    def test_running_job_is_cancelled(self):
+        started, release = threading.Event(), threading.Event()
+        self.addCleanup(release.set)
+        with mock.patch('jobs.import_excel_in_batches', blocking_import(started, release)):
+            job_id = self.submit([sheet_row('Ada', 'Lovelace')])
+            self.assertTrue(started.wait(10))
+            self.assertEqual(self.app.get(f'/contacts/import/jobs/{job_id}').get_json()['status'], 'running')
+
+            response = self.app.delete(f'/contacts/import/jobs/{job_id}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.wait(job_id)['status'], 'cancelled')
+
+    def test_finished_job_is_not_cancelled(self):
+        job_id = self.submit([sheet_row('Ada', 'Lovelace')])
+        self.wait(job_id)
+        response = self.app.delete(f'/contacts/import/jobs/{job_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['status'], 'completed')
+
+    def test_unknown_job(self):
+        self.assertEqual(self.app.get('/contacts/import/jobs/missing').status_code, 404)
+        self.assertEqual(self.app.delete('/contacts/import/jobs/missing').status_code, 404)
+
+
+class TestImportJobManager(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='contacts-jobs-')
+        self.addCleanup(shutil.rmtree, directory)
+        self.db = Database(os.path.join(directory, 'contacts.db'))
+        self.addCleanup(self.db.close)
+        self.finished = []
+        self.manager = ImportJobManager(self.db, max_workers=1, history=2, on_finished=self.finished.append)
+        self.addCleanup(self.manager._executor.shutdown)
+
+    def submit(self, rows):
+        return self.manager.submit(io.BytesIO(workbook_bytes(rows)), 'contacts.xlsx')
+
+    def test_queued_job_never_starts(self):
+        started, release = threading.Event(), threading.Event()
+        self.addCleanup(release.set)
+        with mock.patch('jobs.import_excel_in_batches', blocking_import(started, release)):
+            running = self.submit([sheet_row('Ada', 'Lovelace')])
+            queued = self.submit([sheet_row('Alan', 'Turing')])
+            self.assertTrue(started.wait(10))
+            self.assertEqual(queued.status, 'queued')
+            (_, path), = queued.sources
+
+            self.assertIs(self.manager.cancel(queued.id), queued)
+            self.assertEqual(queued.status, 'cancelled')
+            self.assertIsNone(queued.started_at)
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(self.finished, [queued])
+
+            release.set()
+            running.future.result(timeout=10)
+        self.assertEqual(running.status, 'completed')
+        self.assertEqual(self.finished, [queued, running])
+
+    def test_running_job_stops_after_the_chunk_it_is_committing(self):
+        add_rows = importer.add_rows
+
+        def add_rows_then_cancel(db, rows, stats, merge):
+            add_rows(db, rows, stats, merge)
+            for job in self.manager.list():
+                self.manager.cancel(job.id)
+
+        def import_in_small_chunks(*args, **kwargs):
+            return import_excel_in_batches(*args, chunk_size=2, **kwargs)
+
+        with mock.patch('importer.add_rows', add_rows_then_cancel), \
+                mock.patch('jobs.import_excel_in_batches', import_in_small_chunks):
+            job = self.submit([sheet_row(f'Name{i}', 'Test') for i in range(6)])
+            job.future.result(timeout=30)
+
+        self.assertEqual(job.status, 'cancelled')
+        self.assertEqual((job.stats.parsed, job.stats.imported), (2, 2))
+        self.assertEqual([c.first_name for c in self.db.get_all_contacts()], ['Name0', 'Name1'])
+
+    def test_finished_jobs_beyond_the_history_are_forgotten(self):
+        jobs = [self.submit([sheet_row(f'Name{i}', 'Test')]) for i in range(3)]
+        for job in jobs:
+            job.future.result(timeout=30)
+        last = self.submit([sheet_row('Ada', 'Lovelace')])
+        last.future.result(timeout=30)
+        self.assertEqual([job.id for job in self.manager.list()], [jobs[1].id, jobs[2].id, last.id])
+        self.assertIsNone(self.manager.get(jobs[0].id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import re
+import sqlite3
+import threading
+import unittest
+from unittest import mock
+
+from metrics import Histogram, MetricsRegistry, StatementTimer, result_rows, statement_labels
+from tests import ContactAPITestCase
+
+SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+
+
+def parse_metrics(text):
+    """
+    Samples of a Prometheus text response as {(name, labels): value}, with
+    labels as a sorted tuple of (name, value) pairs.
+    """
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        name, labels, value = SAMPLE.match(line).groups()
+        pairs = tuple(sorted(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', labels or '')))
+        samples[name, pairs] = float(value)
+    return samples
+
+
+class TestMetricsEndpoint(ContactAPITestCase):
+    def scrape(self):
+        response = self.app.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/plain')
+        return parse_metrics(response.get_data(as_text=True))
+
+    def test_every_metric_is_documented(self):
+        text = self.app.get('/metrics').get_data(as_text=True)
+        helps = set(re.findall(r'^# HELP (\w+) ', text, re.M))
+        types = dict(re.findall(r'^# TYPE (\w+) (\w+)$', text, re.M))
+        self.assertEqual(helps, set(types))
+        self.assertEqual(types['contacts_http_request_duration_seconds'], 'histogram')
+        self.assertEqual(types['contacts_response_cache_hits_total'], 'counter')
+        self.assertEqual(types['contacts_db_generation'], 'gauge')
+
+    def test_requests_are_timed_by_route_pattern(self):
+        contact_id = self.add_contact('Ada', 'Lovelace')
+        labels = (('method', 'GET'), ('route', '/contacts/<int:contact_id>'), ('status', '200'))
+        before = self.scrape().get(('contacts_http_request_duration_seconds_count', labels), 0)
+        self.app.get(f'/contacts/{contact_id}')
+        self.app.get(f'/contacts/{contact_id}')
+        self.app.get('/contacts/999999')
+
+        samples = self.scrape()
+        self.assertEqual(samples['contacts_http_request_duration_seconds_count', labels], before + 2)
+        self.assertIn(('contacts_http_request_duration_seconds_count', labels[:2] + (('status', '404'),)), samples)
+        routes = {value for _, pairs in samples for name, value in pairs if name == 'route'}
+        self.assertNotIn(f'/contacts/{contact_id}', routes)
+        self.assertNotIn('/contacts/999999', routes)
+
+    def test_database_calls_and_rows_are_counted(self):
+        samples = self.scrape()
+        calls = samples.get(('contacts_db_call_duration_seconds_count', (('method', 'add_contact'),)), 0)
+        rows = samples.get(('contacts_db_rows_total', (('method', 'get_all_contacts'),)), 0)
+        generation = samples['contacts_db_generation', ()]
+
+        self.add_contact('Ada', 'Lovelace')
+        self.add_contact('Alan', 'Turing')
+        self.app.get('/contacts')
+
+        samples = self.scrape()
+        self.assertEqual(samples['contacts_db_call_duration_seconds_count', (('method', 'add_contact'),)], calls + 2)
+        self.assertEqual(samples['contacts_db_rows_total', (('method', 'get_all_contacts'),)], rows + 2)
+        self.assertEqual(samples['contacts_db_generation', ()], generation + 2)
+
+    def test_cache_statistics(self):
+        self.add_contact('Ada', 'Lovelace')
+        self.app.get('/contacts')
+        hits = self.scrape()['contacts_response_cache_hits_total', ()]
+        self.app.get('/contacts')
+        self.assertEqual(self.scrape()['contacts_response_cache_hits_total', ()], hits + 1)
+
+
+class TestProfileEndpoint(ContactAPITestCase):
+    def test_disabled_by_default(self):
+        response = self.app.get('/debug/profile')
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('CONTACTS_PROFILING', response.get_json()['error'])
+
+    def test_folded_stacks_of_other_threads(self):
+        stop = threading.Event()
+
+        def waiting_in_test():
+            stop.wait()
+
+        thread = threading.Thread(target=waiting_in_test, name='profiled-thread')
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(stop.set)
+
+        with mock.patch('app.PROFILING', True):
+            response = self.app.get('/debug/profile', query_string={'seconds': 0.1, 'interval': 10})
+        self.assertEqual(response.status_code, 200)
+        lines = response.get_data(as_text=True).splitlines()
+        stacks = {line.rsplit(' ', 1)[0]: int(line.rsplit(' ', 1)[1]) for line in lines}
+        profiled = [stack for stack in stacks if stack.startswith('profiled-thread;')]
+        self.assertEqual(len(profiled), 1)
+        self.assertIn('test_metrics.py:waiting_in_test', profiled[0])
+        self.assertGreater(stacks[profiled[0]], 1)
+        # Most frequent stacks come first
+        self.assertEqual([count for count in stacks.values()], sorted(stacks.values(), reverse=True))
+
+
+class TestMetricTypes(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('duration_seconds', 'Duration', ('route',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 5.0):
+            histogram.observe(value, ('/',))
+        samples = {(name, labels[-1] if name.endswith('_bucket') else None): value
+                   for name, _, labels, value in histogram.samples()}
+        self.assertEqual(samples, {('duration_seconds_bucket', '0.1'): 2, ('duration_seconds_bucket', '1'): 3,
+                                   ('duration_seconds_bucket', '+Inf'): 4, ('duration_seconds_sum', None): 5.65,
+                                   ('duration_seconds_count', None): 4})
+
+    def test_rendering_escapes_label_values(self):
+        registry = MetricsRegistry()
+        registry.counter('requests_total', 'Requests', ('path',)).inc(('a"b\\c\nd',), 2)
+        self.assertEqual(registry.render(), '# HELP requests_total Requests\n# TYPE requests_total counter\n'
+                                            'requests_total{path="a\\"b\\\\c\\nd"} 2\n')
+
+    def test_names_are_registered_once(self):
+        registry = MetricsRegistry()
+        registry.counter('requests_total', 'Requests')
+        with self.assertRaises(ValueError):
+            registry.callback('requests_total', 'Requests', (), lambda: [])
+
+    def test_result_rows(self):
+        self.assertEqual(result_rows([1, 2, 3]), 3)
+        self.assertEqual(result_rows(([1, 2], 'cursor')), 2)
+        self.assertEqual(result_rows((5, ['Ada Lovelace'])), 5)
+        self.assertEqual(result_rows(7, write=True), 1)
+        self.assertIsNone(result_rows(False, write=True))
+        self.assertIsNone(result_rows(7))
+
+    def test_statement_labels(self):
+        self.assertEqual(statement_labels('SELECT id FROM contacts WHERE id = ?'), ('SELECT', 'contacts'))
+        self.assertEqual(statement_labels('  insert into contact_changes (contact_id) VALUES (1)'),
+                         ('INSERT', 'contact_changes'))
+        self.assertEqual(statement_labels('UPDATE contacts SET is_starred = 1'), ('UPDATE', 'contacts'))
+        self.assertEqual(statement_labels('CREATE INDEX IF NOT EXISTS idx ON contacts(first_name)'),
+                         ('CREATE', 'contacts'))
+        self.assertEqual(statement_labels('BEGIN'), ('BEGIN', ''))
+
+    def test_statement_timer(self):
+        histogram = Histogram('sql_seconds', 'SQL', ('operation', 'table'))
+        timer = StatementTimer(histogram)
+        conn = sqlite3.connect(':memory:', isolation_level=None)
+        self.addCleanup(conn.close)
+        timer.attach(conn)
+        conn.execute('CREATE TABLE contacts (id INTEGER PRIMARY KEY)')
+        conn.execute('INSERT INTO contacts DEFAULT VALUES')
+        conn.execute('SELECT id FROM contacts').fetchall()
+        timer.detach(conn)
+        counts = {labels: value for name, _, labels, value in histogram.samples() if name == 'sql_seconds_count'}
+        self.assertEqual(counts, {('CREATE', 'contacts'): 1, ('INSERT', 'contacts'): 1, ('SELECT', 'contacts'): 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from database import Database
+from migrations import CONTACTS_TABLE, MIGRATIONS, SEARCH_TABLES, create_search_indexes, migrate
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='contacts-migrations-')
+        self.addCleanup(shutil.rmtree, directory)
+        self.db_file = os.path.join(directory, 'contacts.db')
+
+    def open_database(self):
+        db = Database(self.db_file)
+        self.addCleanup(db.close)
+        return db
+
+    def create_legacy_database(self, create_table, rows):
+        with sqlite3.connect(self.db_file) as conn:
+            conn.execute(create_table)
+            conn.executemany(f"INSERT INTO contacts VALUES ({', '.join('?' * len(rows[0]))})", rows)
+        conn.close()
+
+    def test_single_name_column_is_split_keeping_ids(self):
+        # The schema from before first_name and last_name existed, with gaps
+        # in the ids left by deleted contacts
+        self.create_legacy_database(
+            "CREATE TABLE contacts (id INTEGER PRIMARY KEY, name TEXT, phone_number TEXT, email TEXT, address TEXT)",
+            [(1, 'Ada Lovelace', '555 0101', 'ada@example.com', 'London'),
+             (4, 'Alan Mathison Turing', '555 0102', '', 'Wilmslow'),
+             (9, 'Plato', '', '', 'Athens')])
+
+        db = self.open_database()
+        self.assertEqual([migration['version'] for migration in db.migrations],
+                         [version for version, _, _ in MIGRATIONS if version != 3 or db.fts_enabled])
+        self.assertEqual(db.get_all_contacts(), [
+            (1, 'Ada', 'Lovelace', '', '555 0101', 'ada@example.com', 'London', '', 0),
+            (4, 'Alan', 'Mathison Turing', '', '555 0102', '', 'Wilmslow', '', 0),
+            (9, 'Plato', '', '', '', '', 'Athens', '', 0),
+        ])
+        self.assertEqual(db.add_contact({'first_name': 'Grace', 'last_name': 'Hopper', 'phone_number': '',
+                                         'email': '', 'address': ''}), 10)
+
+    def test_baseline_schema_is_upgraded_to_the_latest_version(self):
+        self.create_legacy_database(CONTACTS_TABLE.format(name='contacts'), [
+            (2, 'Ada', 'Lovelace', 'Work', '555 0101', 'ada@example.com', 'London', 'Analytical', 1),
+            (5, 'Alan', 'Turing', None, '555 0102', None, None, None, None),
+        ])
+
+        db = self.open_database()
+        with db.pool.connection() as conn:
+            self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], LATEST_VERSION)
+        self.assertEqual([contact.id for contact in db.get_all_contacts()], [2, 5])
+        self.assertEqual(db.get_contact(5).is_starred, 0)
+
+        # Every derived structure is built from the existing rows
+        self.assertEqual([contact.id for contact in db.search_contacts('Lovelace')], [2])
+        changes, last_seq, has_more = db.get_changes(0)
+        self.assertEqual([(change.op, change.id) for change in changes], [('insert', 2), ('update', 5)])
+        self.assertFalse(has_more)
+        self.assertEqual(sorted(db.get_facets()), [('', 1, 0), ('Work', 1, 1)])
+
+    def test_up_to_date_database_is_left_alone(self):
+        self.open_database().add_contact({'first_name': 'Ada', 'last_name': 'Lovelace', 'phone_number': '',
+                                          'email': '', 'address': ''})
+        with sqlite3.connect(self.db_file) as conn:
+            self.assertEqual(migrate(conn), [])
+            self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], LATEST_VERSION)
+        conn.close()
+        self.assertEqual(len(self.open_database().get_all_contacts()), 1)
+
+
+class NoTrigramCursor:
+    """
+    A cursor of an SQLite build with FTS5 but without the trigram tokenizer.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, sql, *params):
+        if "tokenize='trigram'" in sql:
+            raise sqlite3.OperationalError('no such tokenizer: trigram')
+        return self.cursor.execute(sql, *params)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+
+class TestMigrationEngine(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:', isolation_level=None)
+        self.addCleanup(self.conn.close)
+
+    def version(self):
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def tables(self):
+        return {row[0] for row in self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name NOT LIKE 'sqlite%'")}
+
+    def test_migrations_run_once_in_order(self):
+        migrations = [(1, 'first', lambda cursor: cursor.execute("CREATE TABLE a (x)")),
+                      (2, 'second', lambda cursor: cursor.execute("CREATE TABLE b (x)"))]
+        self.assertEqual([m['version'] for m in migrate(self.conn, migrations[:1])], [1])
+        self.assertEqual([m['version'] for m in migrate(self.conn, migrations)], [2])
+        self.assertEqual(migrate(self.conn, migrations), [])
+        self.assertEqual(self.version(), 2)
+
+    def test_skipped_migration_advances_the_version(self):
+        migrations = [(1, 'first', lambda cursor: cursor.execute("CREATE TABLE a (x)")),
+                      (2, 'optional', lambda cursor: False),
+                      (3, 'third', lambda cursor: cursor.execute("CREATE TABLE c (x)"))]
+        self.assertEqual([m['description'] for m in migrate(self.conn, migrations)], ['first', 'third'])
+        self.assertEqual(self.version(), 3)
+
+    def test_failed_migration_is_rolled_back(self):
+        def failing(cursor):
+            cursor.execute("CREATE TABLE b (x)")
+            cursor.execute("INSERT INTO missing VALUES (1)")
+
+        migrations = [(1, 'first', lambda cursor: cursor.execute("CREATE TABLE a (x)")), (2, 'failing', failing)]
+        with self.assertRaises(sqlite3.OperationalError):
+            migrate(self.conn, migrations)
+        self.assertEqual(self.version(), 1)
+        self.assertEqual(self.tables(), {'a'})
+
+    def test_search_indexes_are_built_all_or_nothing(self):
+        self.conn.execute(CONTACTS_TABLE.format(name='contacts'))
+        self.conn.execute("BEGIN")
+        self.assertFalse(create_search_indexes(NoTrigramCursor(self.conn.cursor())))
+        self.conn.execute("COMMIT")
+        self.assertEqual(self.tables(), {'contacts'})
+
+        self.conn.execute("BEGIN")
+        self.assertTrue(create_search_indexes(self.conn.cursor()))
+        self.conn.execute("COMMIT")
+        self.assertLessEqual(set(SEARCH_TABLES), self.tables())
+
+
+class TestSearchIndexRetry(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='contacts-migrations-')
+        self.addCleanup(shutil.rmtree, directory)
+        self.db_file = os.path.join(directory, 'contacts.db')
+
+    def test_missing_search_indexes_are_built_on_startup(self):
+        # A database migrated by an SQLite without FTS5 has the latest
+        # version but no search tables
+        db = Database(self.db_file)
+        if not db.fts_enabled:
+            db.close()
+            self.skipTest('SQLite was built without FTS5')
+        db.add_contact({'first_name': 'Ada', 'last_name': 'Lovelace', 'phone_number': '555 0101', 'email': '',
+                        'address': ''})
+        db.close()
+        with sqlite3.connect(self.db_file) as conn:
+            for table in SEARCH_TABLES:
+                for suffix in ('ai', 'ad', 'au'):
+                    conn.execute(f"DROP TRIGGER {table}_{suffix}")
+                conn.execute(f"DROP TABLE {table}")
+        conn.close()
+
+        db = Database(self.db_file)
+        self.addCleanup(db.close)
+        self.assertTrue(db.fts_enabled)
+        self.assertEqual(db.migrations, [])
+        self.assertEqual([c.first_name for c in db.search_contacts('love')], ['Ada'])
+        self.assertEqual([c.first_name for c in db.search_contacts('5 01')], ['Ada'])
+
+
+if __name__ == '__main__':
+    unittest.main()
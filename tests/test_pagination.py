@@ -0,0 +1,120 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from database import Database
+from migrations import MIGRATIONS, migrate
+from tests import ContactAPITestCase
+
+
+class TestContactPagination(ContactAPITestCase):
+    def setUp(self):
+        super().setUp()
+        for first_name, category, is_starred in (('Ada', 'Work', 0), ('Ben', 'Family', 1), ('Cy', 'Work', 0),
+                                                  ('Dee', '', 1), ('Eve', 'Work', 0), ('Fay', 'Family', 0),
+                                                  ('Gus', 'Work', 1)):
+            self.add_contact(first_name, 'Test', category=category, is_starred=is_starred)
+
+    def read_pages(self, query):
+        names, cursor = [], None
+        while True:
+            url = f'/contacts?{query}' + (f'&cursor={cursor}' if cursor else '')
+            response = self.app.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.get_json()
+            self.assertLessEqual(len(page['contacts']), 3)
+            names.extend(contact['first_name'] for contact in page['contacts'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                return names
+
+    def test_pages_cover_every_contact_once_in_order(self):
+        self.assertEqual(self.read_pages('limit=3&sort=name'), ['Ada', 'Ben', 'Cy', 'Dee', 'Eve', 'Fay', 'Gus'])
+        self.assertEqual(self.read_pages('limit=3&sort=name&order=desc'),
+                         ['Gus', 'Fay', 'Eve', 'Dee', 'Cy', 'Ben', 'Ada'])
+
+    def test_starred_sort_puts_starred_contacts_first(self):
+        self.assertEqual(self.read_pages('limit=3'), ['Ben', 'Dee', 'Gus', 'Ada', 'Cy', 'Eve', 'Fay'])
+
+    def test_category_sort_and_filter(self):
+        self.assertEqual(self.read_pages('limit=3&sort=category'), ['Dee', 'Ben', 'Fay', 'Ada', 'Cy', 'Eve', 'Gus'])
+        self.assertEqual(self.read_pages('limit=3&sort=category&category=Work'), ['Ada', 'Cy', 'Eve', 'Gus'])
+        self.assertEqual(self.read_pages('limit=3&category=Nobody'), [])
+
+    def test_last_full_page_has_no_next_cursor(self):
+        page = self.app.get('/contacts?limit=7&sort=name').get_json()
+        self.assertEqual(len(page['contacts']), 7)
+        self.assertIsNone(page['next_cursor'])
+
+    def test_contacts_added_before_the_cursor_do_not_shift_pages(self):
+        first = self.app.get('/contacts?limit=3&sort=name').get_json()
+        self.add_contact('Aaron', 'Test')
+        second = self.app.get(f"/contacts?limit=3&sort=name&cursor={first['next_cursor']}").get_json()
+        self.assertEqual([contact['first_name'] for contact in second['contacts']], ['Dee', 'Eve', 'Fay'])
+
+    def test_limit_is_clamped(self):
+        page = self.app.get('/contacts?limit=0&sort=name').get_json()
+        self.assertEqual([contact['first_name'] for contact in page['contacts']], ['Ada'])
+        self.assertIsNotNone(page['next_cursor'])
+
+    def test_invalid_arguments_are_rejected(self):
+        self.assertEqual(self.app.get('/contacts?limit=3&sort=phone').status_code, 400)
+        self.assertEqual(self.app.get('/contacts?limit=3&order=sideways').status_code, 400)
+        self.assertEqual(self.app.get('/contacts?limit=3&cursor=not-a-cursor').status_code, 400)
+
+    def test_cursor_from_another_sort_is_rejected(self):
+        cursor = self.app.get('/contacts?limit=3&sort=name').get_json()['next_cursor']
+        response = self.app.get(f'/contacts?limit=3&sort=category&cursor={cursor}')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.get_json())
+
+    def test_without_paging_arguments_the_full_list_is_returned(self):
+        contacts = self.app.get('/contacts').get_json()
+        self.assertIsInstance(contacts, list)
+        self.assertEqual(len(contacts), 7)
+
+
+class TestStarredValues(ContactAPITestCase):
+    def test_null_and_mixed_starred_values_are_all_paged(self):
+        for i, is_starred in enumerate((None, True, 0, None, 1, False, None, 'yes', None)):
+            self.add_contact(f'Name{i}', 'Test', is_starred=is_starred)
+        names, cursor = [], None
+        while True:
+            page = self.app.get('/contacts?limit=2' + (f'&cursor={cursor}' if cursor else '')).get_json()
+            names.extend(contact['first_name'] for contact in page['contacts'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(names, ['Name1', 'Name4', 'Name7', 'Name0', 'Name2', 'Name3', 'Name5', 'Name6', 'Name8'])
+        self.assertEqual({contact['is_starred'] for contact in self.app.get('/contacts').get_json()}, {True, False})
+
+    def test_update_stores_starred_as_0_or_1(self):
+        contact_id = self.add_contact('Ada', 'Lovelace', is_starred=True)
+        self.app.put(f'/contacts/{contact_id}', json={'first_name': 'Ada', 'last_name': 'Lovelace', 'is_starred': None})
+        self.assertEqual(self.app.put(f'/contacts/{contact_id}/star').get_json()['is_starred'], True)
+
+    def test_migration_normalises_existing_null_rows(self):
+        directory = tempfile.mkdtemp(prefix='contacts-starred-')
+        self.addCleanup(shutil.rmtree, directory)
+        db_file = os.path.join(directory, 'contacts.db')
+        with sqlite3.connect(db_file) as conn:
+            migrate(conn, MIGRATIONS[:6])
+            conn.executemany("INSERT INTO contacts (first_name, last_name, is_starred) VALUES (?, 'Test', ?)",
+                             [('Ada', None), ('Ben', 1), ('Cy', None), ('Dee', 0), ('Eve', 2)])
+        conn.close()
+
+        db = Database(db_file)
+        self.addCleanup(db.close)
+        names, cursor = [], None
+        while True:
+            contacts, cursor = db.get_contacts_page(1, cursor)
+            names.extend((contact.first_name, contact.is_starred) for contact in contacts)
+            if cursor is None:
+                break
+        self.assertEqual(names, [('Ben', 1), ('Eve', 1), ('Ada', 0), ('Cy', 0), ('Dee', 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from database import Database, ReadReplica
+
+
+def contact(first_name, last_name):
+    return {'first_name': first_name, 'last_name': last_name, 'phone_number': '', 'email': '', 'address': ''}
+
+
+class TestReadReplica(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='contacts-replica-')
+        self.addCleanup(shutil.rmtree, directory)
+        self.db_file = os.path.join(directory, 'contacts.db')
+        self.db = Database(self.db_file)
+        self.addCleanup(self.db.close)
+
+    def open_replica(self, **options):
+        replica = ReadReplica(self.db_file, **options)
+        self.addCleanup(replica.close)
+        return replica
+
+    def wait_for_generation(self, replica, generation, timeout=5):
+        deadline = time.monotonic() + timeout
+        while replica.generation == generation:
+            self.assertLess(time.monotonic(), deadline, "the replica did not pick up the commit")
+            time.sleep(0.01)
+
+    def test_reads_do_not_check_for_changes(self):
+        replica = self.open_replica(refresh_interval=60)
+        self.db.add_contact(contact('Ada', 'Lovelace'))
+        with mock.patch.object(replica, '_data_version', side_effect=AssertionError('checked on read')):
+            for _ in range(10):
+                self.assertEqual(len(replica.get_all_contacts()), 1)
+                self.assertEqual(replica.generation, 0)
+
+    def test_file_replica_sees_commits_and_bumps_the_generation_in_the_background(self):
+        replica = self.open_replica(refresh_interval=0.02)
+        self.db.add_contact(contact('Ada', 'Lovelace'))
+        # Reads go to the database file itself, so the commit is visible at once
+        self.assertEqual([c.first_name for c in replica.get_all_contacts()], ['Ada'])
+        self.wait_for_generation(replica, 0)
+        self.assertEqual(replica.pool_stats()['refreshes'], 1)
+
+    def test_memory_replica_is_refreshed_periodically(self):
+        replica = self.open_replica(in_memory=True, refresh_interval=0.02)
+        self.assertEqual(replica.get_all_contacts(), [])
+        generation = replica.generation
+        self.db.add_contact(contact('Ada', 'Lovelace'))
+        self.wait_for_generation(replica, generation)
+        self.assertEqual([c.first_name for c in replica.get_all_contacts()], ['Ada'])
+
+        # Without further commits the snapshot is not copied again
+        refreshes = replica.refreshes
+        time.sleep(0.1)
+        self.assertEqual(replica.refreshes, refreshes)
+
+    def test_sync_refreshes_only_after_a_commit(self):
+        replica = self.open_replica(in_memory=True, refresh_interval=60)
+        self.assertFalse(replica.sync())
+        self.db.add_contact(contact('Ada', 'Lovelace'))
+        self.assertEqual(replica.get_all_contacts(), [])
+        self.assertTrue(replica.sync())
+        self.assertEqual(len(replica.get_all_contacts()), 1)
+        self.assertFalse(replica.sync())
+
+    def test_replica_is_read_only(self):
+        replica = self.open_replica(refresh_interval=60)
+        with self.assertRaises(sqlite3.OperationalError):
+            replica.add_contact(contact('Ada', 'Lovelace'))
+        self.assertEqual(self.db.get_all_contacts(), [])
+
+    def test_close_stops_the_background_thread(self):
+        replica = ReadReplica(self.db_file, refresh_interval=60)
+        self.assertIn(replica._watcher, threading.enumerate())
+        started = time.monotonic()
+        replica.close()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertFalse(replica._watcher.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
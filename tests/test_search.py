@@ -0,0 +1,107 @@
+import unittest
+from unittest import mock
+
+from tests import ContactAPITestCase, address_book
+
+
+class TestContactSearch(ContactAPITestCase):
+    def setUp(self):
+        super().setUp()
+        if not address_book.db.fts_enabled:
+            self.skipTest('SQLite was built without FTS5')
+
+    def search(self, query, **args):
+        response = self.app.get('/contacts/search', query_string=dict(args, q=query))
+        self.assertEqual(response.status_code, 200)
+        return [(contact['first_name'], contact['last_name']) for contact in response.get_json()]
+
+    def test_word_prefix_matches_come_before_substring_matches(self):
+        self.add_contact('Ann', 'Blacksmith')
+        self.add_contact('Jo', 'Smith')
+        self.add_contact('Sam', 'Smithers')
+        # smi starts a word in Smith and Smithers but is inside Blacksmith
+        self.assertEqual(self.search('smi')[-1], ('Ann', 'Blacksmith'))
+        self.assertEqual(sorted(self.search('smi')[:2]), [('Jo', 'Smith'), ('Sam', 'Smithers')])
+        self.assertEqual(self.search('lacksmi'), [('Ann', 'Blacksmith')])
+
+    def test_name_matches_rank_above_other_fields(self):
+        self.add_contact('Ada', 'Byron', address='12 London Road', institution='London University')
+        self.add_contact('Jack', 'London')
+        self.add_contact('Mary', 'Shelley', category='London')
+        self.assertEqual(self.search('london'), [('Jack', 'London'), ('Mary', 'Shelley'), ('Ada', 'Byron')])
+
+    def test_starred_contacts_come_first(self):
+        self.add_contact('Jo', 'Smith')
+        self.add_contact('Ann', 'Blacksmith', is_starred=True)
+        self.assertEqual(self.search('smith'), [('Ann', 'Blacksmith'), ('Jo', 'Smith')])
+
+    def test_every_word_must_match(self):
+        self.add_contact('Ada', 'Lovelace')
+        self.add_contact('Ada', 'Byron')
+        self.add_contact('Byron', 'Lovelace')
+        self.assertEqual(self.search('ada love'), [('Ada', 'Lovelace')])
+        self.assertEqual(self.search('  Lovelace   BYRON '), [('Byron', 'Lovelace')])
+
+    def test_substrings_of_phone_numbers_and_emails(self):
+        self.add_contact('Ada', 'Lovelace', phone_number='+44 20 7946 0101', email='ada@analytical.example')
+        self.add_contact('Alan', 'Turing', phone_number='+44 161 496 0102', email='alan@bletchley.example')
+        self.assertEqual(self.search('946'), [('Ada', 'Lovelace')])
+        self.assertEqual(self.search('0101'), [('Ada', 'Lovelace')])
+        self.assertEqual(self.search('nalytic'), [('Ada', 'Lovelace')])
+        self.assertEqual(sorted(self.search('example')), [('Ada', 'Lovelace'), ('Alan', 'Turing')])
+
+    def test_short_terms_only_match_word_prefixes(self):
+        # Trigrams need three characters, so ce finds no contact by substring
+        self.add_contact('Ada', 'Lovelace')
+        self.assertEqual(self.search('ce'), [])
+        self.assertEqual(self.search('lo'), [('Ada', 'Lovelace')])
+
+    def test_accents_and_quotes(self):
+        self.add_contact('Zoë', "O'Brien")
+        self.add_contact('Ann', 'Say "Hi"')
+        self.assertEqual(self.search('zoe'), [('Zoë', "O'Brien")])
+        self.assertEqual(self.search('"hi"'), [('Ann', 'Say "Hi"')])
+        self.assertEqual(self.search('AND OR NOT ('), [])
+
+    def test_index_follows_writes(self):
+        ada = self.add_contact('Ada', 'Lovelace')
+        self.app.put(f'/contacts/{ada}', json={'first_name': 'Ada', 'last_name': 'King'})
+        self.assertEqual(self.search('lovelace'), [])
+        self.assertEqual(self.search('king'), [('Ada', 'King')])
+        self.app.delete(f'/contacts/{ada}')
+        self.assertEqual(self.search('king'), [])
+
+    def test_limit(self):
+        for i in range(5):
+            self.add_contact(f'Name{i}', 'Smith')
+        self.assertEqual(len(self.search('smith', limit=3)), 3)
+        self.assertEqual(len(self.search('smith', limit=0)), 1)
+        self.assertEqual(self.search(''), [])
+
+
+class TestLikeSearch(ContactAPITestCase):
+    """
+    The search used when SQLite has no FTS5: a substring match in any field.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(address_book.db.db, 'fts_enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def search(self, query, limit=None):
+        return [contact.first_name for contact in address_book.db.search_contacts(query, limit)]
+
+    def test_substring_of_any_field(self):
+        self.add_contact('Ada', 'Lovelace', email='ada@analytical.example')
+        self.add_contact('Alan', 'Turing', is_starred=True)
+        self.assertEqual(self.search('ce'), ['Ada'])
+        self.assertEqual(self.search('nalytic'), ['Ada'])
+        self.assertEqual(self.search('a'), ['Alan', 'Ada'])
+        self.assertEqual(self.search('a', limit=1), ['Alan'])
+        self.assertEqual(self.search('   '), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import json
+import unittest
+
+from database import RECORD_FIELDS, ContactRecord
+from serialization import contact_json, contacts_json
+from tests import ContactAPITestCase
+
+
+class TestContactSerialization(unittest.TestCase):
+    def test_record_matches_sorted_dict_encoding(self):
+        record = ContactRecord(7, 'Zoë', 'O"Brien', 'Work', '+1 555', 'zoe@example.com', 'Line 1\nLine 2', '大学', 1)
+        expected = dict(zip(RECORD_FIELDS, record), is_starred=True)
+        self.assertEqual(contact_json(record), json.dumps(expected, sort_keys=True, separators=(',', ':')))
+
+    def test_null_and_non_text_columns(self):
+        record = ContactRecord(3, 'Ada', 'Lovelace', None, 5550101, None, '', None, 0)
+        self.assertEqual(json.loads(contact_json(record)),
+                         {'id': 3, 'first_name': 'Ada', 'last_name': 'Lovelace', 'category': None,
+                          'phone_number': 5550101, 'email': None, 'address': '', 'institution': None,
+                          'is_starred': False})
+
+    def test_list_encoding(self):
+        records = [ContactRecord(i, f'N{i}', 'L', '', '', '', '', '', i % 2) for i in range(3)]
+        self.assertEqual(json.loads(contacts_json(records)), [json.loads(contact_json(r)) for r in records])
+        self.assertEqual(contacts_json([]), '[]')
+
+
+class TestContactResponses(ContactAPITestCase):
+    def test_api_returns_every_field_once(self):
+        contact_id = self.add_contact('Ada', 'Lovelace', category='Work', phone_number='555', email='ada@example.com',
+                                      address='London', institution='Analytical', is_starred=True)
+        contacts = self.app.get('/contacts').get_json()
+        self.assertEqual(contacts, [{'id': contact_id, 'first_name': 'Ada', 'last_name': 'Lovelace',
+                                     'category': 'Work', 'phone_number': '555', 'email': 'ada@example.com',
+                                     'address': 'London', 'institution': 'Analytical', 'is_starred': True}])
+        self.assertEqual(self.app.get(f'/contacts/{contact_id}').get_json(), contacts[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from database import Database
+from memory_storage import MemoryDatabase
+from storage import StorageBackend, open_storage
+
+
+def contact(first_name, last_name, **fields):
+    return dict({'category': '', 'phone_number': '', 'email': '', 'address': '', 'institution': '',
+                 'is_starred': False}, **fields, first_name=first_name, last_name=last_name)
+
+
+def row(first_name, last_name, category='', phone_number='', email='', is_starred=0):
+    return (first_name, last_name, category, phone_number, email, '', '', is_starred)
+
+
+class TestMemoryBackendParity(unittest.TestCase):
+    """
+    Runs the same calls against Database and MemoryDatabase and expects the
+    same results, apart from search ranking within a tier.
+    """
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='contacts-storage-')
+        self.addCleanup(shutil.rmtree, directory)
+        self.db_file = os.path.join(directory, 'contacts.db')
+        self.sqlite = Database(self.db_file)
+        self.addCleanup(self.sqlite.close)
+        self.memory = MemoryDatabase()
+        self.backends = (self.sqlite, self.memory)
+
+    def both(self, method, *args):
+        """
+        Call a method on both backends and return the SQLite result after
+        checking that the memory backend returned the same.
+        """
+        expected, actual = (getattr(backend, method)(*args) for backend in self.backends)
+        self.assertEqual(actual, expected, f"{method}{args}")
+        return expected
+
+    def populate(self):
+        self.both('add_contact', contact('Ada', 'Lovelace', category='Work', phone_number='+44 20 7946 0101',
+                                         email='ada@example.com', is_starred=True))
+        self.both('add_contact', contact('Alan', 'Turing', category='Work', phone_number='0161 496 0102'))
+        self.both('add_contact', contact('Grace', 'Hopper', category='Navy', email='grace@example.com'))
+        self.both('bulk_add_rows', [row(f'Name{i}', 'Test', category=('Work', 'Club', '')[i % 3], is_starred=i % 4 == 0)
+                                    for i in range(12)])
+        self.both('bulk_add_contacts', [contact('Linus', 'Torvalds'), contact('Ada', 'Lovelace')])
+
+    def assertSameReads(self):
+        self.both('get_all_contacts')
+        self.both('get_facets')
+        self.both('get_change_seq')
+        self.both('get_changes', 0, 500)
+        self.both('get_changes', 3, 4)
+        for contact_id in (1, 2, 5, 999):
+            self.both('get_contact', contact_id)
+        for sort in ('starred', 'name', 'category'):
+            for order in ('asc', 'desc'):
+                for category in (None, 'Work', ''):
+                    cursor = None
+                    while True:
+                        contacts, cursor = self.both('get_contacts_page', 4, cursor, sort, order, category)
+                        if cursor is None:
+                            break
+        self.assertEqual([list(map(tuple, batch)) for batch in self.memory.iter_contact_batches(5)],
+                         [list(map(tuple, batch)) for batch in self.sqlite.iter_contact_batches(5)])
+
+    def assertSameSearch(self, *queries):
+        for query in queries:
+            expected, actual = (backend.search_contacts(query) for backend in self.backends)
+            self.assertEqual(sorted(actual), sorted(expected), query)
+            # Starred contacts come first in both
+            self.assertEqual([c.is_starred for c in actual], [c.is_starred for c in expected], query)
+
+    def test_backends_implement_the_protocol(self):
+        for backend in self.backends:
+            self.assertIsInstance(backend, StorageBackend)
+
+    def test_reads_after_adds(self):
+        self.populate()
+        self.assertSameReads()
+
+    def test_reads_after_updates_deletes_and_stars(self):
+        self.populate()
+        self.both('update_contact', 'Alan', 'Turing', contact('Alan', 'M Turing', category='Club'))
+        self.both('update_contact_by_id', 3, contact('Grace', 'Hopper', category='Work', is_starred=True))
+        self.both('update_contact_by_id', 999, contact('No', 'One'))
+        self.both('delete_contact', 'Name3', 'Test')
+        self.both('delete_contact_by_id', 6)
+        self.both('delete_contact_by_id', 999)
+        self.both('toggle_starred', 'Ada', 'Lovelace')
+        self.both('toggle_starred_by_id', 4)
+        self.both('toggle_starred_by_id', 999)
+        self.assertSameReads()
+
+    def test_name_conflicts_raise_in_both(self):
+        self.populate()
+        for backend in self.backends:
+            with self.assertRaises(sqlite3.IntegrityError):
+                backend.update_contact('Alan', 'Turing', contact('Ada', 'Lovelace'))
+        self.assertSameReads()
+
+    def test_batch_results_and_effects(self):
+        self.populate()
+        self.both('apply_batch', [
+            {'op': 'add', 'contact': contact('Tim', 'Berners-Lee')},
+            {'op': 'add', 'contact': contact('Ada', 'Lovelace')},
+            {'op': 'update', 'id': 2, 'contact': contact('Grace', 'Hopper')},
+            {'op': 'update', 'first_name': 'Linus', 'last_name': 'Torvalds', 'contact': contact('Linus', 'T')},
+            {'op': 'star', 'id': 2},
+            {'op': 'star', 'id': 2, 'is_starred': True},
+            {'op': 'delete', 'id': 1},
+            {'op': 'delete', 'id': 1},
+            {'op': 'nothing'},
+        ])
+        self.assertSameReads()
+
+    def test_merge_import(self):
+        self.populate()
+        self.both('bulk_merge_rows', [
+            row('Ada', 'Lovelace', category='Family', email='other@example.com'),
+            row('Adah', 'Lovelace', phone_number='+442079460101'),
+            row('Grace', 'Hoper', email='GRACE@example.com', phone_number='555 0100'),
+            row('Margaret', 'Hamilton'),
+            row('Margaret', 'Hamilton', category='NASA'),
+        ])
+        self.assertSameReads()
+
+    def test_search_finds_the_same_contacts(self):
+        self.populate()
+        self.assertSameSearch('ada', 'lovelace ada', 'work', 'name1', 'test', 'est', '946', 'example',
+                              'xample.co', 'zz', 'o', '')
+
+    def test_duplicates_and_matches(self):
+        self.populate()
+        self.both('bulk_add_rows', [row('Adah', 'Lovelace', phone_number='44 20 7946 0101'),
+                                    row('Alan', 'Turing', category='Club'),
+                                    row('G', 'Hopper', email='Grace@Example.com')])
+        groups, total = self.both('find_duplicates', 100)
+        self.assertGreater(total, 0)
+        self.both('find_duplicates', 1)
+        self.both('find_matches', contact('Ada', 'Lovelace'))
+        self.both('find_matches', contact('Ada', 'Lovelase', phone_number='020 7946 0101'))
+        self.both('find_matches', contact('Nobody', 'Known', email='nobody@example.com'))
+
+    def test_generation_follows_changing_writes_only(self):
+        self.populate()
+        generations = [backend.generation for backend in self.backends]
+        for backend in self.backends:
+            backend.update_contact_by_id(999, contact('No', 'One'))
+            backend.bulk_add_rows([row('Ada', 'Lovelace')])
+        self.assertEqual([backend.generation for backend in self.backends], generations)
+        for backend in self.backends:
+            backend.toggle_starred_by_id(1)
+        self.assertEqual([backend.generation - generation for backend, generation in zip(self.backends, generations)],
+                         [1, 1])
+
+
+class TestOpenStorage(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='contacts-storage-')
+        self.addCleanup(shutil.rmtree, directory)
+        self.db_file = os.path.join(directory, 'contacts.db')
+
+    def test_memory_backend_starts_from_a_copy_of_the_database(self):
+        db = open_storage('sqlite', self.db_file)
+        db.add_contact(contact('Ada', 'Lovelace', is_starred=True))
+        db.add_contact(contact('Alan', 'Turing'))
+        expected = db.get_all_contacts()
+
+        memory = open_storage('memory', self.db_file)
+        self.assertEqual(memory.get_all_contacts(), expected)
+        memory.add_contact(contact('Grace', 'Hopper'))
+        memory.delete_contact_by_id(expected[0].id)
+        # The file is never written to
+        self.assertEqual(db.get_all_contacts(), expected)
+        db.close()
+
+    def test_memory_backend_without_a_database(self):
+        self.assertEqual(open_storage('memory', self.db_file).get_all_contacts(), [])
+        self.assertFalse(os.path.exists(self.db_file))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            open_storage('redis', self.db_file)
+
+
+if __name__ == '__main__':
+    unittest.main()